@@ -0,0 +1,284 @@
+# run_benchmarks.py
+
+
+""" Scaling benchmarks for the public entry points in zt_calc_workflow.
+
+For each dataset size, synthetic AMSET and Phono3py CSV files are generated
+and the readers, zt_dataset_from_data(), dataset_to_2d(), get_zt_max() and
+match_data() in each of its four modes are timed. Timings are taken with
+profiling enabled but without memory tracing, and peak memory is measured in
+a second pass with tracemalloc, so the two do not interfere. The memory used
+by the ZT dataset in each of the memory modes in compact.py, and the maximum
+relative error in ZT compared to the full-precision dataset, are also
+measured.
+
+Results are written to a JSON file together with the exponent of a power-law
+fit of time against number of rows for each stage. If a baseline JSON file
+from a previous run is given with --baseline, stages that have slowed down by
+more than --threshold are flagged and the script exits with a non-zero status.
+
+Example:
+
+    python run_benchmarks.py --rows 1e3 1e4 1e5 --output results.json
+    python run_benchmarks.py --rows 1e3 1e4 1e5 --baseline results.json
+"""
+
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+from zt_calc_workflow.amset import read_amset_csv
+from zt_calc_workflow.analysis import get_zt_max, match_data
+from zt_calc_workflow.compact import memory_usage
+from zt_calc_workflow.dataset import zt_dataset_from_data, dataset_to_2d
+from zt_calc_workflow.phono3py import read_phono3py_kappa_csv
+from zt_calc_workflow.profiling import (
+    enable_profiling, disable_profiling, get_profile_report,
+    reset_profile_report, profile_block)
+
+from synthetic_data import (
+    write_synthetic_amset_csv, write_synthetic_phono3py_kappa_csv)
+
+
+_MATCH_MODES = ['same', 'same_t', 'same_n', 'best_match']
+
+_MEMORY_MODES = ['full', 'compact', 'minimal']
+
+
+def run_workflow(amset_file, kappa_file, num_match=5):
+    """ Run each public entry point once on the input files. """
+
+    with profile_block('read_amset_csv'):
+        amset_data = read_amset_csv(amset_file)
+
+    with profile_block('read_phono3py_kappa_csv'):
+        kappa_data = read_phono3py_kappa_csv(kappa_file)
+
+    with profile_block('zt_dataset_from_data'):
+        zt_data = zt_dataset_from_data(amset_data, kappa_data)
+
+    with profile_block('dataset_to_2d'):
+        n, t, data_2d = dataset_to_2d(zt_data)
+
+    with profile_block('get_zt_max'):
+        get_zt_max(zt_data)
+
+    # Points to match are taken from the dataset, so every mode has an exact
+    # solution.
+
+    idx_n = np.linspace(0, len(n) - 1, num_match + 2).astype(int)[1:-1]
+    idx_t = np.linspace(0, len(t) - 1, num_match + 2).astype(int)[1:-1]
+
+    to_match = [(n[i], t[j], data_2d['s_ave'][i, j])
+                    for i, j in zip(idx_n, idx_t)]
+
+    for mode in _MATCH_MODES:
+        with profile_block('match_data[{0}]'.format(mode)):
+            match_data(n, t, data_2d['s_ave'], to_match, mode=mode)
+
+def measure_memory_modes(amset_file, kappa_file):
+    """ Measure the memory used by the ZT dataset in each memory mode and the
+    maximum relative error in ZT compared to the full-precision dataset, and
+    return a dictionary of {mode: {'memory', 'max_zt_rel_error'}}. """
+
+    res = {}
+
+    zt_ref = None
+
+    for mode in _MEMORY_MODES:
+        zt_data = zt_dataset_from_data(
+            read_amset_csv(amset_file, memory_mode=mode),
+            read_phono3py_kappa_csv(kappa_file, memory_mode=mode))
+
+        zt = zt_data['zt_ave'].to_numpy(dtype=np.float64)
+
+        if zt_ref is None:
+            zt_ref = zt
+
+        res[mode] = {
+            'memory': memory_usage(zt_data),
+            'max_zt_rel_error': float(
+                np.max(np.abs(zt - zt_ref) / np.abs(zt_ref)))}
+
+    return res
+
+def benchmark_size(num_n, num_t, work_dir, repeat=1):
+    """ Benchmark the workflow on a num_n x num_t dataset and return a tuple
+    of ({stage: {'time', 'peak_memory'}}, memory modes) with the memory modes
+    from measure_memory_modes(). """
+
+    amset_file = os.path.join(work_dir, 'amset.csv')
+    kappa_file = os.path.join(work_dir, 'kappa.csv')
+
+    write_synthetic_amset_csv(amset_file, num_n, num_t)
+    write_synthetic_phono3py_kappa_csv(kappa_file, num_t)
+
+    stages = {}
+
+    # Timing pass(es): take the best of repeat runs.
+
+    for _ in range(repeat):
+        reset_profile_report()
+        enable_profiling(trace_memory=False)
+
+        try:
+            run_workflow(amset_file, kappa_file)
+        finally:
+            disable_profiling()
+
+        for k, rec in get_profile_report().items():
+            if '.' in k:
+                continue
+
+            t = stages.setdefault(k, {}).get('time')
+            stages[k]['time'] = (rec['wall_time'] if t is None
+                                     else min(t, rec['wall_time']))
+
+    # Memory pass.
+
+    reset_profile_report()
+    enable_profiling(trace_memory=True)
+
+    try:
+        run_workflow(amset_file, kappa_file)
+    finally:
+        disable_profiling()
+
+    for k, rec in get_profile_report().items():
+        if '.' not in k:
+            stages[k]['peak_memory'] = rec['peak_memory']
+
+    reset_profile_report()
+
+    return (stages, measure_memory_modes(amset_file, kappa_file))
+
+def fit_scaling(results):
+    """ Fit time = a * rows^b for each stage and return {stage: b}. """
+
+    exponents = {}
+
+    stages = results[0]['stages'].keys() if len(results) > 0 else []
+
+    for k in stages:
+        rows = np.array([r['rows'] for r in results], dtype=np.float64)
+        times = np.array([r['stages'][k]['time'] for r in results],
+                         dtype=np.float64)
+
+        mask = times > 0.
+
+        if mask.sum() >= 2:
+            exponents[k] = float(
+                np.polyfit(np.log(rows[mask]), np.log(times[mask]), 1)[0])
+
+    return exponents
+
+def compare_baseline(results, baseline, threshold):
+    """ Compare results to a baseline and return a list of (rows, stage,
+    time, baseline time) for stages slower by more than threshold. """
+
+    baseline_times = {
+        (r['num_n'], r['num_t'], k): v['time']
+            for r in baseline['results'] for k, v in r['stages'].items()}
+
+    slowdowns = []
+
+    for r in results:
+        for k, v in r['stages'].items():
+            t_base = baseline_times.get((r['num_n'], r['num_t'], k))
+
+            if t_base is not None and v['time'] > threshold * t_base:
+                slowdowns.append((r['rows'], k, v['time'], t_base))
+
+    return slowdowns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Scaling benchmarks for zt_calc_workflow.")
+
+    parser.add_argument('--rows', type=float, nargs='+',
+                        default=[1.e3, 1.e4, 1.e5],
+                        help="Approximate dataset sizes (n x T rows).")
+
+    parser.add_argument('--num-t', type=int, default=41,
+                        help="Number of temperatures in each dataset.")
+
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Number of timing runs (best is reported).")
+
+    parser.add_argument('--output', default="benchmark_results.json",
+                        help="JSON file to write results to.")
+
+    parser.add_argument('--baseline', default=None,
+                        help="JSON file from a previous run to compare to.")
+
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="Flag stages slower than the baseline by more "
+                             "than this factor.")
+
+    args = parser.parse_args()
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for rows in args.rows:
+            num_t = min(args.num_t, int(rows))
+            num_n = max(int(round(rows / num_t)), 2)
+
+            print("Benchmarking {0} x {1} = {2} rows ...".format(
+                num_n, num_t, num_n * num_t))
+
+            stages, memory_modes = benchmark_size(num_n, num_t, work_dir,
+                                                  repeat=args.repeat)
+
+            results.append({'num_n': num_n, 'num_t': num_t,
+                            'rows': num_n * num_t, 'stages': stages,
+                            'memory_modes': memory_modes})
+
+            for k, v in stages.items():
+                print("  {0: <25} {1: >10.4f} s {2: >12} B".format(
+                    k, v['time'], v['peak_memory']))
+
+            mem_full = memory_modes['full']['memory']
+
+            for k, v in memory_modes.items():
+                print("  memory_mode[{0}]{1} {2: >12} B ({3:.2f}x, max. "
+                      "ZT rel. error {4:.2e})".format(
+                          k, ' ' * (12 - len(k)), v['memory'],
+                          v['memory'] / mem_full, v['max_zt_rel_error']))
+
+    exponents = fit_scaling(results)
+
+    print("")
+    print("Scaling exponents (time ~ rows^b):")
+
+    for k, b in exponents.items():
+        print("  {0: <25} {1: >6.2f}".format(k, b))
+
+    with open(args.output, 'w') as f:
+        json.dump({'results': results, 'scaling_exponents': exponents}, f,
+                  indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+        slowdowns = compare_baseline(results, baseline, args.threshold)
+
+        print("")
+
+        if len(slowdowns) == 0:
+            print("No slowdowns relative to baseline.")
+        else:
+            print("Slowdowns relative to baseline:")
+
+            for rows, k, t, t_base in slowdowns:
+                print("  {0: >10} rows {1: <25} {2: >10.4f} s vs. {3: >10.4f} "
+                      "s ({4:.2f}x)".format(rows, k, t, t_base, t / t_base))
+
+            sys.exit(1)
@@ -0,0 +1,155 @@
+# synthetic_data.py
+
+
+""" Generators for synthetic AMSET and Phono3py CSV files of configurable
+size for benchmarking.
+
+The data are generated from simple analytical models (a non-degenerate Seebeck
+coefficient, a T^-3/2 mobility, the Wiedemann-Franz law for \\kappa_el and a
+1/T \\kappa_latt) so that the files have the same layout as real outputs and
+physically plausible values, which keeps analysis routines such as
+match_data() well behaved.
+"""
+
+
+import numpy as np
+import pandas as pd
+
+
+# Column headers in the order written by Joe's AMSET code. The mobility
+# decomposition columns are repeated four times (x, y, z, ave).
+
+AMSET_HEADERS = (
+    ['Carrier Concentration', 'Temperature']
+    + ['Conducitivty {0}'.format(c) for c in ('x', 'y', 'z', 'ave')]
+    + ['Seebeck {0}'.format(c) for c in ('x', 'y', 'z', 'ave')]
+    + ['Kele {0}'.format(c) for c in ('x', 'y', 'z', 'ave')]
+    + ['Mobility {0}'.format(c) for c in ('x', 'y', 'z', 'ave')]
+    + ['PF {0}'.format(c) for c in ('x', 'y', 'z', 'ave')]
+    + [k for k in ('ADP', 'IMP', 'PIE', 'POP') for _ in range(4)])
+
+PHONO3PY_KAPPA_HEADERS = [
+    'T [K]', 'k_xx [W/m.K]', 'k_yy [W/m.K]', 'k_zz [W/m.K]', 'k_yz [W/m.K]',
+    'k_xz [W/m.K]', 'k_xy [W/m.K]', 'k_iso [W/m.K]']
+
+# Anisotropy factors applied to the x, y and z components.
+
+_ANISOTROPY = np.array([0.6, 1.4, 1.0])
+
+
+def synthetic_grid(num_n, num_t, n_min=1.e16, n_max=1.e21, t_min=200.,
+                   t_max=1000.):
+    """ Return a log-spaced set of num_n carrier concentrations and a
+    uniformly-spaced set of num_t temperatures. """
+
+    n = np.logspace(np.log10(n_min), np.log10(n_max), num_n)
+
+    # Round temperatures to 0.1 K so they survive a round-trip through CSV.
+
+    t = np.round(np.linspace(t_min, t_max, num_t), 1)
+
+    return n, t
+
+def synthetic_amset_data(num_n, num_t, carrier_type='p', seed=0):
+    """ Generate a synthetic AMSET dataset with num_n x num_t rows as a Pandas
+    DataFrame with the AMSET CSV column layout. """
+
+    rng = np.random.default_rng(seed)
+
+    n, t = synthetic_grid(num_n, num_t)
+
+    n_2d, t_2d = np.meshgrid(n, t, indexing='ij')
+
+    n_2d, t_2d = n_2d.ravel(), t_2d.ravel()
+
+    sign = 1. if carrier_type == 'p' else -1.
+
+    # Mobility (cm^2/V.s) with a T^-3/2 dependence and impurity scattering at
+    # high n.
+
+    mu = 250. * (300. / t_2d) ** 1.5 / (1. + (n_2d / 1.e20) ** 0.5)
+
+    # Non-degenerate Seebeck coefficient (uV/K) with N_eff = 2.5e19 (T/300)^1.5
+    # cm^-3, limited to 10 uV/K for degenerate doping.
+
+    n_eff = 2.5e19 * (t_2d / 300.) ** 1.5
+
+    s = 86.17 * (np.log(n_eff / n_2d) + 2.)
+    s = sign * np.maximum(s, 10.)
+
+    # Electrical conductivity (S/m), \kappa_el (W/m.K) and PF (uW/cm.K^2).
+
+    cols = {'Carrier Concentration': n_2d, 'Temperature': t_2d}
+
+    sigma, kappa_el = [], []
+
+    for f in _ANISOTROPY:
+        sigma.append(1.602176634e-19 * (n_2d * 1.e6) * (f * mu * 1.e-4))
+        kappa_el.append(2.44e-8 * sigma[-1] * t_2d)
+
+    sigma.append(np.mean(sigma, axis=0))
+    kappa_el.append(np.mean(kappa_el, axis=0))
+
+    seebeck = [s * (1. + 0.05 * (f - 1.)) for f in _ANISOTROPY]
+    seebeck.append(np.mean(seebeck, axis=0))
+
+    mobility = [f * mu for f in _ANISOTROPY] + [mu]
+
+    for label, vals in [('Conducitivty', sigma), ('Seebeck', seebeck),
+                        ('Kele', kappa_el), ('Mobility', mobility)]:
+        for c, v in zip(('x', 'y', 'z', 'ave'), vals):
+            cols['{0} {1}'.format(label, c)] = v
+
+    for c, v_s, v_sigma in zip(('x', 'y', 'z', 'ave'), seebeck, sigma):
+        cols['PF {0}'.format(c)] = 1.e-2 * (1.e-6 * v_s) ** 2 * v_sigma * 1.e6
+
+    # Mobility decomposition with some noise.
+
+    data = pd.DataFrame(cols)
+
+    decomp = []
+
+    for _ in ('ADP', 'IMP', 'PIE', 'POP'):
+        for m in mobility:
+            decomp.append(m * rng.uniform(2., 20., size=m.shape))
+
+    return pd.concat(
+        [data, pd.DataFrame(np.array(decomp).T)], axis=1, ignore_index=True)
+
+def synthetic_phono3py_kappa_data(t):
+    """ Generate a synthetic Phono3py kappa dataset covering the temperatures
+    t (plus T = 0) as a Pandas DataFrame with the phono3py-get-kappa CSV
+    column layout. """
+
+    t = np.concatenate([[0.], np.asarray(t, dtype=np.float64)])
+
+    with np.errstate(divide='ignore'):
+        k = np.where(t > 0., 300. / t, 0.)
+
+    k_xx, k_yy, k_zz = (f * k for f in (1.2, 0.5, 0.8))
+
+    zeros = np.zeros_like(t)
+
+    return pd.DataFrame(
+        np.array([t, k_xx, k_yy, k_zz, zeros, zeros, zeros,
+                  (k_xx + k_yy + k_zz) / 3.]).T,
+        columns=PHONO3PY_KAPPA_HEADERS)
+
+def write_synthetic_amset_csv(file_path, num_n, num_t, carrier_type='p',
+                              seed=0):
+    """ Write a synthetic AMSET CSV file with num_n x num_t rows. """
+
+    data = synthetic_amset_data(num_n, num_t, carrier_type=carrier_type,
+                                seed=seed)
+
+    with open(file_path, 'w') as f:
+        f.write(','.join(AMSET_HEADERS) + '\n')
+        data.to_csv(f, header=False, index=False)
+
+def write_synthetic_phono3py_kappa_csv(file_path, num_t):
+    """ Write a synthetic Phono3py kappa CSV file covering the temperatures in
+    a synthetic AMSET dataset with num_t temperatures. """
+
+    _, t = synthetic_grid(1, num_t)
+
+    synthetic_phono3py_kappa_data(t).to_csv(file_path, index=False)
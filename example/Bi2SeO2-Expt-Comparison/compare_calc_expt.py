@@ -23,25 +23,34 @@ WebPlotDigitizer (https://automeris.io/).
 """
 
 
-import csv
-
-import numpy as np
-
 import sys ; sys.path.append(r"/mnt/d/Repositories/ZT-Calc-Workflow")
 
 from zt_calc_workflow.amset import read_amset_csv
-from zt_calc_workflow.analysis import match_data
 from zt_calc_workflow.dataset import dataset_to_2d
+from zt_calc_workflow.experiment import load_expt_data, match_expt_data
 
 
-def read_expt_data_csv(file_path):
-    """ Read experimental data from a two-column CSV file. """
+def print_comparison(header, res):
+    """ Print a comparison table for the rows in res returned by
+    match_expt_data(). """
+
+    print(header)
+    print('-' * len(header))
+    print("")
     
-    with open(file_path, 'r') as f:
-        f_csv = csv.reader(f)
-        
-        return np.array(
-            [[float(val) for val in r] for r in f_csv], dtype=np.float64)
+    print("{0: <10} | {1: <10} | {2: <10} | {3: <10} | {4: <10} | "
+          "{5: <10} | {6: <10}".format("n", "T", "Expt.", "n", "T",
+                                       "Calc.", "Diff."))
+    
+    print('-' * (7 * 10 + 6 * 3))
+    
+    for r in res.itertuples():
+        print(
+            "{0: >10.2e} | {1: >10.0f} | {2: >10.2f} | {3: >10.2e} | "
+            "{4: >10.0f} | {5: >10.2f} | {6: >10.2e}".format(
+               r.n, r.t, r.val, r.calc_n, r.calc_t, r.calc_val, r.diff))
+    
+    print("")
 
 
 if __name__ == "__main__":
@@ -55,58 +64,38 @@ if __name__ == "__main__":
     expt_n = {'S1': 1.0e18, 'S2': 6.8e18, 'S3': 1.3e19, 'S4': 2.2e19, 
               'S5': 8.7e19}
     
-    # Load experimental data.
+    # Load experimental data. The conductivity data are resistivities in
+    # Ohm cm, which are converted to sigma = 1 / rho in S/cm.
     
-    expt_data = {}
+    specs = []
     
     for s in "S1", "S2", "S3", "S4", "S5":
-        expt_sigma = read_expt_data_csv(r"5.0063091-2a_{0}.csv".format(s))
-        
-        # Resistivity data -> sigma = 1 / rho.
-        
-        expt_sigma = np.array([[t, 1. / rho] for t, rho in expt_sigma],
-                              dtype=np.float64)
-        
-        expt_s = read_expt_data_csv(r"5.0063091-2b_{0}.csv".format(s))
+        specs.append(
+            {'file': r"5.0063091-2a_{0}.csv".format(s), 'sample': s,
+             'property': 'sigma', 'n': expt_n[s],
+             'transform': 'rho_ohm_cm_to_sigma_s_cm'})
         
-        expt_data[s] = {'sigma': expt_sigma, 's': expt_s}
+        specs.append(
+            {'file': r"5.0063091-2b_{0}.csv".format(s), 'sample': s,
+             'property': 's', 'n': expt_n[s]})
     
-    # Match sigma and S for each of the five samples and print results.
+    expt_data = load_expt_data(specs)
     
-    for expt_k, calc_k in('sigma', 'sigma_ave'), ('s', 's_ave'):
-        for s in "S1", "S2", "S3", "S4", "S5":
-            # List of (n, t, val) to match to.
-            
-            match_to = [(expt_n[s], t, v) for t, v in expt_data[s][expt_k]]
-        
-            # Match to calculated data. Using mode='same_t' will return the
-            # calculated n that best match the experimental data at the
-            # measurement T.
-        
-            res = match_data(calc_n, calc_t, calc_data_2d[calc_k],
-                             match_to, mode='same_t', num_seeds=5)
-        
-            # Print results.
-        
-            header = "Sample: '{0}', Data: '{1}'".format(s, expt_k)
+    # Match sigma and S for all five samples and print results. Using
+    # mode='same_t' will return the calculated n that best match the
+    # experimental data at the measurement T.
+    
+    # cache_key identifies the calculated data, so that the interpolants
+    # are reused by the calls to match_expt_data() below.
 
-            print(header)
-            print('-' * len(header))
-            print("")
-            
-            print("{0: <10} | {1: <10} | {2: <10} | {3: <10} | {4: <10} | "
-                  "{5: <10} | {6: <10}".format("n", "T", "Expt.", "n", "T",
-                                               "Calc.", "Diff."))
-            
-            print('-' * (7 * 10 + 6 * 3))
-            
-            for (e_n, e_t, e_v), (c_n, c_t, c_v) in zip(match_to, res):
-                print(
-                    "{0: >10.2e} | {1: >10.0f} | {2: >10.2f} | {3: >10.2e} | "
-                    "{4: >10.0f} | {5: >10.2f} | {6: >10.2e}".format(
-                       e_n, e_t, e_v, c_n, c_t, c_v, c_v - e_v))
-            
-            print("")
+    res = match_expt_data(calc_n, calc_t, calc_data_2d, expt_data,
+                          mode='same_t', num_seeds=5, cache_key='Bi2SeO2-n')
+    
+    for expt_k in 'sigma', 's':
+        for s in "S1", "S2", "S3", "S4", "S5":
+            print_comparison(
+                "Sample: '{0}', Data: '{1}'".format(s, expt_k),
+                res[(res['sample'] == s) & (res['property'] == expt_k)])
     
     print("")
     
@@ -114,37 +103,22 @@ if __name__ == "__main__":
     
     s = "S3"
     
-    for expt_k, calc_k in ('sigma', 'sigma_ave'), ('s', 's_ave'):
+    expt_data_s = expt_data[expt_data['sample'] == s]
+    
+    for expt_k in 'sigma', 's':
         for mode in 'same', 'same_t', 'same_n', 'best_match':
-            match_to = [(expt_n[s], t, v) for t, v in expt_data[s][expt_k]]
-            
             # num_seeds gives dubious results with mode = 'best_match' (and
             # will issue a RuntimeWarning to this effect).
             
             num_seeds = 1 if mode == 'best_match' else 5
             
-            res = match_data(calc_n, calc_t, calc_data_2d[calc_k],
-                             match_to, mode=mode, num_seeds=num_seeds)
-            
-            header = ("Sample: '{0}', Data: '{1}', Mode: "
-                      "'{2}'".format(s, expt_k, mode))
-
-            print(header)
-            print('-' * len(header))
-            print("")
-            
-            print("{0: <10} | {1: <10} | {2: <10} | {3: <10} | {4: <10} | "
-                  "{5: <10} | {6: <10}".format("n", "T", "Expt.", "n", "T",
-                                               "Calc.", "Diff."))
-            
-            print('-' * (7 * 10 + 6 * 3))
-            
-            for (e_n, e_t, e_v), (c_n, c_t, c_v) in zip(match_to, res):
-                print(
-                    "{0: >10.2e} | {1: >10.0f} | {2: >10.2f} | {3: >10.2e} | "
-                    "{4: >10.0f} | {5: >10.2f} | {6: >10.2e}".format(
-                       e_n, e_t, e_v, c_n, c_t, c_v, c_v - e_v))
+            res = match_expt_data(
+                calc_n, calc_t, calc_data_2d,
+                expt_data_s[expt_data_s['property'] == expt_k], mode=mode,
+                num_seeds=num_seeds, cache_key='Bi2SeO2-n')
             
-            print("")
+            print_comparison(
+                "Sample: '{0}', Data: '{1}', Mode: '{2}'".format(
+                    s, expt_k, mode), res)
     
     print("")
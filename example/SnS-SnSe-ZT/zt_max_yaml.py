@@ -25,7 +25,9 @@ The calculation combines data from multiple papers:
 from zt_calc_workflow.amset import read_amset_csv
 from zt_calc_workflow.analysis import get_zt_max
 from zt_calc_workflow.dataset import zt_dataset_from_data
-from zt_calc_workflow.phono3py import read_phono3py_kappa_csv
+from zt_calc_workflow.export import write_records, zt_max_record
+from zt_calc_workflow.phono3py import (
+    read_phono3py_kappa_csv, remap_kappa_axes)
 
 
 
@@ -45,13 +47,10 @@ if __name__ == "__main__":
         # The Phono3py calculations were performed on structures with the axes
         # oriented differently to those in the AMSET calculations. We deal with
         # this by dropping the off-diagonal elements and relabelling the
-        # diagonal elements in kappa_data.
+        # diagonal elements in kappa_data: the Phono3py x, y and z axes
+        # correspond to the AMSET y, z and x axes.
         
-        kappa_data.drop(columns=['kappa_yz', 'kappa_xz', 'kappa_xy'],
-                        inplace=True)
-        
-        kappa_data.columns = ['t', 'kappa_yy', 'kappa_zz', 'kappa_xx',
-                              'kappa_ave']
+        kappa_data = remap_kappa_axes(kappa_data, 'yzx')
         
         amset_data_p = read_amset_csv(amset_p)
         amset_data_n = read_amset_csv(amset_n)
@@ -60,29 +59,17 @@ if __name__ == "__main__":
                       zt_dataset_from_data(amset_data_n, kappa_data))
     
     # Get ZT_max for each system and n/p-type doping and write to a YAML file.
+    # The records are generated as they are written, so only one is held in
+    # memory at a time.
     
-    with open(r"zt_max.yaml", 'w') as f:
+    def zt_max_records():
         for system, t_max in ('SnS', 880.), ('SnSe', 800.):
             p_data, n_data = zt_data[system]
             
             for doping_type, data in ('p', p_data), ('n', n_data):
                 rec = get_zt_max(data, t_max=t_max)
                 
-                f.write("- system: {0}\n".format("{0}-Pnma".format(system)))
-                f.write("  carrier_type: {0}\n".format(doping_type))
-                
-                f.write("  carrier_conc: {0}\n".format(rec['n']))
-                f.write("  temp: {0}\n".format(rec['t']))
-                
-                data_k = []
-                
-                for k in rec.index:
-                    if k.endswith('ave'):
-                        data_k.append(k.replace('_ave', ''))
-
-                for k in data_k:
-                    f.write("  {0}:\n".format(k))
-
-                    for suffix in 'xx', 'yy', 'zz', 'ave':
-                        f.write("    {0}: {1}\n".format(
-                                    suffix, rec['{0}_{1}'.format(k, suffix)]))
+                yield zt_max_record(
+                    "{0}-Pnma".format(system), doping_type, rec)
+    
+    write_records(r"zt_max.yaml", zt_max_records())
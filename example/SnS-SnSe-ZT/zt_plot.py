@@ -32,8 +32,10 @@ from matplotlib.ticker import FuncFormatter
 
 from zt_calc_workflow.amset import read_amset_csv
 from zt_calc_workflow.dataset import zt_dataset_from_data, dataset_to_2d
-from zt_calc_workflow.phono3py import read_phono3py_kappa_csv
-from zt_calc_workflow.plotting import setup_matplotlib
+from zt_calc_workflow.phono3py import (
+    read_phono3py_kappa_csv, remap_kappa_axes)
+from zt_calc_workflow.plotting import setup_matplotlib, plot_zt_map
+from zt_calc_workflow.resample import resample_datasets
 
 
 if __name__ == "__main__":
@@ -52,13 +54,10 @@ if __name__ == "__main__":
         # The Phono3py calculations were performed on structures with the axes
         # oriented differently to those in the AMSET calculations. We deal with
         # this by dropping the off-diagonal elements and relabelling the
-        # diagonal elements in kappa_data.
+        # diagonal elements in kappa_data: the Phono3py x, y and z axes
+        # correspond to the AMSET y, z and x axes.
         
-        kappa_data.drop(columns=['kappa_yz', 'kappa_xz', 'kappa_xy'],
-                        inplace=True)
-        
-        kappa_data.columns = ['t', 'kappa_yy', 'kappa_zz', 'kappa_xx',
-                              'kappa_ave']
+        kappa_data = remap_kappa_axes(kappa_data, 'yzx')
         
         amset_data_p = read_amset_csv(amset_p)
         amset_data_n = read_amset_csv(amset_n)
@@ -83,16 +82,7 @@ if __name__ == "__main__":
     
     subplot_labels = ["p-type SnS", "n-type SnS", "p-type SnSe", "n-type SnSe"]
 
-    # Custom formatters for labels.
-
-    def contour_fmt(v):
-        if v % 1. == 0.:
-            return "{0:.0f}".format(v)
-
-        if v % 0.5 == 0.:
-            return "{0:.1f}".format(v)
-
-        return "{0:.2f}".format(v)
+    # Custom formatter for labels.
 
     def log_fmt(v, pos):
         return "$10^{{{0:.0f}}}$".format(v)
@@ -100,15 +90,17 @@ if __name__ == "__main__":
     log_formatter = FuncFormatter(log_fmt)
     
     # To use a common colour bar, we need to determine the "global" ZT_max
-    # across all datasets in the range (t_min, t_max). Once we've done this,
-    # we can create a matplotlib.colors.Normalize to colour the 2D plots.
-    
-    global_zt_max = 0.
-    
-    for data_p, data_n in zt_data.values():
-        for n, t, data in data_p, data_n:
-            t_mask = np.logical_and(t >= t_min, t <= t_max)
-            global_zt_max = max(global_zt_max, data['zt_ave'][:, t_mask].max())
+    # across all datasets in the range (t_min, t_max). To do this, we resample
+    # the datasets onto a common grid and take the maximum over the stacked
+    # data. Once we've done this, we can create a
+    # matplotlib.colors.Normalize to colour the 2D plots.
+
+    n, t, stacks = resample_datasets(
+        [d for data_pn in zt_data.values() for d in data_pn], keys=['zt_ave'])
+
+    t_mask = np.logical_and(t >= t_min, t <= t_max)
+
+    global_zt_max = np.nanmax(stacks['zt_ave'][:, :, t_mask])
     
     norm = Normalize(vmin=0., vmax=global_zt_max)
 
@@ -139,16 +131,8 @@ if __name__ == "__main__":
         for j, (n, t, data) in enumerate([data_p, data_n]):
             axes = subplot_axes[2 * i + j]
 
-            t_mask = np.logical_and(t >= t_min, t <= t_max)
-
-            x = np.log10(n)
-            y = t[t_mask]
-            z = data['zt_ave'].T[t_mask, :]
-
-            axes.pcolormesh(x, y, z, norm=norm, shading='gouraud')
-
-            cs = axes.contour(x, y, z, levels=zt_contour_levels, colors='r')
-            axes.clabel(cs, cs.levels, inline=True, fmt=contour_fmt)
+            plot_zt_map(axes, n, t, data['zt_ave'], t_min=t_min, t_max=t_max,
+                        norm=norm, contour_levels=zt_contour_levels)
 
     # Add colour bar.
 
@@ -0,0 +1,13 @@
+# zt_calc_workflow/__main__.py
+
+
+""" Entry point for "python -m zt_calc_workflow". """
+
+
+import sys
+
+from .cli import main
+
+
+if __name__ == "__main__":
+    sys.exit(main())
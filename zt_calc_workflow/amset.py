@@ -1,4 +1,4 @@
-# zt_calc_workflow/io.py
+# zt_calc_workflow/amset.py
 
 
 # ---------
@@ -15,77 +15,187 @@
 import warnings
 
 import numpy as np
+import pandas as pd
 
-from .io import read_validate_csv
+from .compact import apply_memory_mode
+from .io import iter_validate_csv, read_validate_csv
+from .profiling import profile_stage
+
+
+# ------
+# Schema
+# ------
+
+# Declarative description of the AMSET CSV format: column headers, the units
+# of quantities that may be converted, and derived quantities. Quantities
+# are given by prefix and apply to the components in _AMSET_COMPONENTS, and
+# conversions are given as (unit, divisor).
+# Units are recorded in DataFrame.attrs['units'] so that conversions are
+# never applied twice.
+
+_AMSET_COMPONENTS = ['xx', 'yy', 'zz', 'ave']
+
+_AMSET_SCHEMA = {
+    'sort_keys': ['n', 't'],
+    'units': {'sigma': 'S/m', 'pf': 'uW/cm.K^2'},
+    'conversions': {'sigma': ('S/cm', 100.0)},
+    'derived': {'pf': 'mW/m.K^2'}}
 
 
 # ------------------
 # Internal functions
 # ------------------
 
-def _check_update_amset_dataset(
-        df, check_uniform=True, convert_sigma_s_cm=True,
-        calculate_pf_mw_m_k2=True):
-    """ Check and an AMSET dataset in the form of a Pandas DataFrame:
-    
-    * sort the dataset by carrier concentration and then by temperature;
-    * check the dataset has a uniform set of n and T;
-    * convert the electrical conductivity from S m^-1 to S cm^-1; and
-    * (re)calculate the power factors in mW m^-1 K^-2.
-    """
-    
+def _check_uniform_grid(n, t):
+    """ Check sorted arrays of n and t form a uniform grid. """
+
+    n_vals, n_counts = np.unique(n, return_counts=True)
+    t_vals = np.unique(t)
+
+    bad = np.nonzero(n_counts != len(t_vals))[0]
+
+    if len(bad) > 0:
+        raise Exception("Incomplete set of temperatures for n = "
+                        "{0:.3e}".format(n_vals[bad[0]]))
+
+    t_2d = t.reshape(len(n_vals), len(t_vals))
+
+    bad = np.nonzero(~np.isclose(t_2d, t_vals).all(axis=1))[0]
+
+    if len(bad) > 0:
+        raise Exception("Inconsistent set of temperatures for n = "
+                        "{0:.3e}".format(n_vals[bad[0]]))
+
+@profile_stage
+def _apply_amset_schema(columns, block, units, check_uniform=True,
+                        convert_sigma_s_cm=True, calculate_pf_mw_m_k2=True):
+    """ Apply the checks, conversions and derived quantities in _AMSET_SCHEMA
+    to a 2D block of data with the specified columns and units, modifying
+    block and units in place where possible. Returns a tuple of
+    (columns, block). """
+
+    col_idx = {k: i for i, k in enumerate(columns)}
+
+    def _cols(prefix):
+        return ['{0}_{1}'.format(prefix, c) for c in _AMSET_COMPONENTS]
+
     # Sort by n, then T.
 
-    df.sort_values(by=['n', 't'], inplace=True)
+    i_n, i_t = (col_idx[k] for k in _AMSET_SCHEMA['sort_keys'])
+
+    order = np.lexsort((block[:, i_t], block[:, i_n]))
+
+    if (order != np.arange(len(order))).any():
+        block = block[order]
+    elif not block.flags.writeable:
+        block = block.copy()
 
     # Check for uniform n and temperatures.
 
     if check_uniform:
-        t_vals = sorted(df['t'].unique())
-        n_vals = sorted(df['n'].unique())
-    
-        for n in n_vals:
-            t_check = df[df['n'] == n]['t'].unique()
-    
-            if len(t_check) != len(t_vals):
-                raise Exception("Incomplete set of temperatures for n = "
-                                "{0:.3e}".format(n))
-    
-            if not np.allclose(t_vals, sorted(t_check)):
-                raise Exception("Inconsistent set of temperatures for n = "
-                                "{0:.3e}".format(n))
+        _check_uniform_grid(block[:, i_n], block[:, i_t])
     else:
         warnings.warn("check_uniform is set to False - other functions may "
-                      "not work as expected on non-uniform data.", UserWarning)
+                      "not work as expected on non-uniform data (see "
+                      "scattered.py).", UserWarning)
 
-    # If requested, recalculate PFs in mW/m.K^2.
+    # If requested, recalculate PFs in mW/m.K^2 from \sigma in S/m.
 
-    has_pf = ('pf_xx' in df.columns and 'pf_yy' in df.columns
-              and 'pf_zz' in df.columns and 'pf_ave' in df.columns)
+    has_pf = all(k in col_idx for k in _cols('pf'))
 
     if calculate_pf_mw_m_k2 or not has_pf:
-        key_sets = [
-            ('s_xx', 'sigma_xx', 'pf_xx'), ('s_yy', 'sigma_yy', 'pf_yy'),
-            ('s_zz', 'sigma_zz', 'pf_zz'), ('s_ave', 'sigma_ave', 'pf_ave')]
+        if not has_pf:
+            new_cols = [k for k in _cols('pf') if k not in col_idx]
+
+            block = np.concatenate(
+                [block, np.empty((len(block), len(new_cols)))], axis=1)
+
+            for k in new_cols:
+                col_idx[k] = len(columns)
+                columns = columns + [k]
+
+        sigma_scale = 1.0
+
+        if units['sigma'] != _AMSET_SCHEMA['units']['sigma']:
+            sigma_scale = _AMSET_SCHEMA['conversions']['sigma'][1]
+
+        for k_s, k_sigma, k_pf in zip(_cols('s'), _cols('sigma'), _cols('pf')):
+            sigma = block[:, col_idx[k_sigma]]
+
+            if sigma_scale != 1.0:
+                sigma = sigma_scale * sigma
+
+            block[:, col_idx[k_pf]] = 1.0e3 * (
+                (1.0e-6 * block[:, col_idx[k_s]]) ** 2 * sigma)
 
-        for k_s, k_sigma, k_pf in key_sets:
-            df.loc[:, k_pf] = 1.0e3 * ((1.0e-6 * df[k_s].to_numpy()) ** 2
-                                       * df[k_sigma].to_numpy())
+        units['pf'] = _AMSET_SCHEMA['derived']['pf']
     else:
         warnings.warn(
             "calculate_pf_mw_m_k2 is set to False - other functions may not "
             "work as expected if data is in different units.", UserWarning)
 
-    # If requested, convert \sigma from S/m -> S/cm.
+    # If requested, convert \sigma from S/m -> S/cm, unless this has already
+    # been done.
 
     if convert_sigma_s_cm:
-        for k in 'sigma_xx', 'sigma_yy', 'sigma_zz', 'sigma_ave':
-            df.loc[:, k] = df[k].to_numpy() / 100.0
+        unit, divisor = _AMSET_SCHEMA['conversions']['sigma']
+
+        if units['sigma'] != unit:
+            for k in _cols('sigma'):
+                block[:, col_idx[k]] /= divisor
+
+            units['sigma'] = unit
     else:
         warnings.warn(
             "convert_sigma_s_cm is set to False - other functions may not "
             "work as expected if data is in different units.", UserWarning)
+
+    return (columns, block)
+
+def _apply_amset_schema_df(df, **kwargs):
+    """ Apply _apply_amset_schema() to a Pandas DataFrame, with the units in
+    df.attrs['units'] (default: those in _AMSET_SCHEMA), and return a new
+    DataFrame with the updated units in attrs['units']. kwargs are passed to
+    _apply_amset_schema(). """
+
+    units = dict(_AMSET_SCHEMA['units'])
+    units.update(df.attrs.get('units', {}))
+
+    columns, block = _apply_amset_schema(
+        list(df.columns), df.to_numpy(dtype=np.float64), units, **kwargs)
+
+    df = pd.DataFrame(block, columns=columns, copy=False)
+    df.attrs['units'] = units
+
+    return df
+
+@profile_stage
+def _check_update_amset_dataset(
+        df, check_uniform=True, convert_sigma_s_cm=True,
+        calculate_pf_mw_m_k2=True):
+    """ Check and an AMSET dataset in the form of a Pandas DataFrame:
     
+    * sort the dataset by carrier concentration and then by temperature;
+    * check the dataset has a uniform set of n and T;
+    * convert the electrical conductivity from S m^-1 to S cm^-1; and
+    * (re)calculate the power factors in mW m^-1 K^-2.
+
+    Units are tracked in df.attrs['units'], so datasets that have already
+    been converted are not converted again. If a memory mode has been
+    applied to the dataset (see compact.py), it is applied to the new
+    DataFrame. Returns a new DataFrame.
+    """
+
+    memory_mode = df.attrs.get('memory_mode')
+
+    df = _apply_amset_schema_df(
+        df, check_uniform=check_uniform, convert_sigma_s_cm=convert_sigma_s_cm,
+        calculate_pf_mw_m_k2=calculate_pf_mw_m_k2)
+
+    if memory_mode is not None:
+        df.attrs['memory_mode'] = memory_mode
+        apply_memory_mode(df, memory_mode)
+
     return df
 
 
@@ -111,13 +221,125 @@ _READ_AMSET_HEADER_MAP = {
 
 _READ_AMSET_KNOWN_HEADERS = list(_READ_AMSET_HEADER_MAP.values())
 
-def read_amset_csv(file_path, **kwargs):
+@profile_stage
+def read_amset_csv(file_path, memory_mode=None, **kwargs):
     """ Read a CSV file generated with Joe's AMSET code and, by default,
-    perform some checks and unit conversions. kwargs are passed to
-    _check_update_amset_dataset(). """
+    perform some checks and unit conversions. kwargs (check_uniform,
+    convert_sigma_s_cm and calculate_pf_mw_m_k2) are passed to
+    _apply_amset_schema(). memory_mode optionally specifies a memory mode to
+    apply to the data (see compact.py). """
 
     df = read_validate_csv(file_path, header_map=_READ_AMSET_HEADER_MAP,
                            known_headers=_READ_AMSET_KNOWN_HEADERS,
                            known_headers_required=False)
-    
-    return _check_update_amset_dataset(df, **kwargs)
+
+    # The checks and conversions are applied in one pass over the data as a
+    # single 2D array, which is then converted back to a DataFrame.
+
+    df = _apply_amset_schema_df(df, **kwargs)
+
+    if memory_mode is not None:
+        apply_memory_mode(
+            df, memory_mode, source={'reader': 'amset',
+                                     'file_path': file_path,
+                                     'kwargs': kwargs})
+
+    return df
+
+@profile_stage
+def iter_amset_csv_chunks(file_path, chunk_size, **kwargs):
+    """ Read a CSV file generated with Joe's AMSET code in chunks of
+    approximately chunk_size rows, and yield each chunk as a Pandas DataFrame
+    with the checks and unit conversions in read_amset_csv() applied. kwargs
+    are passed to _apply_amset_schema().
+
+    Chunks are aligned on the outer of the two loops over carrier
+    concentration and temperature in the file (determined from the first
+    rows), i.e. all the rows for each n, or each T, are in the same chunk.
+    The rows in the file must therefore be grouped by n or T, as in files
+    written by AMSET. Chunks are extended where required to include all the
+    rows for the last n or T.
+    """
+
+    check_uniform = kwargs.get('check_uniform', True)
+
+    group_key = None
+
+    seen_vals = set()
+    inner_vals = None
+
+    def _process(df):
+        nonlocal inner_vals
+
+        g = df[group_key].to_numpy()
+
+        # Check the rows are grouped by the outer key.
+
+        g_vals = np.unique(g)
+
+        num_runs = 1 + np.count_nonzero(g[1:] != g[:-1])
+
+        if (num_runs != len(g_vals)
+                or not seen_vals.isdisjoint(g_vals.tolist())):
+            raise Exception("Rows in \"{0}\" must be grouped by carrier "
+                            "concentration or temperature to be read in "
+                            "chunks.".format(file_path))
+
+        seen_vals.update(g_vals.tolist())
+
+        df = _apply_amset_schema_df(df, **kwargs)
+
+        # Check each chunk has the same set of values of the inner key.
+
+        if check_uniform:
+            inner_key = 't' if group_key == 'n' else 'n'
+
+            chunk_inner_vals = np.unique(df[inner_key].to_numpy())
+
+            if inner_vals is None:
+                inner_vals = chunk_inner_vals
+            elif (len(chunk_inner_vals) != len(inner_vals)
+                      or not np.isclose(chunk_inner_vals, inner_vals).all()):
+                raise Exception("Inconsistent set of {0} values for {1} = "
+                                "{2:.3e}".format(inner_key, group_key,
+                                                 g_vals[0]))
+
+        return df
+
+    carry = None
+
+    for df in iter_validate_csv(
+            file_path, chunk_size, header_map=_READ_AMSET_HEADER_MAP,
+            known_headers=_READ_AMSET_KNOWN_HEADERS,
+            known_headers_required=False):
+        if carry is not None:
+            df = pd.concat([carry, df], ignore_index=True)
+
+        if group_key is None:
+            n = df['n'].to_numpy()
+
+            if len(n) < 2:
+                carry = df
+                continue
+
+            group_key = 'n' if n[1] == n[0] else 't'
+
+        # Hold back the rows for the last n or T, which may continue in the
+        # next chunk.
+
+        g = df[group_key].to_numpy()
+
+        (other, ) = np.nonzero(g != g[-1])
+
+        split = other[-1] + 1 if len(other) > 0 else 0
+
+        carry = df.iloc[split:]
+
+        if split > 0:
+            yield _process(df.iloc[:split])
+
+    if carry is not None and len(carry) > 0:
+        if group_key is None:
+            group_key = 'n'
+
+        yield _process(carry)
@@ -18,83 +18,55 @@ import numpy as np
 
 from itertools import product
 
-from scipy.interpolate import RegularGridInterpolator
-from scipy.optimize import minimize
+from .interpolation import get_interpolator
+from .profiling import count_result_rows, profile_stage
 
 
-# ---------
-# Functions
-# ---------
+# ------------------
+# Internal functions
+# ------------------
 
-def get_zt_max(data, n_min=None, n_max=None, t_max=None, t_min=None):
-    """ Locate the maximum ZT in a Pandas DataFrame, with optional bounds on
-    n and T, and return the corresponding table entry. """
-    
-    # Mask data if required.
+def _match_interpolated(evaluate, guess_log_n, guess_t, guess_val, to_match,
+                        mode, num_seeds):
+    """ Shared implementation of match_data() for an arbitrary interpolation.
 
-    data_mask = np.ones(len(data), dtype=np.bool)
+    evaluate(log_n, t) should return the interpolated values at (log_n, t),
+    which may be scalars or (broadcastable) arrays.
+    guess_log_n, guess_t and guess_val are flat arrays with the coordinates
+    and values of the calculated data points, which are used to generate
+    initial guesses and bounds for the minimisation.
+    """
 
-    if n_min is not None:
-        data_mask = np.logical_and(data_mask, data['n'] >= n_min)
+    from scipy.optimize import minimize
 
-    if n_max is not None:
-        data_mask = np.logical_and(data_mask, data['n'] <= n_max)
+    log_n_bounds = (guess_log_n.min(), guess_log_n.max())
+    t_bounds = (guess_t.min(), guess_t.max())
 
-    if t_min is not None:
-        data_mask = np.logical_and(data_mask, data['t'] >= t_min)
+    # For mode = 'same', evaluate all the points in one call.
 
-    if t_max is not None:
-        data_mask = np.logical_and(data_mask, data['t'] <= t_max)
+    if mode == 'same':
+        if any(n is None or t is None for n, t, _ in to_match):
+            raise Exception("mode = 'same' can only be used when both n "
+                            "and T have been specified.")
 
-    idx = data[data_mask].idxmax()['zt_ave']
-    
-    return data.loc[idx]
+        n = np.array([n for n, _, _ in to_match], dtype=np.float64)
+        t = np.array([t for _, t, _ in to_match], dtype=np.float64)
 
+        vals = evaluate(np.log10(n), t)
+
+        return [(n_i, t_i, v) for (n_i, t_i, _), v in zip(to_match, vals)]
 
-def match_data(calc_n, calc_t, calc_data_2d, to_match, mode='same_t',
-               num_seeds=1):
-    
-    """ Construct a 2D interpolation of calc_data_2d, attempt to match data
-    specified in to_match according to mode, and return a list of best-fit n, T
-    and values.
-    
-    to_match should be a list of (n, T, val) data points; n and/or
-    T can be set to None, but this will throw an error for some modes.
-    
-    Mode can be one of 'same', 'same_t' (default), 'same_n', 'best_match',
-    where:
-        * 'same' returns the calculated value at the experimental n/T.
-        * 'same_t'/'same_n' return closest match at the same T/n.
-        * 'best_match' returns the closest match.
-    """
-    
-    # Generate an interpolation of the 2D data with x = log_n.
-    
-    calc_log_n = np.log10(calc_n)
-    
-    interpolator = RegularGridInterpolator(
-        (calc_log_n, calc_t), calc_data_2d, method='linear', bounds_error=False,
-        fill_value=None)
-    
     # Loop over the data in to_match.
     
     match_res = []
     
     for n, t, val in to_match:
         # An initial guess for n and/or T can be taken from the coordinates of
-        # the 2D data where the difference to val is a minimum.
+        # the data point where the difference to val is a minimum.
         
-        idx_n, idx_t = np.unravel_index(
-            np.argmin(np.abs(calc_data_2d - val)), calc_data_2d.shape)
-        
-        if mode == 'same':
-            if n is None or t is None:
-                raise Exception("mode = 'same' can only be used when both n "
-                                "and T have been specified.")
-            
-            match_res.append((n, t, interpolator((np.log10(n), t))))
+        idx = np.argmin(np.abs(guess_val - val))
         
-        elif mode == 'same_t':
+        if mode == 'same_t':
             if t is None:
                 raise Exception("mode = 'same_t' can only be used when T has "
                                 "been specified.")
@@ -102,8 +74,8 @@ def match_data(calc_n, calc_t, calc_data_2d, to_match, mode='same_t',
             # Objective function to be minimised: absolute difference between
             # the calculation and match value.
             
-            def _fit_func(log_n):
-                return np.abs(interpolator((log_n, t)) - val)
+            def _fit_func(x):
+                return np.abs(evaluate(x[0], t) - val)
             
             # Generate a set of initial guesses to input to the minimisation
             # function. If num_seeds = 1, use the log(n) from the estimate
@@ -113,27 +85,25 @@ def match_data(calc_n, calc_t, calc_data_2d, to_match, mode='same_t',
             guesses = None
             
             if num_seeds > 1:
-                guesses = np.linspace(calc_log_n.min(), calc_log_n.max(),
-                                      num_seeds)
+                guesses = np.linspace(*log_n_bounds, num_seeds)
             else:
-                guesses = [calc_n[idx_n]]
+                guesses = [guess_log_n[idx]]
 
             # Minimise the function for each initital guess in guesses.
 
             res_set = []
             
             for log_n_0 in guesses:
-                res = minimize(_fit_func, [log_n_0],
-                               bounds=[(calc_log_n[0], calc_log_n[-1])])
+                res = minimize(_fit_func, [log_n_0], bounds=[log_n_bounds])
                 
                 res_set.append(res)
             
             # Select the guess with the lowest error (given by res.fun).
     
-            idx = np.argmin([res.fun for res in res_set])
+            res = res_set[np.argmin([res.fun for res in res_set])]
             
-            match_res.append((np.power(10., res_set[idx].x[0]), t,
-                              interpolator((res_set[idx].x[0], t))))
+            match_res.append((np.power(10., res.x[0]), t,
+                              evaluate(res.x[0], t)))
         
         elif mode == 'same_n':
             if n is None:
@@ -141,31 +111,31 @@ def match_data(calc_n, calc_t, calc_data_2d, to_match, mode='same_t',
                                 "been specified.")
             
             # As for mode == 'same_t'.
+
+            log_n = np.log10(n)
             
-            def _fit_func(t):
-                return np.abs(interpolator((np.log10(n), t)) - val)
+            def _fit_func(x):
+                return np.abs(evaluate(log_n, x[0]) - val)
 
             guesses = None
             
             if num_seeds > 1:
-                guesses = np.linspace(calc_t.min(), calc_t.max(), num_seeds)
+                guesses = np.linspace(*t_bounds, num_seeds)
             else:
-                guesses = [calc_t[idx_t]]
+                guesses = [guess_t[idx]]
 
             res_set = []
             
-            for t in guesses:
-                res = minimize(_fit_func, [t],
-                               bounds=[(calc_t.min(), calc_t.max())])
+            for t_0 in guesses:
+                res = minimize(_fit_func, [t_0], bounds=[t_bounds])
                 
                 res_set.append(res)
             
             # Select the guess with the lowest error (given by res.fun).
     
-            idx = np.argmin([res.fun for res in res_set])
+            res = res_set[np.argmin([res.fun for res in res_set])]
             
-            match_res.append((n, res_set[idx].x[0],
-                              interpolator((np.log10(n), res_set[idx].x[0]))))
+            match_res.append((n, res.x[0], evaluate(log_n, res.x[0])))
         
         elif mode == 'best_match':
             if num_seeds > 1:
@@ -173,8 +143,8 @@ def match_data(calc_n, calc_t, calc_data_2d, to_match, mode='same_t',
                               "may take a long time and/or yield dubious "
                               "results.", RuntimeWarning)
  
-            def _fit_func(args):
-                return np.abs(interpolator(args) - val)
+            def _fit_func(x):
+                return np.abs(evaluate(x[0], x[1]) - val)
 
             # In contrast to mode = 'same_t' and 'same_n', there are two
             # parameters to be minimised. If num_seeds > 1, we take the
@@ -183,27 +153,95 @@ def match_data(calc_n, calc_t, calc_data_2d, to_match, mode='same_t',
             guesses = None
             
             if num_seeds > 1:
-                guess_n = np.linspace(calc_log_n.min(), calc_log_n.max(),
-                                      num_seeds)
-                
-                guess_t = np.linspace(calc_t.min(), calc_t.max(), num_seeds)
-                
-                guesses = [
-                    (log_n, t) for log_n, t in product(guess_n, guess_t)]
+                guesses = list(product(np.linspace(*log_n_bounds, num_seeds),
+                                       np.linspace(*t_bounds, num_seeds)))
             else:
-                guesses = [(calc_log_n[idx_n], calc_t[idx_t])]
+                guesses = [(guess_log_n[idx], guess_t[idx])]
             
             res_set = []
             
-            for log_n, t in guesses:
-                res = minimize(_fit_func, [log_n, t],
-                               bounds=[(calc_log_n[0], calc_log_n[-1]),
-                                       (calc_t[0], calc_t[-1])])
+            for log_n_0, t_0 in guesses:
+                res = minimize(_fit_func, [log_n_0, t_0],
+                               bounds=[log_n_bounds, t_bounds])
+                
+                res_set.append(res)
+
+            # Select the guess with the lowest error (given by res.fun).
+
+            res = res_set[np.argmin([res.fun for res in res_set])]
             
             match_res.append((np.power(10., res.x[0]), res.x[1],
-                              interpolator((res.x[0], res.x[1]))))
+                              evaluate(res.x[0], res.x[1])))
 
         else:
             raise Exception("Unknown mode = '{0}'.".format(mode))
     
     return match_res
+
+
+# ---------
+# Functions
+# ---------
+
+@profile_stage
+def get_zt_max(data, n_min=None, n_max=None, t_max=None, t_min=None):
+    """ Locate the maximum ZT in a Pandas DataFrame, with optional bounds on
+    n and T, and return the corresponding table entry. """
+    
+    # Mask data if required.
+
+    data_mask = np.ones(len(data), dtype=np.bool)
+
+    if n_min is not None:
+        data_mask = np.logical_and(data_mask, data['n'] >= n_min)
+
+    if n_max is not None:
+        data_mask = np.logical_and(data_mask, data['n'] <= n_max)
+
+    if t_min is not None:
+        data_mask = np.logical_and(data_mask, data['t'] >= t_min)
+
+    if t_max is not None:
+        data_mask = np.logical_and(data_mask, data['t'] <= t_max)
+
+    idx = data[data_mask].idxmax()['zt_ave']
+    
+    return data.loc[idx]
+
+
+@profile_stage(count_rows=count_result_rows)
+def match_data(calc_n, calc_t, calc_data_2d, to_match, mode='same_t',
+               num_seeds=1, cache_key=None):
+    
+    """ Construct a 2D interpolation of calc_data_2d, attempt to match data
+    specified in to_match according to mode, and return a list of best-fit n, T
+    and values.
+    
+    to_match should be a list of (n, T, val) data points; n and/or
+    T can be set to None, but this will throw an error for some modes.
+    
+    Mode can be one of 'same', 'same_t' (default), 'same_n', 'best_match',
+    where:
+        * 'same' returns the calculated value at the experimental n/T.
+        * 'same_t'/'same_n' return closest match at the same T/n.
+        * 'best_match' returns the closest match.
+
+    cache_key is passed to interpolation.get_interpolator(), so that repeated
+    matches to the same data reuse the interpolant.
+    """
+    
+    # Get a (cached, if cache_key is set) interpolation of the 2D data with
+    # x = log_n.
+
+    interpolator = get_interpolator(
+        calc_n, calc_t, calc_data_2d, cache_key=cache_key)
+
+    def _evaluate(log_n, t):
+        return interpolator((log_n, t))
+
+    guess_log_n, guess_t = np.meshgrid(
+        np.log10(calc_n), calc_t, indexing='ij')
+
+    return _match_interpolated(
+        _evaluate, guess_log_n.ravel(), guess_t.ravel(),
+        np.asarray(calc_data_2d).ravel(), to_match, mode, num_seeds)
@@ -0,0 +1,232 @@
+# zt_calc_workflow/archive.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for saving and partially loading ZT datasets in a chunked,
+compressed archive format.
+
+An archive is a NumPy .npz (zip) file containing the n and T values of a
+uniform dataset and each property stored as a set of compressed chunks of the
+2D (n, T) array from dataset_to_2d(). Chunks are stored as separate members of
+the zip file, so loading a subset of properties, temperatures or doping levels
+only reads and decompresses the chunks that overlap the selection.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import zipfile
+
+import numpy as np
+
+from .dataset import dataset_to_2d, dataset_from_2d
+from .profiling import profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+_ARCHIVE_FORMAT_VERSION = 1
+
+_ARCHIVE_DEFAULT_CHUNK_SHAPE = (32, 32)
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _chunk_member_name(k, i, j):
+    """ Return the name of the archive member storing chunk (i, j) of the
+    property k. """
+
+    return "{0}/{1}/{2}".format(k, i, j)
+
+def _write_member(zf, name, arr):
+    """ Write arr to the open ZipFile zf as a .npy member. """
+
+    with zf.open(name + '.npy', 'w', force_zip64=True) as f:
+        np.lib.format.write_array(f, np.asarray(arr), allow_pickle=False)
+
+def _select_range(vals, v_min, v_max):
+    """ Return the (start, stop) indices of the (sorted) vals within the
+    inclusive bounds v_min and v_max. """
+
+    start = 0 if v_min is None else np.searchsorted(vals, v_min, side='left')
+    stop = len(vals) if v_max is None else np.searchsorted(vals, v_max,
+                                                           side='right')
+
+    return int(start), int(max(start, stop))
+
+
+# ------
+# Saving
+# ------
+
+def save_zt_archive_2d(file_path, n_vals, t_vals, data_2d, keys=None,
+                       chunk_shape=_ARCHIVE_DEFAULT_CHUNK_SHAPE,
+                       compress_level=6):
+    """ Save a set of n and T values and a dictionary of 2D NumPy arrays,
+    e.g. from dataset_to_2d(), to a chunked archive. keys optionally selects
+    a subset of the data to save, and chunk_shape sets the size of the chunks
+    along n and T. """
+
+    n_vals = np.asarray(n_vals, dtype=np.float64)
+    t_vals = np.asarray(t_vals, dtype=np.float64)
+
+    if np.any(np.diff(n_vals) <= 0.) or np.any(np.diff(t_vals) <= 0.):
+        raise Exception("n and T values must be sorted in ascending order.")
+
+    if keys is None:
+        keys = list(data_2d.keys())
+
+    chunk_n, chunk_t = chunk_shape
+
+    if chunk_n < 1 or chunk_t < 1:
+        raise Exception("chunk_shape must be at least (1, 1).")
+
+    shape = (len(n_vals), len(t_vals))
+
+    with zipfile.ZipFile(file_path, 'w', compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=compress_level) as zf:
+        # Write metadata.
+
+        _write_member(zf, '__format__',
+                      np.array([_ARCHIVE_FORMAT_VERSION], dtype=np.int64))
+
+        _write_member(zf, '__keys__', np.array(keys, dtype=np.str_))
+
+        _write_member(zf, '__chunk_shape__',
+                      np.array([chunk_n, chunk_t], dtype=np.int64))
+
+        _write_member(zf, 'n', n_vals)
+        _write_member(zf, 't', t_vals)
+
+        # Write data chunks.
+
+        for k in keys:
+            arr = np.asarray(data_2d[k])
+
+            if arr.shape != shape:
+                raise Exception("Shape of data '{0}' does not match the "
+                                "number of n and T values.".format(k))
+
+            for i, i_start in enumerate(range(0, shape[0], chunk_n)):
+                for j, j_start in enumerate(range(0, shape[1], chunk_t)):
+                    _write_member(
+                        zf, _chunk_member_name(k, i, j),
+                        np.ascontiguousarray(
+                            arr[i_start:i_start + chunk_n,
+                                j_start:j_start + chunk_t]))
+
+@profile_stage
+def save_zt_archive(file_path, data, keys=None,
+                    chunk_shape=_ARCHIVE_DEFAULT_CHUNK_SHAPE,
+                    compress_level=6):
+    """ Save a (uniform) dataset as a Pandas DataFrame to a chunked archive.
+    See save_zt_archive_2d() for the remaining parameters. """
+
+    n_vals, t_vals, data_2d = dataset_to_2d(data)
+
+    save_zt_archive_2d(file_path, n_vals, t_vals, data_2d, keys=keys,
+                       chunk_shape=chunk_shape, compress_level=compress_level)
+
+
+# -------
+# Loading
+# -------
+
+def read_zt_archive_info(file_path):
+    """ Read the metadata from a chunked archive without loading any data
+    and return a dictionary with the 'n' and 't' values, the 'keys' of the
+    stored properties and the 'chunk_shape'. """
+
+    with np.load(file_path, allow_pickle=False) as f:
+        if int(f['__format__'][0]) != _ARCHIVE_FORMAT_VERSION:
+            raise Exception("Unsupported archive format version.")
+
+        return {'n': f['n'], 't': f['t'],
+                'keys': [str(k) for k in f['__keys__']],
+                'chunk_shape': tuple(int(v) for v in f['__chunk_shape__'])}
+
+@profile_stage
+def load_zt_archive(file_path, keys=None, n_min=None, n_max=None, t_min=None,
+                    t_max=None, as_dataframe=False):
+    """ Load data from a chunked archive, optionally restricted to a subset of
+    properties (keys) and to inclusive bounds on n and T. Only the chunks
+    overlapping the selection are read.
+
+    Returns a tuple of (n_vals, t_vals, data_2d) as for dataset_to_2d(), or,
+    if as_dataframe is True, a Pandas DataFrame.
+    """
+
+    with np.load(file_path, allow_pickle=False) as f:
+        if int(f['__format__'][0]) != _ARCHIVE_FORMAT_VERSION:
+            raise Exception("Unsupported archive format version.")
+
+        stored_keys = [str(k) for k in f['__keys__']]
+        chunk_n, chunk_t = (int(v) for v in f['__chunk_shape__'])
+
+        n_vals, t_vals = f['n'], f['t']
+
+        if keys is None:
+            keys = stored_keys
+        else:
+            for k in keys:
+                if k not in stored_keys:
+                    raise Exception(
+                        "Data '{0}' not found in archive.".format(k))
+
+        # Determine the selected index ranges and the chunks they span.
+
+        i_start, i_stop = _select_range(n_vals, n_min, n_max)
+        j_start, j_stop = _select_range(t_vals, t_min, t_max)
+
+        shape = (i_stop - i_start, j_stop - j_start)
+
+        chunks_i = range(i_start // chunk_n, -(-i_stop // chunk_n))
+        chunks_j = range(j_start // chunk_t, -(-j_stop // chunk_t))
+
+        # Assemble the selection from the overlapping chunks.
+
+        data_2d = {}
+
+        for k in keys:
+            arr = np.zeros(shape, dtype=np.float64)
+
+            for ci in chunks_i:
+                c_i_start = ci * chunk_n
+
+                src_i = slice(max(i_start - c_i_start, 0),
+                              min(i_stop - c_i_start, chunk_n))
+
+                dst_i = slice(c_i_start + src_i.start - i_start,
+                              c_i_start + src_i.stop - i_start)
+
+                for cj in chunks_j:
+                    c_j_start = cj * chunk_t
+
+                    src_j = slice(max(j_start - c_j_start, 0),
+                                  min(j_stop - c_j_start, chunk_t))
+
+                    dst_j = slice(c_j_start + src_j.start - j_start,
+                                  c_j_start + src_j.stop - j_start)
+
+                    chunk = f[_chunk_member_name(k, ci, cj)]
+
+                    arr[dst_i, dst_j] = chunk[src_i, src_j]
+
+            data_2d[k] = arr
+
+        n_vals = n_vals[i_start:i_stop]
+        t_vals = t_vals[j_start:j_stop]
+
+    if as_dataframe:
+        return dataset_from_2d(n_vals, t_vals, data_2d)
+
+    return (n_vals, t_vals, data_2d)
@@ -0,0 +1,317 @@
+# zt_calc_workflow/bipolar.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for correcting p- and n-type ZT datasets for bipolar
+conduction.
+
+At high temperature, thermally-excited minority carriers reduce S and add a
+bipolar contribution to \\kappa_el. The p- and n-type datasets from separate
+AMSET calculations are combined with an intrinsic carrier model: for a net
+doping level N (the 'n' column of each dataset), the majority and minority
+carrier concentrations are:
+
+    n_maj = N / 2 + sqrt(N^2 / 4 + n_i^2),  n_min = n_i^2 / n_maj
+
+with n_i = sqrt(N_c N_v) exp(-E_g / 2 k_B T) and effective densities of
+states N_c,v = 2 (2 pi m_c,v k_B T / h^2)^(3/2). The properties of each
+carrier type are interpolated from the corresponding dataset at n_maj or
+n_min, and combined as two parallel conduction channels:
+
+    \\sigma = \\sigma_maj + \\sigma_min
+    S = (\\sigma_maj S_maj + \\sigma_min S_min) / \\sigma
+    \\kappa_el = \\kappa_el,maj + \\kappa_el,min
+                 + (\\sigma_maj \\sigma_min / \\sigma) (S_maj - S_min)^2 T
+
+after which the PF, \\kappa_tot and ZT are recalculated.
+
+The interpolation is in log n, with \\sigma and \\kappa_el interpolated in
+log-log space. Minority carrier concentrations are often below the range of
+the datasets, in which case \\sigma and \\kappa_el are extrapolated as
+proportional to n and S with the non-degenerate (k_B / e) ln n dependence.
+Concentrations above the range are clamped to the largest n in the dataset.
+
+Carrier concentrations are in cm^-3, band gaps in eV and effective masses in
+units of the electron mass.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .analysis import get_zt_max
+from .dataset import dataset_from_2d, dataset_to_2d
+from .profiling import profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+_K_B = 1.380649e-23
+_E = 1.602176634e-19
+_H = 6.62607015e-34
+_M_E = 9.1093837015e-31
+
+# k_B / e in uV/K and k_B in eV/K.
+
+_K_B_E_UV_K = 1.e6 * _K_B / _E
+_K_B_EV_K = _K_B / _E
+
+_BIPOLAR_COMPONENTS = ['xx', 'yy', 'zz', 'ave']
+
+# Properties interpolated from the datasets, and whether they are
+# interpolated in log-log space.
+
+_BIPOLAR_PROPERTIES = [('sigma', True), ('s', False), ('kappa_el', True)]
+
+# Tolerance (decades) for carrier concentrations above the range of a
+# dataset before clamping is reported, since majority carrier concentrations
+# at the largest doping level always slightly exceed the range.
+
+_BIPOLAR_CLAMP_TOL = 1.e-3
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _property_stack(data_2d):
+    """ Stack the properties in _BIPOLAR_PROPERTIES from a dictionary of 2D
+    arrays into a (num_n, num_t, num_props) array, and return it together
+    with a mask of properties interpolated in log-log space and the list of
+    keys. """
+
+    keys, log_mask = [], []
+
+    for prop, use_log in _BIPOLAR_PROPERTIES:
+        for c in _BIPOLAR_COMPONENTS:
+            keys.append('{0}_{1}'.format(prop, c))
+            log_mask.append(use_log)
+
+    stack = np.stack([data_2d[k] for k in keys], axis=-1)
+
+    return stack, np.array(log_mask), keys
+
+def _interpolate_carrier_conc(n, stack, log_mask, n_eval):
+    """ Interpolate a (num_n, num_t, num_props) stack of properties on the
+    carrier concentrations n to a (num_eval, num_t) array of carrier
+    concentrations n_eval (see module docstring). Returns a tuple of
+    (values, num_clamped), where values is a (num_eval, num_t, num_props)
+    array. """
+
+    x = np.log10(n)
+    x_eval = np.log10(n_eval)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vals = np.where(log_mask, np.log10(np.abs(stack)), stack)
+
+    i = np.clip(np.searchsorted(x, x_eval) - 1, 0, len(x) - 2)
+    j = np.arange(stack.shape[1])[np.newaxis, :]
+
+    f = (x_eval - x[i]) / (x[i + 1] - x[i])
+
+    below = x_eval < x[0]
+    above = x_eval > x[-1] + _BIPOLAR_CLAMP_TOL
+
+    f = np.clip(f, 0., 1.)[..., np.newaxis]
+
+    res = vals[i, j] + f * (vals[i + 1, j] - vals[i, j])
+
+    # Non-degenerate extrapolation below the range of the dataset: sigma and
+    # kappa_el proportional to n (slope 1 in log-log space) and |S| increasing
+    # by (k_B / e) ln(n_min / n).
+
+    dx = np.where(below, x_eval - x[0], 0.)[..., np.newaxis]
+
+    slope = np.where(
+        log_mask, 1., -1. * np.sign(vals[0]) * _K_B_E_UV_K * np.log(10.))
+
+    res = res + np.where(below[..., np.newaxis], slope[j] * dx, 0.)
+
+    # Convert properties interpolated in log space back to linear values
+    # with their original signs.
+
+    res[..., log_mask] = (np.sign(stack[0])[j][..., log_mask]
+                              * np.power(10., res[..., log_mask]))
+
+    return (res, int(above.sum()))
+
+def _carrier_concs(n_net, n_i):
+    """ Return the majority and minority carrier concentrations for net doping
+    levels n_net and intrinsic carrier concentrations n_i. """
+
+    n_maj = 0.5 * n_net + np.sqrt(0.25 * n_net ** 2 + n_i ** 2)
+
+    return (n_maj, n_i ** 2 / n_maj)
+
+def _combine(t, maj, min_, keys):
+    """ Combine the majority and minority carrier properties (arrays with the
+    properties in keys along the last axis) and return a dictionary of
+    bipolar-corrected 2D arrays. """
+
+    idx = {k: i for i, k in enumerate(keys)}
+
+    res = {}
+
+    for c in _BIPOLAR_COMPONENTS:
+        sigma_maj = maj[..., idx['sigma_{0}'.format(c)]]
+        sigma_min = min_[..., idx['sigma_{0}'.format(c)]]
+
+        s_maj = maj[..., idx['s_{0}'.format(c)]]
+        s_min = min_[..., idx['s_{0}'.format(c)]]
+
+        sigma = sigma_maj + sigma_min
+
+        s = (sigma_maj * s_maj + sigma_min * s_min) / sigma
+
+        # Bipolar \kappa_el, with \sigma in S/m and S in V/K.
+
+        kappa_bip = (
+            (100. * sigma_maj * sigma_min / sigma)
+                * (1.e-6 * (s_maj - s_min)) ** 2 * t[np.newaxis, :])
+
+        res['sigma_{0}'.format(c)] = sigma
+        res['s_{0}'.format(c)] = s
+
+        res['kappa_el_{0}'.format(c)] = (
+            maj[..., idx['kappa_el_{0}'.format(c)]]
+                + min_[..., idx['kappa_el_{0}'.format(c)]] + kappa_bip)
+
+        res['kappa_bip_{0}'.format(c)] = kappa_bip
+
+        res['pf_{0}'.format(c)] = 1.e3 * (1.e-6 * s) ** 2 * (100. * sigma)
+
+    return res
+
+
+# ---------
+# Functions
+# ---------
+
+def intrinsic_carrier_conc(t, e_g, m_dos_n=1., m_dos_p=1.):
+    """ Return the intrinsic carrier concentration (cm^-3) at temperatures t
+    for a band gap e_g (eV; a number or a callable returning the band gap at
+    t) and conduction- and valence-band density-of-states effective masses
+    m_dos_n and m_dos_p. """
+
+    t = np.asarray(t, dtype=np.float64)
+
+    if callable(e_g):
+        e_g = e_g(t)
+
+    # Effective densities of states in cm^-3.
+
+    n_eff = 2. * (2. * np.pi * _M_E * _K_B * t / _H ** 2) ** 1.5 * 1.e-6
+
+    return (n_eff * (m_dos_n * m_dos_p) ** 0.75
+                * np.exp(-1. * np.asarray(e_g) / (2. * _K_B_EV_K * t)))
+
+@profile_stage
+def bipolar_correction(p_data, n_data, e_g, m_dos_n=1., m_dos_p=1.):
+    """ Correct p- and n-type ZT datasets, as returned by
+    zt_dataset_from_data(), for bipolar conduction with the intrinsic
+    carrier model in the module docstring, for a band gap e_g (eV; a number
+    or a callable returning the band gap as a function of T) and
+    density-of-states effective masses m_dos_n and m_dos_p.
+
+    The datasets must have the same temperatures. Returns a tuple of
+    (p_corrected, n_corrected) ZT datasets on the grids of the input
+    datasets, with fields 'n' (net doping level), 't', 'n_i', 'n_maj',
+    'n_min', 'sigma_*', 's_*', 'kappa_el_*', 'kappa_bip_*' (the bipolar
+    contribution to \\kappa_el), 'pf_*', 'kappa_latt_*', 'kappa_tot_*' and
+    'zt_*'.
+    """
+
+    n_p, t_p, data_2d_p = dataset_to_2d(p_data)
+    n_n, t_n, data_2d_n = dataset_to_2d(n_data)
+
+    if len(t_p) != len(t_n) or not np.allclose(t_p, t_n):
+        raise Exception("p- and n-type datasets must have the same "
+                        "temperatures.")
+
+    t = np.asarray(t_p, dtype=np.float64)
+
+    n_i = intrinsic_carrier_conc(t, e_g, m_dos_n=m_dos_n, m_dos_p=m_dos_p)
+
+    stack_p, log_mask, keys = _property_stack(data_2d_p)
+    stack_n, _, _ = _property_stack(data_2d_n)
+
+    res = []
+
+    num_clamped = 0
+
+    for n_net, data_2d, stack_maj, stack_min, n_maj_grid, n_min_grid in (
+            (n_p, data_2d_p, stack_p, stack_n, n_p, n_n),
+            (n_n, data_2d_n, stack_n, stack_p, n_n, n_p)):
+        n_maj, n_min = _carrier_concs(
+            np.asarray(n_net, dtype=np.float64)[:, np.newaxis],
+            n_i[np.newaxis, :])
+
+        maj, clamped_maj = _interpolate_carrier_conc(
+            n_maj_grid, stack_maj, log_mask, n_maj)
+
+        min_, clamped_min = _interpolate_carrier_conc(
+            n_min_grid, stack_min, log_mask, n_min)
+
+        num_clamped += clamped_maj + clamped_min
+
+        corr_2d = {'n_i': np.broadcast_to(n_i, n_maj.shape),
+                   'n_maj': n_maj, 'n_min': n_min}
+
+        corr_2d.update(_combine(t, maj, min_, keys))
+
+        for c in _BIPOLAR_COMPONENTS:
+            kappa_latt = data_2d['kappa_latt_{0}'.format(c)]
+            kappa_tot = corr_2d['kappa_el_{0}'.format(c)] + kappa_latt
+
+            corr_2d['kappa_latt_{0}'.format(c)] = kappa_latt
+            corr_2d['kappa_tot_{0}'.format(c)] = kappa_tot
+
+            corr_2d['zt_{0}'.format(c)] = (
+                (1.e-3 * corr_2d['pf_{0}'.format(c)]) / kappa_tot
+                    * t[np.newaxis, :])
+
+        res.append(dataset_from_2d(n_net, t, corr_2d))
+
+    if num_clamped > 0:
+        warnings.warn(
+            "{0} carrier concentration(s) above the range of the datasets "
+            "were clamped to the largest n.".format(num_clamped), UserWarning)
+
+    return tuple(res)
+
+@profile_stage
+def bipolar_zt_max(p_data, n_data, e_gs, m_dos_n=1., m_dos_p=1.,
+                   n_min=None, n_max=None, t_min=None, t_max=None):
+    """ Calculate ZT_max with bipolar corrections (see bipolar_correction())
+    for each of a set of band gaps e_gs, with optional bounds on n and T.
+
+    Returns a Pandas DataFrame with one row per band gap and carrier type,
+    with columns 'e_g', 'carrier_type' and the fields of the corrected ZT
+    datasets at ZT_max.
+    """
+
+    rows = []
+
+    for e_g in e_gs:
+        p_corr, n_corr = bipolar_correction(
+            p_data, n_data, e_g, m_dos_n=m_dos_n, m_dos_p=m_dos_p)
+
+        for carrier_type, data in ('p', p_corr), ('n', n_corr):
+            rec = get_zt_max(data, n_min=n_min, n_max=n_max, t_min=t_min,
+                             t_max=t_max)
+
+            rows.append(pd.concat(
+                [pd.Series({'e_g': e_g, 'carrier_type': carrier_type}), rec]))
+
+    return pd.DataFrame(rows).reset_index(drop=True)
@@ -0,0 +1,389 @@
+# zt_calc_workflow/cli.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Command-line interface for batch processing, run as
+"python -m zt_calc_workflow <subcommand> ...".
+
+Each subcommand processes either a single input set given on the command
+line or many input sets listed in a CSV manifest (--manifest), so that large
+batches do not pay the interpreter and import startup cost for every job.
+Heavy modules (Pandas, SciPy, Matplotlib) are only imported by the
+subcommands that need them.
+
+Manifests are CSV files with a header row naming the options for each input
+set, e.g. for the "zt" subcommand:
+
+    amset,kappa,output,kappa_axes
+    SnS-Pnma-AMSET-p.csv,SnS-kappa-m16816.Prim.csv,SnS-p.csv,yzx
+    SnS-Pnma-AMSET-n.csv,SnS-kappa-m16816.Prim.csv,SnS-n.csv,yzx
+
+Options not given in the manifest (or left blank) take the values given on
+the command line.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import argparse
+import csv
+import sys
+
+
+# ---------
+# Constants
+# ---------
+
+_CLI_FLOAT_OPTIONS = ['n', 'n_min', 'n_max', 't_min', 't_max']
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _get_input_sets(args, keys, required):
+    """ Build a list of input sets (dictionaries) from the manifest, if
+    specified, or otherwise from the command-line arguments. """
+
+    defaults = {k: getattr(args, k, None) for k in keys}
+
+    input_sets = []
+
+    if args.manifest is not None:
+        with open(args.manifest, 'r', newline='') as f:
+            for row in csv.DictReader(f):
+                input_set = dict(defaults)
+
+                for k, v in row.items():
+                    if k not in keys:
+                        raise Exception(
+                            "Unknown manifest column '{0}'.".format(k))
+
+                    if v is not None and v.strip() != '':
+                        input_set[k] = v.strip()
+
+                input_sets.append(input_set)
+    else:
+        input_sets.append(defaults)
+
+    for input_set in input_sets:
+        for k in required:
+            if input_set[k] is None:
+                raise Exception("Input '{0}' must be specified on the command "
+                                "line or in the manifest.".format(k))
+
+        for k in _CLI_FLOAT_OPTIONS:
+            if k in input_set and input_set[k] is not None:
+                input_set[k] = float(input_set[k])
+
+    return input_sets
+
+def _iter_zt_datasets(input_sets, max_workers):
+    """ Read the input sets concurrently and yield (input_set, ZT dataset)
+    tuples in the order of the input sets. """
+
+    from .dataset import zt_dataset_from_data
+    from .loader import iter_input_sets
+
+    for input_set, amset_data, kappa_data in iter_input_sets(
+            input_sets, max_workers=max_workers, ordered=True):
+        yield (input_set, zt_dataset_from_data(amset_data, kappa_data))
+
+
+# -----------
+# Subcommands
+# -----------
+
+def _cmd_zt(args):
+    """ Build ZT datasets and write them to CSV files or, for output files
+    with a .npz extension, chunked archives. """
+
+    input_sets = _get_input_sets(
+        args, ['amset', 'kappa', 'output', 'kappa_axes'],
+        ['amset', 'kappa', 'output'])
+
+    for input_set, data in _iter_zt_datasets(input_sets, args.jobs):
+        if input_set['output'].endswith('.npz'):
+            from .archive import save_zt_archive
+
+            save_zt_archive(input_set['output'], data)
+        else:
+            data.to_csv(input_set['output'], index=False)
+
+def _cmd_zt_max(args):
+    """ Locate ZT_max for each input set and write the records to a YAML,
+    JSON Lines or CSV file. """
+
+    from .analysis import get_zt_max
+    from .export import write_records, zt_max_record
+
+    input_sets = _get_input_sets(
+        args, ['amset', 'kappa', 'kappa_axes', 'system', 'carrier_type',
+               'n_min', 'n_max', 't_min', 't_max'],
+        ['amset', 'kappa'])
+
+    # The records are generated and written one input set at a time.
+
+    def zt_max_records():
+        for input_set, data in _iter_zt_datasets(input_sets, args.jobs):
+            rec = get_zt_max(
+                data, n_min=input_set['n_min'], n_max=input_set['n_max'],
+                t_min=input_set['t_min'], t_max=input_set['t_max'])
+
+            system = input_set['system']
+            carrier_type = input_set['carrier_type']
+
+            yield zt_max_record(
+                system if system is not None else input_set['amset'],
+                carrier_type if carrier_type is not None else '', rec)
+
+    write_records(args.output, zt_max_records(), file_format=args.format)
+
+def _cmd_match(args):
+    """ Match calculated properties to experimental data and write the results
+    to CSV files. """
+
+    import numpy as np
+
+    from .amset import read_amset_csv
+    from .analysis import match_data
+    from .dataset import dataset_to_2d
+
+    input_sets = _get_input_sets(
+        args, ['amset', 'expt', 'output', 'n', 'property', 'mode',
+               'reciprocal'],
+        ['amset', 'expt', 'output', 'property'])
+
+    calc_cache = {}
+
+    for input_set in input_sets:
+        if input_set['amset'] not in calc_cache:
+            calc_cache[input_set['amset']] = dataset_to_2d(
+                read_amset_csv(input_set['amset']))
+
+        calc_n, calc_t, calc_data_2d = calc_cache[input_set['amset']]
+
+        expt_data = np.loadtxt(input_set['expt'], delimiter=',', ndmin=2)
+
+        expt_t, expt_val = expt_data[:, 0], expt_data[:, 1]
+
+        # Optionally convert e.g. resistivity to conductivity.
+
+        reciprocal = input_set['reciprocal']
+
+        if reciprocal is True or str(reciprocal).lower() in ('true', '1'):
+            expt_val = 1. / expt_val
+
+        to_match = [(input_set['n'], t, v) for t, v in zip(expt_t, expt_val)]
+
+        res = match_data(calc_n, calc_t, calc_data_2d[input_set['property']],
+                         to_match, mode=input_set['mode'],
+                         num_seeds=args.num_seeds)
+
+        with open(input_set['output'], 'w', newline='') as f:
+            f_csv = csv.writer(f)
+
+            f_csv.writerow(['expt_n', 'expt_t', 'expt_val', 'calc_n',
+                            'calc_t', 'calc_val', 'diff'])
+
+            for (e_n, e_t, e_v), (c_n, c_t, c_v) in zip(to_match, res):
+                f_csv.writerow([e_n, e_t, e_v, c_n, c_t, float(c_v),
+                                float(c_v) - e_v])
+
+def _cmd_plot(args):
+    """ Render a ZT map for each input set with the report generator. """
+
+    from .report import render_report
+
+    input_sets = _get_input_sets(
+        args, ['amset', 'kappa', 'output', 'kappa_axes', 't_min', 't_max'],
+        ['amset', 'kappa', 'output'])
+
+    figures = [
+        {'renderer': 'zt_map',
+         'inputs': [input_set['amset'], input_set['kappa']],
+         'output': input_set['output'],
+         'params': {'kappa_axes': input_set['kappa_axes'],
+                    'key': args.property, 't_min': input_set['t_min'],
+                    't_max': input_set['t_max'], 'dpi': args.dpi}}
+            for input_set in input_sets]
+
+    status = render_report(figures, max_workers=args.jobs,
+                           cache_file=args.cache_file, force=args.force)
+
+    failed = [(k, v) for k, v in status.items() if v.startswith('failed')]
+
+    for output, v in failed:
+        print("{0}: {1}".format(output, v), file=sys.stderr)
+
+    if len(failed) > 0:
+        raise Exception("{0} figure(s) failed to render.".format(len(failed)))
+
+def _cmd_serve(args):
+    """ Run the local query service. """
+
+    from .service import run_service, set_dataset_cache_size
+
+    set_dataset_cache_size(args.cache_size)
+
+    run_service(host=args.host, port=args.port, path=args.socket,
+                max_workers=args.jobs)
+
+
+# -----------
+# Entry point
+# -----------
+
+def _build_parser():
+    """ Build the argument parser. """
+
+    parser = argparse.ArgumentParser(
+        prog='zt-calc', description="Batch ZT calculation workflow.")
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def _add_common(p, inputs):
+        for k in inputs:
+            p.add_argument(k, nargs='?', default=None)
+
+        p.add_argument('--manifest', default=None,
+                       help="CSV manifest listing many input sets.")
+
+    def _add_kappa_axes(p):
+        p.add_argument('--kappa-axes', default=None,
+                       help="AMSET axes corresponding to the Phono3py x, y "
+                            "and z axes, e.g. 'yzx'.")
+
+    def _add_jobs(p):
+        p.add_argument('--jobs', type=int, default=None,
+                       help="Number of threads reading input files.")
+
+    def _add_bounds(p, n_bounds=True):
+        if n_bounds:
+            p.add_argument('--n-min', type=float, default=None)
+            p.add_argument('--n-max', type=float, default=None)
+
+        p.add_argument('--t-min', type=float, default=None)
+        p.add_argument('--t-max', type=float, default=None)
+
+    # zt
+
+    p = subparsers.add_parser(
+        'zt', help="Build ZT datasets from AMSET and Phono3py CSV files.")
+
+    _add_common(p, ['amset', 'kappa', 'output'])
+    _add_kappa_axes(p)
+    _add_jobs(p)
+
+    p.set_defaults(func=_cmd_zt)
+
+    # zt-max
+
+    p = subparsers.add_parser(
+        'zt-max', help="Write a ZT_max summary to a YAML, JSON Lines or CSV "
+                       "file.")
+
+    _add_common(p, ['amset', 'kappa'])
+    _add_kappa_axes(p)
+    _add_bounds(p)
+    _add_jobs(p)
+
+    p.add_argument('--system', default=None)
+    p.add_argument('--carrier-type', default=None)
+    p.add_argument('-o', '--output', default="zt_max.yaml")
+
+    p.add_argument('--format', default=None,
+                   choices=['yaml', 'jsonl', 'csv'],
+                   help="Output format (default: from the output file "
+                        "extension).")
+
+    p.set_defaults(func=_cmd_zt_max)
+
+    # match
+
+    p = subparsers.add_parser(
+        'match', help="Match calculated properties to experimental data "
+                      "in two-column (T, value) CSV files.")
+
+    _add_common(p, ['amset', 'expt', 'output'])
+
+    p.add_argument('--n', type=float, default=None,
+                   help="Experimental carrier concentration.")
+
+    p.add_argument('--property', default='s_ave')
+
+    p.add_argument('--mode', default='same_t',
+                   choices=['same', 'same_t', 'same_n', 'best_match'])
+
+    p.add_argument('--num-seeds', type=int, default=1)
+
+    p.add_argument('--reciprocal', action='store_true',
+                   help="Match to the reciprocal of the experimental data "
+                        "(e.g. to convert resistivity to conductivity).")
+
+    p.set_defaults(func=_cmd_match)
+
+    # plot
+
+    p = subparsers.add_parser('plot', help="Render ZT maps.")
+
+    _add_common(p, ['amset', 'kappa', 'output'])
+    _add_kappa_axes(p)
+    _add_bounds(p, n_bounds=False)
+
+    p.add_argument('--property', default='zt_ave')
+    p.add_argument('--dpi', type=int, default=300)
+
+    p.add_argument('--jobs', type=int, default=None,
+                   help="Number of rendering processes.")
+
+    p.add_argument('--cache-file', default=None,
+                   help="Render cache file (figures with unchanged inputs "
+                        "and parameters are skipped).")
+
+    p.add_argument('--force', action='store_true',
+                   help="Render all figures, ignoring the cache.")
+
+    p.set_defaults(func=_cmd_plot)
+
+    # serve
+
+    p = subparsers.add_parser(
+        'serve', help="Run a local query service over ZT datasets.")
+
+    p.add_argument('--host', default=None,
+                   help="Host to listen on (default: 127.0.0.1).")
+
+    p.add_argument('--port', type=int, default=None,
+                   help="Port to listen on (default: 8765).")
+
+    p.add_argument('--socket', default=None,
+                   help="Listen on a Unix socket instead of a TCP port.")
+
+    p.add_argument('--jobs', type=int, default=None,
+                   help="Number of threads processing requests.")
+
+    p.add_argument('--cache-size', type=int, default=8,
+                   help="Maximum number of datasets to keep loaded.")
+
+    p.set_defaults(func=_cmd_serve)
+
+    return parser
+
+def main(argv=None):
+    """ Main entry point for the command-line interface. """
+
+    args = _build_parser().parse_args(argv)
+
+    try:
+        args.func(args)
+    except Exception as e:
+        print("zt-calc: error: {0}".format(e), file=sys.stderr)
+        return 1
+
+    return 0
@@ -0,0 +1,227 @@
+# zt_calc_workflow/compact.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for reducing the memory used by large datasets.
+
+The columns of a dataset are divided into property groups (see
+_COMPACT_PROPERTY_GROUPS), and a memory mode specifies which groups are
+stored as float32 and which are dropped. A memory mode is given either by
+name:
+
+    * 'full': all groups are stored as float64 (the default);
+    * 'compact': all groups are stored as float32; and
+    * 'minimal': as for 'compact', but the mobility, mobility decomposition
+      and off-diagonal groups are dropped;
+
+or as a dictionary with 'float32' and 'drop' lists of groups. The 'n' and
+'t' columns are always stored as float64, since they are used to index and
+align datasets.
+
+Memory modes are applied by the readers (read_amset_csv(),
+read_phono3py_kappa_csv()) and by zt_dataset_from_data() with the
+memory_mode keyword, and are recorded in DataFrame.attrs['memory_mode']
+together with the file the dataset was read from, so that dropped groups can
+be reloaded when needed with reload_property_groups().
+
+Checks, unit conversions and derived quantities (PF, \\kappa_tot, ZT) are
+computed in float64 before the results are stored, and dataset_to_2d(), the
+interpolation routines and the fitting routines convert data to float64
+before use.
+
+Error bound: storing a value as float32 introduces a relative error of at
+most 2^-24 (~6e-8) for values within the normal float32 range (~1.2e-38 to
+~3.4e38). Since ZT = 1e-3 PF T / (\\kappa_el + \\kappa_latt) is computed in
+float64 from stored PF, \\kappa_el and \\kappa_latt values (with T stored as
+float64), and \\kappa_el and \\kappa_latt are positive, the relative error in
+a stored ZT value is at most 4 x 2^-24 (~2.4e-7), i.e. an absolute error below
+1e-6 for ZT < 4.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import numpy as np
+
+
+# ---------
+# Constants
+# ---------
+
+# Components of the tensor properties in each group.
+
+_COMPACT_COMPONENTS = ['xx', 'yy', 'zz', 'ave']
+
+# Property groups, given as lists of property prefixes. The 'offdiagonal'
+# group contains the off-diagonal components of any property.
+
+_COMPACT_PROPERTY_GROUPS = {
+    'transport': ['sigma', 's', 'kappa_el', 'pf'],
+    'mobility': ['mu'],
+    'mobility_decomposition': ['mu_adp', 'mu_imp', 'mu_pie', 'mu_pop'],
+    'kappa': ['kappa', 'kappa_latt', 'kappa_tot'],
+    'zt': ['zt']}
+
+_COMPACT_OFFDIAGONAL_COMPONENTS = ['yz', 'xz', 'xy']
+
+_COMPACT_INDEX_COLUMNS = ['n', 't']
+
+_COMPACT_MEMORY_MODES = {
+    'full': {'float32': [], 'drop': []},
+    'compact': {
+        'float32': list(_COMPACT_PROPERTY_GROUPS.keys()) + ['offdiagonal'],
+        'drop': []},
+    'minimal': {
+        'float32': list(_COMPACT_PROPERTY_GROUPS.keys()),
+        'drop': ['mobility', 'mobility_decomposition', 'offdiagonal']}}
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _get_memory_mode(memory_mode):
+    """ Return a memory mode given by name or dictionary as a dictionary with
+    'float32' and 'drop' lists of groups. """
+
+    if isinstance(memory_mode, str):
+        if memory_mode not in _COMPACT_MEMORY_MODES:
+            raise Exception(
+                "Unknown memory_mode '{0}'.".format(memory_mode))
+
+        memory_mode = _COMPACT_MEMORY_MODES[memory_mode]
+
+    mode = {'float32': list(memory_mode.get('float32', [])),
+            'drop': list(memory_mode.get('drop', []))}
+
+    for g in mode['float32'] + mode['drop']:
+        if g not in _COMPACT_PROPERTY_GROUPS and g != 'offdiagonal':
+            raise Exception("Unknown property group '{0}'.".format(g))
+
+    return mode
+
+def _read_source(source):
+    """ Read the full dataset a compact dataset was read from. """
+
+    # Imported here to avoid a circular import.
+
+    from .amset import read_amset_csv
+    from .phono3py import read_phono3py_kappa_csv
+
+    readers = {'amset': read_amset_csv,
+               'phono3py_kappa': read_phono3py_kappa_csv}
+
+    return readers[source['reader']](source['file_path'], **source['kwargs'])
+
+
+# ---------
+# Functions
+# ---------
+
+def property_group_columns(columns, groups):
+    """ Return the columns in columns that belong to the specified property
+    groups. """
+
+    all_prefixes = [p for prefixes in _COMPACT_PROPERTY_GROUPS.values()
+                        for p in prefixes]
+
+    group_cols = set()
+
+    for g in groups:
+        if g == 'offdiagonal':
+            group_cols.update('{0}_{1}'.format(p, c)
+                                  for p in all_prefixes
+                                  for c in _COMPACT_OFFDIAGONAL_COMPONENTS)
+        else:
+            group_cols.update('{0}_{1}'.format(p, c)
+                                  for p in _COMPACT_PROPERTY_GROUPS[g]
+                                  for c in _COMPACT_COMPONENTS)
+
+    return [k for k in columns if k in group_cols]
+
+def apply_memory_mode(data, memory_mode, source=None):
+    """ Apply a memory mode (see module docstring) to a dataset in the form
+    of a Pandas DataFrame, modifying data in place. Groups already stored as
+    float32 or dropped are left as they are.
+
+    source optionally records how the dataset was read, as a dictionary with
+    keys 'reader', 'file_path' and 'kwargs', so that dropped groups can be
+    reloaded with reload_property_groups(). If source is not given, any
+    source already recorded in data is kept.
+    """
+
+    mode = _get_memory_mode(memory_mode)
+
+    prev = data.attrs.get('memory_mode', {})
+
+    drop_cols = property_group_columns(data.columns, mode['drop'])
+
+    data.drop(columns=drop_cols, inplace=True)
+
+    float32_cols = [
+        k for k in property_group_columns(data.columns, mode['float32'])
+            if data[k].dtype != np.float32]
+
+    if len(float32_cols) > 0:
+        data[float32_cols] = data[float32_cols].astype(np.float32)
+
+    data.attrs['memory_mode'] = {
+        'float32': mode['float32'], 'drop': mode['drop'],
+        'dropped': list(prev.get('dropped', [])) + drop_cols,
+        'source': source if source is not None else prev.get('source')}
+
+    return data
+
+def reload_property_groups(data, groups=None):
+    """ Reload dropped property groups (default: all dropped groups) in a
+    dataset with a memory mode applied, by reading them from the file the
+    dataset was read from. Reloaded groups are stored as float32 if they are
+    in the 'float32' list of the memory mode. Returns a new DataFrame. """
+
+    mode = data.attrs.get('memory_mode')
+
+    if mode is None or len(mode['dropped']) == 0:
+        return data.copy()
+
+    if mode['source'] is None:
+        raise Exception("Dataset does not record the file it was read from - "
+                        "dropped property groups cannot be reloaded.")
+
+    if groups is None:
+        groups = mode['drop']
+
+    reload_cols = [k for k in property_group_columns(mode['dropped'], groups)
+                       if k not in data.columns]
+
+    source_data = _read_source(mode['source'])
+
+    # Rows are aligned on n and/or T, so datasets that have been filtered or
+    # reordered since they were read can still be reloaded.
+
+    index_cols = [k for k in _COMPACT_INDEX_COLUMNS
+                      if k in source_data.columns]
+
+    res = data.merge(source_data[index_cols + reload_cols], how='left',
+                     on=index_cols)
+
+    res.index = data.index
+
+    float32_cols = property_group_columns(reload_cols, mode['float32'])
+
+    if len(float32_cols) > 0:
+        res[float32_cols] = res[float32_cols].astype(np.float32)
+
+    res.attrs['memory_mode'] = dict(
+        mode, dropped=[k for k in mode['dropped'] if k not in reload_cols])
+
+    return res
+
+def memory_usage(data):
+    """ Return the memory used by a dataset in bytes. """
+
+    return int(data.memory_usage(index=True, deep=True).sum())
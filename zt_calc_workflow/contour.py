@@ -0,0 +1,326 @@
+# zt_calc_workflow/contour.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for extracting iso-contours from 2D (n, T) data, as returned by
+dataset.dataset_to_2d(), without Matplotlib, e.g. to find where ZT crosses a
+target value in screening workflows.
+
+Contours are found with a vectorized marching squares algorithm on the
+(log n, T) grid, with crossing points found by linear interpolation along
+the cell edges. Saddle cells are resolved using the average of the four
+corner values.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import numpy as np
+
+from .profiling import profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+# Cell edges are numbered 0 = bottom (i, j) -> (i + 1, j), 1 = right
+# (i + 1, j) -> (i + 1, j + 1), 2 = top (i, j + 1) -> (i + 1, j + 1) and
+# 3 = left (i, j) -> (i, j + 1), where i indexes n and j indexes T.
+
+# Cell cases are indexed by a bit mask of corners with values >= the contour
+# level, with bits 0 = (i, j), 1 = (i + 1, j), 2 = (i + 1, j + 1) and
+# 3 = (i, j + 1). Each case has up to two segments, given as pairs of edges,
+# with -1 for no segment. Saddle cases (5 and 10) are given for a centre
+# value below the level, and swapped in _CONTOUR_SADDLE_SEGMENTS otherwise.
+
+_CONTOUR_SEGMENTS = np.array([
+    [[-1, -1], [-1, -1]], [[3, 0], [-1, -1]], [[0, 1], [-1, -1]],
+    [[3, 1], [-1, -1]], [[1, 2], [-1, -1]], [[3, 0], [1, 2]],
+    [[0, 2], [-1, -1]], [[2, 3], [-1, -1]], [[2, 3], [-1, -1]],
+    [[0, 2], [-1, -1]], [[0, 1], [2, 3]], [[1, 2], [-1, -1]],
+    [[3, 1], [-1, -1]], [[0, 1], [-1, -1]], [[3, 0], [-1, -1]],
+    [[-1, -1], [-1, -1]]])
+
+_CONTOUR_SADDLE_SEGMENTS = {
+    5: np.array([[0, 1], [2, 3]]), 10: np.array([[3, 0], [1, 2]])}
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _edge_crossings(x, y, data_2d, level):
+    """ Return the crossing coordinates and a mask of crossings for the
+    horizontal (along x) and vertical (along y) edges of the grid. Edges
+    with an undefined (NaN) end are not counted as crossings. """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Horizontal edges: (i, j) -> (i + 1, j).
+
+        v_a, v_b = data_2d[:-1, :], data_2d[1:, :]
+
+        f = (level - v_a) / (v_b - v_a)
+
+        h_mask = np.logical_and.reduce(
+            [(v_a >= level) != (v_b >= level), np.isfinite(v_a),
+             np.isfinite(v_b)])
+        h_x = x[:-1, np.newaxis] + f * np.diff(x)[:, np.newaxis]
+        h_y = np.broadcast_to(y[np.newaxis, :], h_x.shape)
+
+        # Vertical edges: (i, j) -> (i, j + 1).
+
+        v_a, v_b = data_2d[:, :-1], data_2d[:, 1:]
+
+        f = (level - v_a) / (v_b - v_a)
+
+        v_mask = np.logical_and.reduce(
+            [(v_a >= level) != (v_b >= level), np.isfinite(v_a),
+             np.isfinite(v_b)])
+        v_y = y[np.newaxis, :-1] + f * np.diff(y)[np.newaxis, :]
+        v_x = np.broadcast_to(x[:, np.newaxis], v_y.shape)
+
+    return (h_x, h_y, h_mask), (v_x, v_y, v_mask)
+
+def _cell_cases(data_2d, level):
+    """ Return the marching squares case for each cell, with -1 for cells
+    with undefined (NaN) corner values, and a mask of saddle cells with
+    centre values >= level. """
+
+    corners = [data_2d[:-1, :-1], data_2d[1:, :-1], data_2d[1:, 1:],
+               data_2d[:-1, 1:]]
+
+    case = np.zeros(corners[0].shape, dtype=np.int64)
+
+    for bit, v in enumerate(corners):
+        case |= (v >= level).astype(np.int64) << bit
+
+    undefined = np.logical_or.reduce([np.isnan(v) for v in corners])
+
+    case[undefined] = -1
+
+    centre_above = (sum(corners) / 4.) >= level
+
+    saddle_above = np.logical_and(np.isin(case, [5, 10]), centre_above)
+
+    return case, saddle_above
+
+def _shoelace(px, py):
+    """ Return the area of polygons with vertices px, py along the last axis
+    with the shoelace formula. """
+
+    return 0.5 * np.abs(
+        (px * np.roll(py, -1, axis=-1) - np.roll(px, -1, axis=-1) * py)
+            .sum(axis=-1))
+
+
+# ---------
+# Functions
+# ---------
+
+@profile_stage
+def find_contours(n, t, data_2d, level):
+    """ Find the contours at level in data_2d on the grid (n, t), and return
+    a list of polylines as (num_points, 2) arrays of (n, T). Closed contours
+    have the same first and last point. """
+
+    x = np.log10(np.asarray(n, dtype=np.float64))
+    y = np.asarray(t, dtype=np.float64)
+
+    data_2d = np.asarray(data_2d, dtype=np.float64)
+
+    num_x, num_y = data_2d.shape
+
+    (h_x, h_y, _), (v_x, v_y, _) = _edge_crossings(x, y, data_2d, level)
+
+    case, saddle_above = _cell_cases(data_2d, level)
+
+    # Look up segments for each cell.
+
+    seg = _CONTOUR_SEGMENTS[np.where(case >= 0, case, 0)]
+    seg[case < 0] = -1
+
+    for c, s in _CONTOUR_SADDLE_SEGMENTS.items():
+        seg[np.logical_and(case == c, saddle_above)] = s
+
+    # Convert cell edges to global edge indices, numbering horizontal edges
+    # (i, j) as i * num_y + j and vertical edges (i, j) as
+    # num_h + i * (num_y - 1) + j.
+
+    num_h = (num_x - 1) * num_y
+
+    i, j = np.meshgrid(np.arange(num_x - 1), np.arange(num_y - 1),
+                       indexing='ij')
+
+    edge_ids = np.stack(
+        [i * num_y + j, num_h + (i + 1) * (num_y - 1) + j,
+         i * num_y + j + 1, num_h + i * (num_y - 1) + j], axis=-1)
+
+    seg = seg.reshape(-1, 2, 2)
+    edge_ids = edge_ids.reshape(-1, 4)
+
+    cell_idx, seg_idx = np.nonzero(seg[:, :, 0] >= 0)
+
+    seg_edges = np.take_along_axis(
+        edge_ids[cell_idx], seg[cell_idx, seg_idx], axis=1)
+
+    if len(seg_edges) == 0:
+        return []
+
+    edge_x = np.concatenate([h_x.ravel(), v_x.ravel()])
+    edge_y = np.concatenate([h_y.ravel(), v_y.ravel()])
+
+    # Join segments into polylines. Each edge is shared by at most two
+    # segments, so polylines can be traced by walking from segment to
+    # segment through shared edges, starting with open polylines (with an
+    # end on the boundary of the grid) and then closed ones.
+
+    edge_segs = {}
+
+    for k, (e_a, e_b) in enumerate(seg_edges.tolist()):
+        edge_segs.setdefault(e_a, []).append(k)
+        edge_segs.setdefault(e_b, []).append(k)
+
+    used = np.zeros(len(seg_edges), dtype=bool)
+
+    starts = [e for e, segs in edge_segs.items() if len(segs) == 1]
+    starts += [e for e, segs in edge_segs.items() if len(segs) > 1]
+
+    polylines = []
+
+    for e_start in starts:
+        if all(used[k] for k in edge_segs[e_start]):
+            continue
+
+        path = [e_start]
+        e = e_start
+
+        while True:
+            next_segs = [k for k in edge_segs[e] if not used[k]]
+
+            if len(next_segs) == 0:
+                break
+
+            k = next_segs[0]
+            used[k] = True
+
+            e_a, e_b = seg_edges[k]
+            e = e_b if e_a == e else e_a
+
+            path.append(e)
+
+        path = np.array(path)
+
+        polylines.append(np.array(
+            [np.power(10., edge_x[path]), edge_y[path]]).T)
+
+    return polylines
+
+@profile_stage
+def contour_metrics(n, t, data_2d, level):
+    """ Calculate metrics for the region of the grid (n, t) where data_2d is
+    >= level, and return a dictionary with:
+
+        * 'n_min', 'n_max', 't_min', 't_max': the range of n and T spanned
+          by the region (NaN if data_2d is nowhere >= level);
+        * 'area': the area of the region in (log10 n, T) space (decades K);
+        * 'area_fraction': the fraction of the grid covered by the region.
+
+    The boundary of the region is found by linear interpolation as for
+    find_contours().
+    """
+
+    x = np.log10(np.asarray(n, dtype=np.float64))
+    y = np.asarray(t, dtype=np.float64)
+
+    data_2d = np.asarray(data_2d, dtype=np.float64)
+
+    (h_x, h_y, h_mask), (v_x, v_y, v_mask) = _edge_crossings(
+        x, y, data_2d, level)
+
+    above = data_2d >= level
+
+    # Range: grid points in the region plus the boundary crossings.
+
+    g_x, g_y = np.meshgrid(x, y, indexing='ij')
+
+    r_x = np.concatenate([g_x[above], h_x[h_mask], v_x[v_mask]])
+    r_y = np.concatenate([g_y[above], h_y[h_mask], v_y[v_mask]])
+
+    metrics = {}
+
+    if len(r_x) > 0:
+        metrics['n_min'] = np.power(10., r_x.min())
+        metrics['n_max'] = np.power(10., r_x.max())
+        metrics['t_min'] = r_y.min()
+        metrics['t_max'] = r_y.max()
+    else:
+        for k in 'n_min', 'n_max', 't_min', 't_max':
+            metrics[k] = np.nan
+
+    # Area: for each cell, the polygon enclosing the region is formed by the
+    # corners >= level and the crossing points, in order around the cell.
+    # Vertices not in the polygon are replaced by the previous vertex
+    # (cyclically), which adds zero-length edges that do not contribute to
+    # the area, so that the shoelace formula can be applied to all cells at
+    # once.
+
+    cx = [g_x[:-1, :-1], h_x[:, :-1], g_x[1:, :-1], v_x[1:, :],
+          g_x[1:, 1:], h_x[:, 1:], g_x[:-1, 1:], v_x[:-1, :]]
+
+    cy = [g_y[:-1, :-1], h_y[:, :-1], g_y[1:, :-1], v_y[1:, :],
+          g_y[1:, 1:], h_y[:, 1:], g_y[:-1, 1:], v_y[:-1, :]]
+
+    inc = [above[:-1, :-1], h_mask[:, :-1], above[1:, :-1], v_mask[1:, :],
+           above[1:, 1:], h_mask[:, 1:], above[:-1, 1:], v_mask[:-1, :]]
+
+    cx, cy, inc = (np.stack(a, axis=-1).reshape(-1, 8) for a in (cx, cy, inc))
+
+    # Cyclic forward fill of the vertex indices.
+
+    idx = np.where(inc, np.arange(8), -1)
+    idx = np.maximum.accumulate(idx, axis=1)
+
+    last = idx[:, -1:]
+    idx = np.where(idx < 0, last, idx)
+
+    # Cells with undefined (NaN) corners (e.g. outside the range of a
+    # dataset resampled with resample.resample_datasets()) are excluded.
+
+    case, saddle_above = _cell_cases(data_2d, level)
+
+    case, saddle_above = case.ravel(), saddle_above.ravel()
+
+    cells = np.nonzero(np.logical_and(last[:, 0] >= 0, case >= 0))[0]
+
+    px = np.take_along_axis(cx[cells], idx[cells], axis=1)
+    py = np.take_along_axis(cy[cells], idx[cells], axis=1)
+
+    cell_area = _shoelace(px, py)
+
+    # For saddle cells with a centre value below the level, the polygon
+    # includes a quadrilateral between the four crossing points in the middle
+    # of the cell that is not in the region.
+
+    case, saddle_above = case[cells], saddle_above[cells]
+
+    saddle_below = np.logical_and(np.isin(case, [5, 10]), ~saddle_above)
+
+    if saddle_below.any():
+        edges = [1, 3, 5, 7]
+
+        cell_area[saddle_below] -= _shoelace(
+            cx[cells][saddle_below][:, edges],
+            cy[cells][saddle_below][:, edges])
+
+    metrics['area'] = cell_area.sum()
+
+    metrics['area_fraction'] = metrics['area'] / (
+        (x.max() - x.min()) * (y.max() - y.min()))
+
+    return metrics
@@ -13,82 +13,143 @@
 # -------
 
 import numpy as np
-
+import pandas as pd
 
 from .amset import read_amset_csv
+from .compact import apply_memory_mode
 from .phono3py import read_phono3py_kappa_csv
+from .profiling import count_result_rows, profile_stage
 
 
 # ----------------
 # Dataset creation
 # ----------------
 
-def zt_dataset_from_data(elec_prop_data, kappa_latt_data):
-    """ Combine electrical properties and lattice thermal conductivity data
-    to create a new Pandas DataFrame with a ZT dataset. The new DataFrame
-    has the same fields as elec_prop_data plus 'kappa_latt_*', 'kappa_tot_*'
-    and 'zt_*' fields. """
+def calculate_kappa_tot_zt(zt_data):
+    """ (Re)calculate the 'kappa_tot_*' and 'zt_*' fields in a ZT dataset
+    from the 'kappa_el_*', 'kappa_latt_*' and 'pf_*' fields. zt_data is
+    modified in place. The calculations are performed in float64, including
+    for datasets with columns stored as float32 (see compact.py). """
+
+    def _col(k):
+        return zt_data[k].to_numpy(dtype=np.float64)
+
+    # Calculate \kappa_tot.
+
+    key_sets = [('kappa_el_xx', 'kappa_latt_xx', 'kappa_tot_xx'),
+                ('kappa_el_yy', 'kappa_latt_yy', 'kappa_tot_yy'),
+                ('kappa_el_zz', 'kappa_latt_zz', 'kappa_tot_zz'),
+                ('kappa_el_ave', 'kappa_latt_ave', 'kappa_tot_ave')]
+
+    kappa_tot = {}
+
+    for k_el, k_latt, k_tot in key_sets:
+        kappa_tot[k_tot] = _col(k_el) + _col(k_latt)
+        zt_data[k_tot] = kappa_tot[k_tot]
+
+    # Calculate ZT.
+
+    key_sets = [('pf_xx', 'kappa_tot_xx', 'zt_xx'),
+                ('pf_yy', 'kappa_tot_yy', 'zt_yy'),
+                ('pf_zz', 'kappa_tot_zz', 'zt_zz'),
+                ('pf_ave', 'kappa_tot_ave', 'zt_ave')]
+
+    for k_pf, k_kappa, k_zt in key_sets:
+        zt_data[k_zt] = (
+            ((1.0e-3 * _col(k_pf)) / kappa_tot[k_kappa]) * _col('t'))
+
+def kappa_latt_columns(t, kappa_latt_data):
+    """ Look up the \\kappa_latt at each of a set of temperatures t (e.g. the
+    't' column of an electrical properties dataset) in a Phono3py kappa
+    dataset, and return a dictionary of 'kappa_latt_*' arrays. """
+
+    t = np.asarray(t)
 
-    elec_t = elec_prop_data['t'].unique()
     kappa_latt_t = kappa_latt_data['t'].to_numpy()
 
+    # Each temperature is matched exactly to a row in the Phono3py data with
+    # a binary search on the sorted temperatures.
+
+    order = np.argsort(kappa_latt_t, kind='stable')
+    sorted_t = kappa_latt_t[order]
+
+    pos = np.clip(np.searchsorted(sorted_t, t), 0, len(sorted_t) - 1)
+
     # Check temperatures in AMSET calculation are covered by the Phono3py
     # calculation.
 
-    for t in elec_t:
-        if t not in kappa_latt_t:
-            raise Exception("Phono3py calculation must cover the temperature "
-                            "range of the AMSET calculation.")
+    if len(sorted_t) == 0 or (sorted_t[pos] != t).any():
+        raise Exception("Phono3py calculation must cover the temperature "
+                        "range of the AMSET calculation.")
 
-    zt_data = elec_prop_data.copy()
+    idx = order[pos]
 
-    # Append \kappa_latt columns to ZT data.
+    kl_cols = {}
+
+    for c in 'xx', 'yy', 'zz', 'ave':
+        kl_cols['kappa_latt_{0}'.format(c)] = (
+            kappa_latt_data['kappa_{0}'.format(c)].to_numpy()[idx])
+
+    return kl_cols
 
-    kl_cols = [[] for _ in range(4)]
+@profile_stage
+def zt_dataset_from_data(elec_prop_data, kappa_latt_data, lorenz_model=None,
+                         memory_mode=None):
+    """ Combine electrical properties and lattice thermal conductivity data
+    to create a new Pandas DataFrame with a ZT dataset. The new DataFrame
+    has the same fields as elec_prop_data plus 'kappa_latt_*', 'kappa_tot_*'
+    and 'zt_*' fields.
+
+    If lorenz_model is set, the 'kappa_el_*' fields are recomputed from the
+    conductivity and Seebeck coefficient with the specified Lorenz number
+    model (see lorenz.recompute_kappa_el()).
 
-    for t in zt_data['t']:
-        (loc, ), = np.where(kappa_latt_t == t)
+    memory_mode optionally specifies a memory mode to apply to the ZT dataset
+    (see compact.py). If not set, any memory mode applied to elec_prop_data
+    is also applied to the new fields.
+    """
+
+    kl_cols = kappa_latt_columns(elec_prop_data['t'], kappa_latt_data)
 
-        for i, k in enumerate(
-                ['kappa_xx', 'kappa_yy', 'kappa_zz', 'kappa_ave']):
-            kl_cols[i].append(kappa_latt_data.loc[loc, k])
+    zt_data = elec_prop_data.copy()
 
-    kl_keys = ['kappa_latt_xx', 'kappa_latt_yy', 'kappa_latt_zz', 'kappa_latt_ave']
+    # Append \kappa_latt columns to ZT data.
 
-    for k, col in zip(kl_keys, kl_cols):
+    for k, col in kl_cols.items():
         zt_data[k] = col
 
-    # Calculate and append \kappa_tot columns to AMSET data.
+    # If requested, recompute \kappa_el with a Lorenz number model.
 
-    key_sets = [('kappa_el_xx', 'kappa_latt_xx', 'kappa_tot_xx'),
-                ('kappa_el_yy', 'kappa_latt_yy', 'kappa_tot_yy'),
-                ('kappa_el_zz', 'kappa_latt_zz', 'kappa_tot_zz'),
-                ('kappa_el_ave', 'kappa_latt_ave', 'kappa_tot_ave')]
+    if lorenz_model is not None:
+        # Imported here to avoid a circular import.
 
-    for k_el, k_latt, k_tot in key_sets:
-        zt_data[k_tot] = zt_data[k_el] + zt_data[k_latt]
+        from .lorenz import recompute_kappa_el
 
-    # Calculate and append ZT columns to AMSET data.
+        recompute_kappa_el(zt_data, lorenz_model=lorenz_model, inplace=True)
 
-    key_sets = [('pf_xx', 'kappa_tot_xx', 'zt_xx'),
-                ('pf_yy', 'kappa_tot_yy', 'zt_yy'),
-                ('pf_zz', 'kappa_tot_zz', 'zt_zz'),
-                ('pf_ave', 'kappa_tot_ave', 'zt_ave')]
+    calculate_kappa_tot_zt(zt_data)
 
-    for k_pf, k_kappa, k_zt in key_sets:
-        zt_data[k_zt] = (
-            ((1.0e-3 * zt_data[k_pf]) / zt_data[k_kappa]) * zt_data['t'])
+    if memory_mode is None:
+        memory_mode = elec_prop_data.attrs.get('memory_mode')
+
+    if memory_mode is not None:
+        apply_memory_mode(zt_data, memory_mode)
 
     return zt_data
 
-def zt_dataset_from_amset_phono3py_csvs(amset_file, phono3py_kappa_file):
+@profile_stage
+def zt_dataset_from_amset_phono3py_csvs(amset_file, phono3py_kappa_file,
+                                        memory_mode=None):
     """ Reads an AMSET CSV and Phono3py kappa CSV file and return a ZT dataset
-    from zt_dataset_from_data(). """
+    from zt_dataset_from_data(), optionally with a memory mode applied (see
+    compact.py). """
 
-    elec_prop_data = read_amset_csv(amset_file, convert_sigma_s_cm=True,
+    elec_prop_data = read_amset_csv(amset_file, memory_mode=memory_mode,
+                                    convert_sigma_s_cm=True,
                                     calculate_pf_mw_m_k2=True)
 
-    kappa_latt_data = read_phono3py_kappa_csv(phono3py_kappa_file)
+    kappa_latt_data = read_phono3py_kappa_csv(
+        phono3py_kappa_file, memory_mode=memory_mode)
 
     return zt_dataset_from_data(elec_prop_data, kappa_latt_data)
 
@@ -97,6 +158,7 @@ def zt_dataset_from_amset_phono3py_csvs(amset_file, phono3py_kappa_file):
 # 1D -> 2D conversion
 # -------------------
 
+@profile_stage
 def dataset_to_2d(data):
     """ Convert a dataset as a Pandas DataFrame to a set of n and T values and
     a dictionary of 2D NumPy arrays for each data column.
@@ -115,19 +177,51 @@ def dataset_to_2d(data):
     n_vals = data['n'].unique()
     t_vals = data['t'].unique()
 
-    # Cast remaining columns into 2D arrays indexed by n (x) and T (y).
+    # Once sorted, a uniform dataset has len(t_vals) rows for each n, and the
+    # remaining columns can be cast into 2D arrays indexed by n (x) and T (y)
+    # with a reshape.
 
     shape = (len(n_vals), len(t_vals))
 
+    if len(data) != shape[0] * shape[1]:
+        raise Exception("Dataset does not have a uniform set of n and T.")
+
+    # A matching number of rows is not sufficient (e.g. one missing and one
+    # duplicated (n, T) pair), so also check that each row of the reshaped
+    # data has all the T values and each column all the n values.
+
+    n_2d = data['n'].to_numpy().reshape(shape)
+    t_2d = data['t'].to_numpy().reshape(shape)
+
+    if not ((n_2d == n_vals[:, np.newaxis]).all()
+                and (t_2d == t_vals[np.newaxis, :]).all()):
+        raise Exception("Dataset does not have a uniform set of n and T.")
+
     data_2d = {}
 
     for k in data.columns:
         if k != 'n' and k != 't':
-            arr = np.zeros(shape, dtype=np.float64)
+            data_2d[k] = data[k].to_numpy(dtype=np.float64).reshape(shape)
 
-            for i, n in enumerate(n_vals):
-                arr[i, :] = data[data['n'] == n][k]
+    return (n_vals, t_vals, data_2d)
 
-            data_2d[k] = arr
+@profile_stage(count_rows=count_result_rows)
+def dataset_from_2d(n_vals, t_vals, data_2d):
+    """ Convert a set of n and T values and a dictionary of 2D NumPy arrays,
+    e.g. as returned by dataset_to_2d(), back to a dataset as a Pandas
+    DataFrame sorted by n and then by T. """
 
-    return (n_vals, t_vals, data_2d)
+    shape = (len(n_vals), len(t_vals))
+
+    n_col, t_col = np.meshgrid(n_vals, t_vals, indexing='ij')
+
+    cols = {'n': n_col.ravel(), 't': t_col.ravel()}
+
+    for k, arr in data_2d.items():
+        if np.shape(arr) != shape:
+            raise Exception("Shape of data '{0}' does not match the number "
+                            "of n and T values.".format(k))
+
+        cols[k] = np.asarray(arr).ravel()
+
+    return pd.DataFrame(cols)
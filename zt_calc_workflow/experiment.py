@@ -0,0 +1,179 @@
+# zt_calc_workflow/experiment.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for loading experimental data and comparing it to calculations.
+
+Experimental data are typically digitised from figures with WebPlotDigitizer
+(https://automeris.io/) as two-column (T, value) CSV files, one per sample
+and property. A set of files is described by a list of specifications, each a
+dictionary with:
+
+    * 'file': the CSV file;
+    * 'sample': a sample label;
+    * 'property': the property, e.g. 'sigma' or 's';
+    * 'n': an optional (nominal) carrier concentration for the sample;
+    * 'transform': an optional unit transform for the values, given as the
+      name of one of the transforms in _EXPT_TRANSFORMS (e.g.
+      'rho_ohm_cm_to_sigma_s_cm' to convert resistivity to conductivity), a
+      callable, or a list of these; and
+    * 't_transform': an optional transform for the temperatures (e.g.
+      'c_to_k').
+
+load_expt_data() reads the files into a single "tidy" Pandas DataFrame with
+one row per data point, and match_expt_data() matches all the data for each
+property to a calculation with one call to analysis.match_data().
+"""
+
+
+# -------
+# Imports
+# -------
+
+import numpy as np
+import pandas as pd
+
+from .analysis import match_data
+from .profiling import count_result_rows, profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+# Unit transforms for experimental data. The calculated properties are
+# \sigma in S/cm and S in uV/K.
+
+_EXPT_TRANSFORMS = {
+    'reciprocal': lambda v: 1. / v,
+    'rho_ohm_cm_to_sigma_s_cm': lambda v: 1. / v,
+    'rho_mohm_cm_to_sigma_s_cm': lambda v: 1.e3 / v,
+    'rho_ohm_m_to_sigma_s_cm': lambda v: 1.e-2 / v,
+    'sigma_s_m_to_s_cm': lambda v: 1.e-2 * v,
+    's_mv_k_to_uv_k': lambda v: 1.e3 * v,
+    's_v_k_to_uv_k': lambda v: 1.e6 * v,
+    'negate': lambda v: -1. * v,
+    'c_to_k': lambda v: v + 273.15}
+
+# Default mapping of experimental properties to calculated data.
+
+_EXPT_PROPERTY_MAP = {
+    'sigma': 'sigma_ave', 's': 's_ave', 'pf': 'pf_ave',
+    'kappa_el': 'kappa_el_ave', 'zt': 'zt_ave'}
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _apply_transform(v, transform):
+    """ Apply a transform or list of transforms to the array v. """
+
+    if transform is None:
+        return v
+
+    if isinstance(transform, (list, tuple)):
+        for t in transform:
+            v = _apply_transform(v, t)
+
+        return v
+
+    if callable(transform):
+        return transform(v)
+
+    if transform not in _EXPT_TRANSFORMS:
+        raise Exception("Unknown transform '{0}'.".format(transform))
+
+    return _EXPT_TRANSFORMS[transform](v)
+
+
+# ---------
+# Functions
+# ---------
+
+def read_expt_data_csv(file_path):
+    """ Read experimental data from a two-column CSV file and return a
+    (num_points, 2) NumPy array. """
+
+    return np.loadtxt(file_path, delimiter=',', ndmin=2, dtype=np.float64)
+
+@profile_stage(count_rows=count_result_rows)
+def load_expt_data(specs):
+    """ Load a set of experimental data files from a list of specifications
+    (see module docstring) and return a Pandas DataFrame with columns
+    'sample', 'property', 'n', 't' and 'val'. """
+
+    blocks = []
+
+    for spec in specs:
+        data = read_expt_data_csv(spec['file'])
+
+        t = _apply_transform(data[:, 0], spec.get('t_transform'))
+        val = _apply_transform(data[:, 1], spec.get('transform'))
+
+        n = spec.get('n')
+
+        blocks.append(pd.DataFrame(
+            {'sample': spec['sample'], 'property': spec['property'],
+             'n': np.nan if n is None else n, 't': t, 'val': val}))
+
+    return pd.concat(blocks, ignore_index=True)
+
+@profile_stage(count_rows=count_result_rows)
+def match_expt_data(calc_n, calc_t, calc_data_2d, expt_data,
+                    property_map=None, mode='same_t', num_seeds=1,
+                    cache_key=None):
+    """ Match experimental data from load_expt_data() to calculated data as
+    returned by dataset_to_2d(), using match_data() with the specified mode
+    and num_seeds.
+
+    property_map is a dictionary mapping experimental properties to keys in
+    calc_data_2d (default: _EXPT_PROPERTY_MAP, e.g. 'sigma' -> 'sigma_ave').
+
+    If cache_key is set to a key identifying the calculated data, the
+    interpolants for each property are cached (see interpolation.py), so
+    that repeated comparisons with the same calculation (e.g. several sets of
+    experimental data) reuse them.
+
+    Returns a copy of expt_data with additional columns 'calc_n', 'calc_t',
+    'calc_val' and 'diff' (calc_val - val).
+    """
+
+    if property_map is None:
+        property_map = _EXPT_PROPERTY_MAP
+
+    res_data = expt_data.copy()
+
+    res = np.full((len(expt_data), 3), np.nan)
+
+    # All the data for each property (i.e. all samples and temperatures) are
+    # matched with one call to match_data().
+
+    for prop, idx in expt_data.groupby('property', sort=False).indices.items():
+        if prop not in property_map:
+            raise Exception(
+                "No calculated data mapped to property '{0}'.".format(prop))
+
+        rows = expt_data.iloc[idx]
+
+        to_match = [(None if np.isnan(n) else n, t, v)
+                        for n, t, v in zip(rows['n'], rows['t'], rows['val'])]
+
+        key = property_map[prop]
+
+        res[idx] = np.array(
+            match_data(calc_n, calc_t, calc_data_2d[key], to_match,
+                       mode=mode, num_seeds=num_seeds,
+                       cache_key=(None if cache_key is None
+                                      else (cache_key, key))),
+            dtype=np.float64)
+
+    res_data['calc_n'] = res[:, 0]
+    res_data['calc_t'] = res[:, 1]
+    res_data['calc_val'] = res[:, 2]
+    res_data['diff'] = res_data['calc_val'] - res_data['val']
+
+    return res_data
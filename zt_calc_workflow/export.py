@@ -0,0 +1,289 @@
+# zt_calc_workflow/export.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for writing and reading ZT_max and other summary records.
+
+A record is a flat dictionary (or Pandas Series) of values, e.g. a row
+returned by analysis.get_zt_max() with the system, carrier type and any other
+metadata added with zt_max_record(). Records can be written to and read back
+from:
+
+    * YAML (.yaml, .yml), in the same layout as the zt_max_yaml.py example,
+      with 'n' and 't' written as 'carrier_conc' and 'temp' and tensor
+      properties ('*_xx', '*_yy', '*_zz', '*_ave') written as blocks;
+    * JSON Lines (.jsonl), with one JSON object per record; or
+    * CSV (.csv), with one row per record.
+
+Records are written from, and read back into, iterators, and output is
+buffered in batches, so memory use does not depend on the number of
+records.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import csv
+import json
+import os
+
+import numpy as np
+
+
+# ---------
+# Constants
+# ---------
+
+_EXPORT_TENSOR_SUFFIXES = ['xx', 'yy', 'zz', 'ave']
+
+_EXPORT_YAML_KEY_MAP = {'n': 'carrier_conc', 't': 'temp'}
+
+_EXPORT_DEFAULT_BATCH_SIZE = 1000
+
+# Characters that cannot start a plain (unquoted) YAML scalar, and plain
+# scalars that YAML reads as booleans or nulls rather than strings.
+
+_EXPORT_YAML_INDICATORS = '-?:,[]{}#&*!|>\'"%@`'
+
+_EXPORT_YAML_RESERVED = [
+    '', '~', 'null', 'true', 'false', 'yes', 'no', 'on', 'off']
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _get_format(file_path, file_format):
+    """ Determine the file format from file_format or the file extension. """
+
+    if file_format is None:
+        ext = os.path.splitext(file_path)[1].lower()
+
+        file_format = {'.yaml': 'yaml', '.yml': 'yaml', '.jsonl': 'jsonl',
+                       '.csv': 'csv'}.get(ext)
+
+        if file_format is None:
+            raise Exception("Unable to determine format of \"{0}\" - please "
+                            "specify file_format.".format(file_path))
+
+    if file_format not in ('yaml', 'jsonl', 'csv'):
+        raise Exception("Unknown file_format '{0}'.".format(file_format))
+
+    return file_format
+
+def _to_python(v):
+    """ Convert NumPy scalars to Python types for serialisation. """
+
+    if isinstance(v, np.generic):
+        return v.item()
+
+    return v
+
+def _parse_value(v):
+    """ Convert a string value read from a YAML or CSV file to a float if
+    possible. """
+
+    try:
+        return float(v)
+    except ValueError:
+        return v
+
+def _format_yaml_value(v):
+    """ Format a value as a YAML scalar. Strings that would not be read back
+    as the same string if written unquoted are written as double-quoted
+    scalars (with JSON escapes, which are valid in YAML). """
+
+    v = _to_python(v)
+
+    if not isinstance(v, str):
+        return str(v)
+
+    if (v.lower() in _EXPORT_YAML_RESERVED or v[0] in _EXPORT_YAML_INDICATORS
+            or v != v.strip() or ': ' in v or ' #' in v or v.endswith(':')
+            or any(ord(c) < 32 for c in v)
+            or not isinstance(_parse_value(v), str)):
+        return json.dumps(v)
+
+    return v
+
+def _parse_yaml_value(v):
+    """ Convert a scalar read from a YAML file written by write_records(). """
+
+    if v.startswith('"'):
+        return json.loads(v)
+
+    return _parse_value(v)
+
+def _format_yaml_record(rec):
+    """ Format a record as a YAML list item and return a list of lines. """
+
+    keys = list(rec.keys())
+
+    tensors = [k[:-len('_ave')] for k in keys if k.endswith('_ave')
+                   and all('{0}_{1}'.format(k[:-len('_ave')], s) in rec
+                           for s in _EXPORT_TENSOR_SUFFIXES)]
+
+    tensor_keys = set('{0}_{1}'.format(k, s)
+                          for k in tensors for s in _EXPORT_TENSOR_SUFFIXES)
+
+    scalars = [k for k in keys if k not in tensor_keys]
+
+    lines = []
+
+    for i, k in enumerate(scalars):
+        lines.append("{0} {1}: {2}\n".format(
+            '-' if i == 0 else ' ', _EXPORT_YAML_KEY_MAP.get(k, k),
+            _format_yaml_value(rec[k])))
+
+    for k in tensors:
+        lines.append("  {0}:\n".format(k))
+
+        for suffix in _EXPORT_TENSOR_SUFFIXES:
+            lines.append("    {0}: {1}\n".format(
+                suffix, _format_yaml_value(rec['{0}_{1}'.format(k, suffix)])))
+
+    return lines
+
+def _iter_yaml_records(f):
+    """ Read records from a YAML file written by write_records(). """
+
+    yaml_key_map = {v: k for k, v in _EXPORT_YAML_KEY_MAP.items()}
+
+    rec, block = None, None
+
+    for line in f:
+        line = line.rstrip('\n')
+
+        if line.strip() == '':
+            continue
+
+        if line.startswith('- '):
+            if rec is not None:
+                yield rec
+
+            rec, block = {}, None
+            line = '  ' + line[2:]
+
+        if rec is None:
+            raise Exception("Unexpected line \"{0}\".".format(line))
+
+        indent = len(line) - len(line.lstrip(' '))
+
+        k, v = line.strip().split(':', 1)
+        v = v.strip()
+
+        if indent == 2:
+            if v == '' and not line.endswith(': '):
+                block = k
+            else:
+                block = None
+                rec[yaml_key_map.get(k, k)] = _parse_yaml_value(v)
+        elif indent == 4 and block is not None:
+            rec['{0}_{1}'.format(block, k)] = _parse_yaml_value(v)
+        else:
+            raise Exception("Unexpected line \"{0}\".".format(line))
+
+    if rec is not None:
+        yield rec
+
+
+# ---------
+# Functions
+# ---------
+
+def zt_max_record(system, carrier_type, rec, **kwargs):
+    """ Build a ZT_max record from the system, carrier type, a row returned
+    by get_zt_max() and optional additional metadata (e.g. the n/T window
+    used to locate ZT_max) passed as keyword arguments. """
+
+    record = {'system': system, 'carrier_type': carrier_type}
+
+    record.update(kwargs)
+
+    for k in rec.keys():
+        record[k] = rec[k]
+
+    return record
+
+def write_records(file_path, records, file_format=None, batch_size=None,
+                  append=False):
+    """ Write an iterable of records to file_path in file_format (default:
+    determined from the extension) and return the number of records written.
+    Output is written in batches of batch_size records. For CSV files, all
+    records must have the same fields as the first. If append is True,
+    records are appended to an existing file.
+    """
+
+    file_format = _get_format(file_path, file_format)
+
+    if batch_size is None:
+        batch_size = _EXPORT_DEFAULT_BATCH_SIZE
+
+    num_records = 0
+
+    with open(file_path, 'a' if append else 'w', newline='') as f:
+        if file_format == 'csv':
+            # csv.writer buffers through f, so rows are not batched here.
+
+            f_csv, fields, field_set = None, None, None
+
+            for rec in records:
+                if f_csv is None:
+                    fields = list(rec.keys())
+                    field_set = set(fields)
+
+                    f_csv = csv.writer(f)
+
+                    if not append or f.tell() == 0:
+                        f_csv.writerow(fields)
+
+                if set(rec.keys()) != field_set:
+                    raise Exception("All records must have the same fields "
+                                    "when writing to CSV files.")
+
+                f_csv.writerow([_to_python(rec[k]) for k in fields])
+
+                num_records += 1
+
+            return num_records
+
+        buffer = []
+
+        for rec in records:
+            if file_format == 'yaml':
+                buffer.extend(_format_yaml_record(rec))
+            else:
+                buffer.append(json.dumps(
+                    {k: _to_python(v) for k, v in rec.items()}) + '\n')
+
+            num_records += 1
+
+            if num_records % batch_size == 0:
+                f.write(''.join(buffer))
+                buffer = []
+
+        f.write(''.join(buffer))
+
+    return num_records
+
+def iter_records(file_path, file_format=None):
+    """ Iterate over the records in a file written by write_records(),
+    yielding dictionaries. Numeric values are converted to floats. """
+
+    file_format = _get_format(file_path, file_format)
+
+    with open(file_path, 'r', newline='') as f:
+        if file_format == 'yaml':
+            yield from _iter_yaml_records(f)
+        elif file_format == 'jsonl':
+            for line in f:
+                if line.strip() != '':
+                    yield json.loads(line)
+        else:
+            for row in csv.DictReader(f):
+                yield {k: _parse_value(v) for k, v in row.items()}
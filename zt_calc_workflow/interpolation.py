@@ -0,0 +1,149 @@
+# zt_calc_workflow/interpolation.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for interpolating 2D (n, T) data, as returned by
+dataset.dataset_to_2d(), with an optional cache of interpolants.
+
+Interpolants are built over (log n, T). Building an interpolant is cheap
+compared to identifying the data by hashing it, so interpolants are only
+cached when the caller supplies a key that identifies the data (e.g. a
+file name and property), so repeated calls with the same key (e.g. looking
+up ZT at many points) reuse the same interpolant. Cached interpolants hold a
+read-only copy of the data, so later changes to the caller's arrays do not
+affect them, and the caller is responsible for using a new key if the data
+changes. The cache is bounded, with the least recently used interpolants
+evicted first.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+# ---------
+# Constants
+# ---------
+
+# Default maximum number of interpolants to keep in the cache.
+
+_INTERPOLATOR_CACHE_SIZE = 32
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+_interpolator_cache = OrderedDict()
+_interpolator_cache_lock = threading.Lock()
+_interpolator_cache_size = _INTERPOLATOR_CACHE_SIZE
+
+def _build_interpolator(n, t, data_2d, method):
+    """ Build an interpolant for data_2d on the grid (n, t). """
+
+    # SciPy is imported here rather than at module level so that importing
+    # this module is fast.
+
+    from scipy.interpolate import RegularGridInterpolator
+
+    return RegularGridInterpolator(
+        (np.log10(n), t), data_2d, method=method, bounds_error=False,
+        fill_value=None)
+
+
+# ---------
+# Functions
+# ---------
+
+def get_interpolator(n, t, data_2d, method='linear', cache_key=None):
+    """ Return an interpolant for data_2d on the grid (n, t), which can be
+    called with a tuple of (log_n, t) arrays. Values outside the grid are
+    extrapolated. If cache_key (any hashable value) is specified, the
+    interpolant is cached under cache_key and method (see module
+    docstring). """
+
+    n = np.asarray(n, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    data_2d = np.asarray(data_2d, dtype=np.float64)
+
+    if cache_key is None:
+        return _build_interpolator(n, t, data_2d, method)
+
+    key = (cache_key, method)
+
+    with _interpolator_cache_lock:
+        if key in _interpolator_cache:
+            _interpolator_cache.move_to_end(key)
+            return _interpolator_cache[key]
+
+    # Keep read-only copies of the data so that the cached interpolant does
+    # not change with the caller's arrays.
+
+    n, t, data_2d = n.copy(), t.copy(), data_2d.copy()
+
+    for a in n, t, data_2d:
+        a.flags.writeable = False
+
+    interpolator = _build_interpolator(n, t, data_2d, method)
+
+    with _interpolator_cache_lock:
+        _interpolator_cache[key] = interpolator
+
+        while len(_interpolator_cache) > _interpolator_cache_size:
+            _interpolator_cache.popitem(last=False)
+
+    return interpolator
+
+def interpolate(n, t, data_2d, n_eval, t_eval, method='linear',
+                cache_key=None):
+    """ Interpolate data_2d on the grid (n, t) at the carrier concentrations
+    n_eval and temperatures t_eval, which may be scalars or arrays of any
+    (broadcastable) shape. cache_key is passed to get_interpolator(). """
+
+    interpolator = get_interpolator(
+        n, t, data_2d, method=method, cache_key=cache_key)
+
+    n_eval, t_eval = np.broadcast_arrays(
+        np.asarray(n_eval, dtype=np.float64),
+        np.asarray(t_eval, dtype=np.float64))
+
+    return interpolator((np.log10(n_eval), t_eval))
+
+def resample_2d(n, t, data_2d, n_new, t_new, method='linear',
+                cache_key=None):
+    """ Resample data_2d from the grid (n, t) onto the grid (n_new, t_new),
+    e.g. to produce smoother maps for plotting, and return a 2D array with
+    shape (len(n_new), len(t_new)). cache_key is passed to
+    get_interpolator(). """
+
+    n_2d, t_2d = np.meshgrid(n_new, t_new, indexing='ij')
+
+    return interpolate(n, t, data_2d, n_2d, t_2d, method=method,
+                       cache_key=cache_key)
+
+def set_interpolator_cache_size(size):
+    """ Set the maximum number of interpolants to keep in the cache. """
+
+    global _interpolator_cache_size
+
+    with _interpolator_cache_lock:
+        _interpolator_cache_size = size
+
+        while len(_interpolator_cache) > _interpolator_cache_size:
+            _interpolator_cache.popitem(last=False)
+
+def clear_interpolator_cache():
+    """ Remove all interpolants from the cache. """
+
+    with _interpolator_cache_lock:
+        _interpolator_cache.clear()
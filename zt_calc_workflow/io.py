@@ -11,19 +11,21 @@
 # Imports
 # -------
 
+import hashlib
+
 import pandas as pd
 
+from .profiling import profile_stage
+
 
 # ---------
 # CSV files
 # ---------
 
-def read_validate_csv(file_path, header_map=None, known_headers=None,
-                      known_headers_required=False):
-    """ Read a CSV file into a Pandas DataFrame and optionally update headers
-    with header_map and check headers against known_headers. """
-
-    df = pd.read_csv(file_path)
+def _update_validate_headers(df, header_map, known_headers,
+                             known_headers_required):
+    """ Update the headers of df in place with header_map and check them
+    against known_headers. """
 
     # Rename columns.
 
@@ -42,4 +44,43 @@ def read_validate_csv(file_path, header_map=None, known_headers=None,
                 if h not in df.columns:
                     raise Exception("Required column '{0}' missing.".format(h))
 
+@profile_stage
+def read_validate_csv(file_path, header_map=None, known_headers=None,
+                      known_headers_required=False):
+    """ Read a CSV file into a Pandas DataFrame and optionally update headers
+    with header_map and check headers against known_headers. """
+
+    df = pd.read_csv(file_path)
+
+    _update_validate_headers(
+        df, header_map, known_headers, known_headers_required)
+
     return df
+
+def iter_validate_csv(file_path, chunk_size, header_map=None,
+                      known_headers=None, known_headers_required=False):
+    """ Read a CSV file in chunks of chunk_size rows, as for
+    read_validate_csv(), and yield each chunk as a Pandas DataFrame. """
+
+    with pd.read_csv(file_path, chunksize=chunk_size) as reader:
+        for df in reader:
+            _update_validate_headers(
+                df, header_map, known_headers, known_headers_required)
+
+            yield df
+
+
+# -------
+# Hashing
+# -------
+
+def hash_file(file_path, block_size=1 << 20):
+    """ Return a SHA-256 hash of the contents of a file. """
+
+    h = hashlib.sha256()
+
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+
+    return h.hexdigest()
@@ -0,0 +1,226 @@
+# zt_calc_workflow/loader.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for loading many AMSET and Phono3py input sets concurrently.
+
+For screening campaigns with many input files on a shared filesystem, the
+time taken to read the files is dominated by latency rather than CPU, so
+reading them one after another leaves the CPU idle. iter_input_sets() reads
+and validates the input sets in a manifest in a bounded thread pool, reading
+ahead of the consumer by up to a fixed number of input sets, and yields them
+as they are ready, so processing overlaps with reading and memory use is
+bounded by the read-ahead depth rather than the number of input sets.
+
+Input sets are dictionaries with keys 'amset' and 'kappa' (the CSV files)
+and optionally 'kappa_axes' (see phono3py.remap_kappa_axes()) and
+'memory_mode' (see compact.py). Other keys (e.g. 'system', 'output') are
+passed through unchanged. Phono3py files shared between input sets (e.g.
+p- and n-type calculations on the same material) are only read once, and
+are released once all the input sets that use them have been read, so the
+cache of Phono3py data is also bounded by the read-ahead depth.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import csv
+import threading
+
+from concurrent.futures import (
+    FIRST_COMPLETED, ThreadPoolExecutor, wait)
+
+from .amset import read_amset_csv
+from .phono3py import read_phono3py_kappa_csv, remap_kappa_axes
+from .profiling import profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+# Default number of reader threads. Reading is I/O bound, so this can exceed
+# the number of CPU cores.
+
+_LOADER_DEFAULT_MAX_WORKERS = 8
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _kappa_key(input_set):
+    """ Return a key identifying the Phono3py data for an input set. """
+
+    return (input_set['kappa'], input_set.get('kappa_axes'),
+            input_set.get('memory_mode'))
+
+def _read_kappa(input_set, kappa_cache, kappa_cache_lock):
+    """ Read the Phono3py data for an input set, reusing data already read
+    for another input set. Concurrent reads of the same file wait for the
+    first to finish.
+
+    kappa_cache holds the number of input sets still to be read that use
+    each file under the key 'refs'. Once the last of them has been read, the
+    data is removed from the cache. """
+
+    key = _kappa_key(input_set)
+
+    with kappa_cache_lock:
+        entry = kappa_cache.setdefault(
+            key, {'lock': threading.Lock(), 'refs': 1})
+
+    try:
+        with entry['lock']:
+            if 'data' not in entry:
+                kappa_data = read_phono3py_kappa_csv(
+                    input_set['kappa'],
+                    memory_mode=input_set.get('memory_mode'))
+
+                if input_set.get('kappa_axes') is not None:
+                    kappa_data = remap_kappa_axes(
+                        kappa_data, input_set['kappa_axes'])
+
+                entry['data'] = kappa_data
+
+            return entry['data']
+    finally:
+        with kappa_cache_lock:
+            entry['refs'] -= 1
+
+            if entry['refs'] <= 0:
+                kappa_cache.pop(key, None)
+
+@profile_stage
+def _load_input_set(input_set, kappa_cache, kappa_cache_lock):
+    """ Read and validate an input set and return a tuple of (input_set,
+    amset_data, kappa_data). """
+
+    for k in 'amset', 'kappa':
+        if input_set.get(k) is None:
+            raise Exception("Input '{0}' must be specified.".format(k))
+
+    amset_data = read_amset_csv(
+        input_set['amset'], memory_mode=input_set.get('memory_mode'))
+
+    kappa_data = _read_kappa(input_set, kappa_cache, kappa_cache_lock)
+
+    # Check temperatures in the AMSET calculation are covered by the Phono3py
+    # calculation, as required by zt_dataset_from_data().
+
+    kappa_t = set(kappa_data['t'].tolist())
+
+    if not all(t in kappa_t for t in amset_data['t'].unique().tolist()):
+        raise Exception("Phono3py calculation \"{0}\" must cover the "
+                        "temperature range of the AMSET calculation \"{1}\"."
+                        .format(input_set['kappa'], input_set['amset']))
+
+    return (input_set, amset_data, kappa_data)
+
+
+# ---------
+# Functions
+# ---------
+
+def read_manifest(file_path):
+    """ Read a CSV manifest with a header row naming the inputs and options
+    for each input set, and return a list of input sets. Blank values are
+    returned as None. """
+
+    input_sets = []
+
+    with open(file_path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            input_sets.append(
+                {k: v.strip() if v is not None and v.strip() != '' else None
+                     for k, v in row.items()})
+
+    return input_sets
+
+def iter_input_sets(manifest, max_workers=None, prefetch=None,
+                    ordered=False):
+    """ Read the input sets in manifest (a list of input sets or the path to
+    a CSV manifest) concurrently and yield (input_set, amset_data,
+    kappa_data) tuples.
+
+    Reads are performed by max_workers threads (default:
+    _LOADER_DEFAULT_MAX_WORKERS), with at most prefetch input sets (default:
+    2 x max_workers) read or being read ahead of the consumer. Input sets are
+    yielded as they are ready or, if ordered is True, in the order of the
+    manifest. Errors reading an input set are raised when it would have been
+    yielded, and outstanding reads are cancelled.
+    """
+
+    if isinstance(manifest, str):
+        manifest = read_manifest(manifest)
+
+    if max_workers is None:
+        max_workers = _LOADER_DEFAULT_MAX_WORKERS
+
+    if prefetch is None:
+        prefetch = 2 * max_workers
+
+    if prefetch < 1:
+        raise Exception("prefetch must be at least 1.")
+
+    # The manifest is read up front to count the input sets that use each
+    # Phono3py file (see _read_kappa()).
+
+    manifest = list(manifest)
+
+    input_sets = iter(manifest)
+
+    kappa_cache, kappa_cache_lock = {}, threading.Lock()
+
+    for input_set in manifest:
+        if input_set.get('kappa') is not None:
+            entry = kappa_cache.setdefault(
+                _kappa_key(input_set),
+                {'lock': threading.Lock(), 'refs': 0})
+
+            entry['refs'] += 1
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    # Futures for input sets read or being read, in manifest order.
+
+    pending = []
+
+    def _fill():
+        while len(pending) < prefetch:
+            input_set = next(input_sets, None)
+
+            if input_set is None:
+                break
+
+            pending.append(executor.submit(
+                _load_input_set, dict(input_set), kappa_cache,
+                kappa_cache_lock))
+
+    try:
+        _fill()
+
+        while len(pending) > 0:
+            if ordered:
+                future = pending[0]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = next(f for f in pending if f in done)
+
+            pending.remove(future)
+
+            res = future.result()
+
+            # Start the next read before yielding, so it proceeds while the
+            # consumer processes this input set.
+
+            _fill()
+
+            yield res
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
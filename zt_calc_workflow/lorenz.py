@@ -0,0 +1,117 @@
+# zt_calc_workflow/lorenz.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for recomputing the electronic thermal conductivity from the
+electrical conductivity and Seebeck coefficient with the Wiedemann-Franz law,
+\\kappa_el = L \\sigma T, as an alternative to the values calculated by
+AMSET.
+
+The Lorenz number L can be calculated with one of the following models:
+
+    * 'constant': the degenerate limit, L = 2.44 x 10^-8 W Ohm K^-2 (a
+      number can also be given to use a different constant value);
+    * 'kim': the empirical expression L = 1.5 + exp(-|S| / 116) x 10^-8
+      W Ohm K^-2, with S in uV/K, from H.-S. Kim et al., APL Mater. 3,
+      041506 (2015); or
+    * 'spb': a single parabolic band model with acoustic-phonon scattering
+      (see pisarenko.py).
+
+Conductivities are assumed to be in S cm^-1, as returned by
+amset.read_amset_csv() with the default convert_sigma_s_cm=True.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import numpy as np
+import pandas as pd
+
+from .dataset import calculate_kappa_tot_zt, dataset_to_2d
+from .pisarenko import spb_lorenz_number
+from .profiling import profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+_LORENZ_DEGENERATE = 2.44e-8
+
+
+# ---------
+# Functions
+# ---------
+
+def lorenz_number(s, lorenz_model='kim'):
+    """ Return the Lorenz number (W Ohm K^-2) for Seebeck coefficients s
+    (uV/K) with the specified model (see module docstring). """
+
+    s = np.asarray(s, dtype=np.float64)
+
+    if lorenz_model == 'constant':
+        return np.full_like(s, _LORENZ_DEGENERATE)
+
+    if lorenz_model == 'kim':
+        return (1.5 + np.exp(-1. * np.abs(s) / 116.)) * 1.e-8
+
+    if lorenz_model == 'spb':
+        return spb_lorenz_number(s)
+
+    if isinstance(lorenz_model, (int, float)):
+        return np.full_like(s, float(lorenz_model))
+
+    raise Exception("Unknown lorenz_model = '{0}'.".format(lorenz_model))
+
+@profile_stage
+def recompute_kappa_el(data, lorenz_model='kim', inplace=False):
+    """ Recompute the 'kappa_el_*' fields in a dataset from the 'sigma_*'
+    and 's_*' fields with the specified Lorenz number model. If inplace is
+    False (default), a modified copy of data is returned. """
+
+    if not inplace:
+        data = data.copy()
+
+    t = data['t'].to_numpy(dtype=np.float64)
+
+    for c in 'xx', 'yy', 'zz', 'ave':
+        s = data['s_{0}'.format(c)].to_numpy(dtype=np.float64)
+
+        # Convert \sigma from S/cm to S/m.
+
+        sigma = 100. * data['sigma_{0}'.format(c)].to_numpy(dtype=np.float64)
+
+        data['kappa_el_{0}'.format(c)] = (
+            lorenz_number(s, lorenz_model=lorenz_model) * sigma * t)
+
+    return data
+
+@profile_stage
+def lorenz_zt_difference(zt_data, lorenz_model='kim'):
+    """ Compare ZT calculated with the AMSET \\kappa_el in a ZT dataset to ZT
+    calculated with \\kappa_el from the specified Lorenz number model.
+
+    Returns a tuple of (n, t, data_2d) as for dataset_to_2d(), where data_2d
+    has keys 'zt_*' (AMSET), 'zt_lorenz_*' (Lorenz model) and 'zt_diff_*'
+    (Lorenz model - AMSET) for each component.
+    """
+
+    lorenz_data = recompute_kappa_el(zt_data, lorenz_model=lorenz_model)
+
+    calculate_kappa_tot_zt(lorenz_data)
+
+    cols = {'n': zt_data['n'], 't': zt_data['t']}
+
+    for c in 'xx', 'yy', 'zz', 'ave':
+        k = 'zt_{0}'.format(c)
+
+        cols[k] = zt_data[k]
+        cols['zt_lorenz_{0}'.format(c)] = lorenz_data[k]
+        cols['zt_diff_{0}'.format(c)] = lorenz_data[k] - zt_data[k]
+
+    return dataset_to_2d(pd.DataFrame(cols))
@@ -0,0 +1,235 @@
+# zt_calc_workflow/mfp.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for analysing the phonon mean free path (MFP) dependence of the
+lattice thermal conductivity using mode-resolved Phono3py data, as returned
+by phono3py.read_phono3py_kappa_hdf5().
+
+The MFP of each mode is Lambda = |v| tau, where v is the group velocity and
+tau = 1 / (4 pi gamma) is the lifetime. The routines compute:
+
+    * cumulative \\kappa_latt as a function of MFP; and
+    * \\kappa_latt with grain-boundary scattering, which is added to the
+      intrinsic scattering with Matthiessen's rule, 1 / tau' = 1 / tau +
+      |v| / L, for a grain size L. Since the mode contributions to
+      \\kappa_latt are proportional to tau, this gives
+      \\kappa_latt(L) = sum(mode_kappa / (1 + Lambda / L)) / sum(weight).
+
+As in Phono3py, the mode contributions are normalised by the sum of the
+q-point weights, so the sums over all modes equal the \\kappa_latt tensor
+stored in the kappa-m*.hdf5 file. Where the file contains the tensor, the
+sums are checked against it.
+
+Mode-resolved data can be large, so the sums over q-points are performed in
+chunks of q-points. MFPs and grain sizes are in nm.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import numpy as np
+import pandas as pd
+
+from .profiling import profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+# Default number of q-points to process at once.
+
+_MFP_CHUNK_SIZE = 256
+
+# Order of the components in Phono3py mode_kappa arrays.
+
+_MFP_KAPPA_KEYS = [
+    'kappa_xx', 'kappa_yy', 'kappa_zz', 'kappa_yz', 'kappa_xz', 'kappa_xy']
+
+# Relative tolerance for checking the sum of the mode contributions against
+# the \\kappa_latt tensor calculated by Phono3py.
+
+_MFP_KAPPA_RTOL = 1.e-3
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _iter_chunks(kappa_data, chunk_size):
+    """ Yield (mfp, mode_kappa) for chunks of q-points, with mfp a
+    (num_t, num_q, num_b) array of MFPs in nm and mode_kappa a
+    (num_t, num_q, num_b, 6) array. """
+
+    if chunk_size is None:
+        chunk_size = _MFP_CHUNK_SIZE
+
+    num_q = kappa_data['mode_kappa'].shape[1]
+
+    for q_0 in range(0, num_q, chunk_size):
+        q_1 = min(q_0 + chunk_size, num_q)
+
+        mode_kappa = kappa_data['mode_kappa'][:, q_0:q_1]
+
+        yield (mode_mfps(kappa_data, q_slice=slice(q_0, q_1)), mode_kappa)
+
+def _weight_sum(kappa_data):
+    """ Return the sum of the q-point weights used to normalise the mode
+    contributions to \\kappa_latt. """
+
+    if kappa_data.get('weight') is None:
+        raise Exception("q-point weights ('weight') are required to "
+                        "normalise the mode contributions to kappa_latt.")
+
+    return float(np.sum(kappa_data['weight']))
+
+def _check_kappa_total(kappa_data, kappa_tot):
+    """ Check a (num_t, 6) array with the sum of the normalised mode
+    contributions to \\kappa_latt against the tensor calculated by Phono3py,
+    if available. """
+
+    if kappa_data.get('kappa') is None:
+        return
+
+    kappa_ref = np.asarray(kappa_data['kappa'], dtype=np.float64)
+
+    if not np.allclose(kappa_tot, kappa_ref, rtol=_MFP_KAPPA_RTOL,
+                       atol=_MFP_KAPPA_RTOL * np.abs(kappa_ref).max()):
+        raise Exception("Sum of mode contributions to kappa_latt does not "
+                        "match the kappa_latt calculated by Phono3py.")
+
+
+# ---------
+# Functions
+# ---------
+
+def mode_mfps(kappa_data, q_slice=None):
+    """ Return a (num_t, num_q, num_b) array of mode MFPs in nm. Modes with
+    gamma = 0 (e.g. acoustic modes at Gamma) have an infinite MFP. q_slice
+    optionally selects a subset of q-points. """
+
+    if q_slice is None:
+        q_slice = slice(None)
+
+    v = np.linalg.norm(kappa_data['group_velocity'][q_slice], axis=-1)
+
+    gamma = kappa_data['gamma'][:, q_slice]
+
+    # tau [ps] = 1 / (4 pi gamma [THz]), and |v| [THz Angstrom] * tau [ps]
+    # is in Angstrom.
+
+    with np.errstate(divide='ignore'):
+        tau = np.where(gamma > 0., 1. / (4. * np.pi * gamma), np.inf)
+
+    return 0.1 * v[np.newaxis, :, :] * tau
+
+@profile_stage
+def cumulative_kappa_mfp(kappa_data, mfp=None, chunk_size=None):
+    """ Calculate cumulative \\kappa_latt as a function of MFP.
+
+    mfp is an array of MFPs (nm) to evaluate the cumulative \\kappa_latt at
+    (default: 121 points spaced logarithmically between 0.1 nm and 100 um).
+
+    Returns a tuple of (t, mfp, kappa_cum), where kappa_cum is a
+    (num_t, num_mfp, 6) array with the cumulative contribution to the
+    components of \\kappa_latt (xx, yy, zz, yz, xz, xy) from modes with
+    MFPs <= mfp. If mfp[-1] exceeds the largest MFP, the last point is the
+    total \\kappa_latt.
+    """
+
+    weight_sum = _weight_sum(kappa_data)
+
+    if mfp is None:
+        mfp = np.logspace(-1., 5., 121)
+
+    mfp = np.asarray(mfp, dtype=np.float64)
+
+    num_t = len(kappa_data['t'])
+    num_bins = len(mfp) + 1
+
+    kappa_bins = np.zeros((num_t, num_bins, 6), dtype=np.float64)
+
+    for mode_mfp, mode_kappa in _iter_chunks(kappa_data, chunk_size):
+        # Bin the mode contributions by MFP with np.bincount(), using a
+        # combined (T, bin) index. Modes with MFPs > mfp[-1] go in the last
+        # bin, which is not included in the output.
+
+        bins = np.searchsorted(mfp, mode_mfp, side='left')
+
+        idx = (np.arange(num_t)[:, np.newaxis, np.newaxis] * num_bins
+                   + bins).ravel()
+
+        for c in range(6):
+            kappa_bins[:, :, c] += np.bincount(
+                idx, weights=mode_kappa[..., c].ravel(),
+                minlength=num_t * num_bins).reshape(num_t, num_bins)
+
+    kappa_bins /= weight_sum
+
+    _check_kappa_total(kappa_data, kappa_bins.sum(axis=1))
+
+    kappa_cum = np.cumsum(kappa_bins, axis=1)[:, :-1, :]
+
+    return (kappa_data['t'], mfp, kappa_cum)
+
+@profile_stage
+def boundary_kappa(kappa_data, grain_sizes, chunk_size=None):
+    """ Calculate \\kappa_latt with grain-boundary scattering for each of a
+    set of grain_sizes (nm). A grain size of np.inf gives the intrinsic
+    \\kappa_latt.
+
+    Returns a (num_t, num_grain_sizes, 6) array with the components of
+    \\kappa_latt (xx, yy, zz, yz, xz, xy).
+    """
+
+    weight_sum = _weight_sum(kappa_data)
+
+    grain_sizes = np.asarray(grain_sizes, dtype=np.float64)
+
+    num_t = len(kappa_data['t'])
+
+    kappa = np.zeros((num_t, len(grain_sizes), 6), dtype=np.float64)
+    kappa_tot = np.zeros((num_t, 6), dtype=np.float64)
+
+    for mode_mfp, mode_kappa in _iter_chunks(kappa_data, chunk_size):
+        # Suppression factors 1 / (1 + Lambda / L), with shape
+        # (num_t, num_q, num_b, num_grain_sizes).
+
+        # Infinite grain sizes have no suppression, including for modes
+        # with infinite MFPs.
+
+        with np.errstate(invalid='ignore'):
+            f = np.where(np.isinf(grain_sizes), 1.,
+                         1. / (1. + mode_mfp[..., np.newaxis] / grain_sizes))
+
+        kappa += np.einsum('tqbl,tqbc->tlc', f, mode_kappa)
+        kappa_tot += mode_kappa.sum(axis=(1, 2))
+
+    kappa /= weight_sum
+
+    _check_kappa_total(kappa_data, kappa_tot / weight_sum)
+
+    return kappa
+
+def boundary_kappa_data(kappa_data, grain_size, chunk_size=None):
+    """ Calculate \\kappa_latt with grain-boundary scattering for a grain
+    size (nm) and return a Pandas DataFrame with the same columns as
+    phono3py.read_phono3py_kappa_csv(), which can be passed to
+    dataset.zt_dataset_from_data(). """
+
+    kappa = boundary_kappa(
+        kappa_data, [grain_size], chunk_size=chunk_size)[:, 0, :]
+
+    data = pd.DataFrame(kappa, columns=_MFP_KAPPA_KEYS)
+
+    data.insert(0, 't', kappa_data['t'])
+
+    data['kappa_ave'] = kappa[:, :3].mean(axis=1)
+
+    return data
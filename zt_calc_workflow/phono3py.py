@@ -12,7 +12,9 @@
 # Imports
 # -------
 
+from .compact import apply_memory_mode
 from .io import read_validate_csv
+from .profiling import profile_stage
 
 
 # ---------
@@ -28,14 +30,57 @@ _READ_PHONO3PY_KAPPA_HEADER_MAP = {
 _READ_PHONO3PY_KAPPA_KNOWN_HEADERS = list(
     _READ_PHONO3PY_KAPPA_HEADER_MAP.values())
 
-def read_phono3py_kappa_csv(file_path):
-    """ Read a CSV file generated with the phono3py-get-kappa script. """
+@profile_stage
+def read_phono3py_kappa_csv(file_path, memory_mode=None):
+    """ Read a CSV file generated with the phono3py-get-kappa script.
+    memory_mode optionally specifies a memory mode to apply to the data (see
+    compact.py). """
 
-    return read_validate_csv(
+    df = read_validate_csv(
         file_path, header_map=_READ_PHONO3PY_KAPPA_HEADER_MAP,
         known_headers=_READ_PHONO3PY_KAPPA_KNOWN_HEADERS,
         known_headers_required=True)
 
+    if memory_mode is not None:
+        apply_memory_mode(
+            df, memory_mode, source={'reader': 'phono3py_kappa',
+                                     'file_path': file_path, 'kwargs': {}})
+
+    return df
+
+def remap_kappa_axes(kappa_data, axes):
+    """ Relabel the diagonal elements of a Phono3py kappa dataset to account
+    for calculations performed on structures with the axes oriented
+    differently to those in the AMSET calculations.
+
+    axes is a three-character string giving the AMSET axes corresponding to
+    the Phono3py x, y and z axes - e.g. 'yzx' relabels 'kappa_xx' as
+    'kappa_yy', 'kappa_yy' as 'kappa_zz' and 'kappa_zz' as 'kappa_xx'. The
+    off-diagonal elements, which cannot be remapped by relabelling, are
+    dropped. Returns a new DataFrame.
+    """
+
+    if sorted(axes) != ['x', 'y', 'z']:
+        raise Exception("axes must be a permutation of 'xyz'.")
+
+    kappa_data = kappa_data.drop(
+        columns=[k for k in ['kappa_yz', 'kappa_xz', 'kappa_xy']
+                     if k in kappa_data.columns])
+
+    header_map = {'kappa_{0}{0}'.format(a_in): 'kappa_{0}{0}'.format(a_out)
+                      for a_in, a_out in zip('xyz', axes)}
+
+    kappa_data = kappa_data.rename(columns=header_map)
+
+    # The relabelled columns no longer match the file the data was read from,
+    # so dropped off-diagonal elements (see compact.py) cannot be reloaded.
+
+    if 'memory_mode' in kappa_data.attrs:
+        kappa_data.attrs['memory_mode'] = dict(
+            kappa_data.attrs['memory_mode'], dropped=[], source=None)
+
+    return kappa_data
+
 _READ_PHONO3PY_CRTA_HEADER_MAP = dict(_READ_PHONO3PY_KAPPA_HEADER_MAP, **{
     "(k/t)_xx [W/m.K.ps]": 'kappa_tau_crta_xx',
     "(k/t)_yy [W/m.K.ps]": 'kappa_tau_crta_yy',
@@ -52,6 +97,7 @@ _READ_PHONO3PY_CRTA_HEADER_MAP = dict(_READ_PHONO3PY_KAPPA_HEADER_MAP, **{
 _READ_PHONO3PY_CRTA_KNOWN_HEADERS = list(
     _READ_PHONO3PY_CRTA_HEADER_MAP.values())
 
+@profile_stage
 def read_phono3py_crta_csv(file_path):
     """ Read a CSV file generated with the CRTA.py script. """
 
@@ -59,3 +105,48 @@ def read_phono3py_crta_csv(file_path):
         file_path, header_map=_READ_PHONO3PY_CRTA_HEADER_MAP,
         known_headers=_READ_PHONO3PY_CRTA_KNOWN_HEADERS,
         known_headers_required=True)
+
+
+# ----------
+# HDF5 files
+# ----------
+
+_READ_PHONO3PY_KAPPA_HDF5_DATASETS = {
+    'temperature': 't', 'frequency': 'frequency',
+    'group_velocity': 'group_velocity', 'gamma': 'gamma',
+    'heat_capacity': 'heat_capacity', 'mode_kappa': 'mode_kappa',
+    'weight': 'weight', 'kappa': 'kappa'}
+
+_READ_PHONO3PY_KAPPA_HDF5_REQUIRED = [
+    'temperature', 'group_velocity', 'gamma', 'mode_kappa', 'weight']
+
+@profile_stage
+def read_phono3py_kappa_hdf5(file_path):
+    """ Read the mode-resolved data from a Phono3py kappa-m*.hdf5 file, and
+    return a dictionary of NumPy arrays with keys 't', 'frequency' (THz),
+    'group_velocity' (THz Angstrom), 'gamma' (THz), 'heat_capacity' (eV/K),
+    'mode_kappa' (W/m.K), 'weight' and, if present, 'kappa' (W/m.K; the
+    \\kappa_latt tensor summed by Phono3py). The file must contain mode_kappa
+    (i.e. be written by a recent version of Phono3py).
+
+    Requires the h5py package.
+    """
+
+    # h5py is an optional dependency, and is imported here so that the rest
+    # of this module does not require it.
+
+    import h5py
+
+    data = {}
+
+    with h5py.File(file_path, 'r') as f:
+        for k in _READ_PHONO3PY_KAPPA_HDF5_REQUIRED:
+            if k not in f:
+                raise Exception("Dataset '{0}' not found in \"{1}\"."
+                                "".format(k, file_path))
+
+        for k_hdf5, k in _READ_PHONO3PY_KAPPA_HDF5_DATASETS.items():
+            if k_hdf5 in f:
+                data[k] = f[k_hdf5][()]
+
+    return data
@@ -0,0 +1,285 @@
+# zt_calc_workflow/pipeline.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for running the workflow as a pipeline of stages with the
+outputs of each stage memoized on disk.
+
+A pipeline is a list of stage specifications, each a dictionary with:
+
+    * 'name': a unique name for the stage;
+    * 'func': the function to call;
+    * 'files': an optional dictionary of {argument: file path};
+    * 'depends': an optional dictionary of {argument: stage name}; and
+    * 'params': an optional dictionary of other keyword arguments.
+
+Stages are called as func(**files, **depends, **params), with the names in
+'depends' replaced by the outputs of the corresponding stages. For example,
+the first steps in the SnS/SnSe ZT examples could be written as:
+
+    [{'name': 'amset', 'func': read_amset_csv,
+      'files': {'file_path': "SnS-Pnma-AMSET-p.csv"}},
+     {'name': 'kappa', 'func': read_phono3py_kappa_csv,
+      'files': {'file_path': "SnS-kappa-m16816.Prim.csv"}},
+     {'name': 'kappa_remap', 'func': remap_kappa_axes,
+      'depends': {'kappa_data': 'kappa'}, 'params': {'axes': 'yzx'}},
+     {'name': 'zt', 'func': zt_dataset_from_data,
+      'depends': {'elec_prop_data': 'amset',
+                  'kappa_latt_data': 'kappa_remap'}}]
+
+Each stage is keyed on a hash of its function, parameters, input file
+contents and the keys of the stages it depends on, so a stage is only
+recomputed if it, or something upstream of it, has changed. Outputs are
+pickled to a cache directory, which is kept below a maximum size by evicting
+the least-recently-used entries.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import tempfile
+
+from .io import hash_file
+
+
+# ---------
+# Constants
+# ---------
+
+_PIPELINE_CACHE_SUFFIX = '.pkl'
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _func_id(func):
+    """ Return a string identifying a function, including its source where
+    available so that changes to the function invalidate the cache. """
+
+    name = "{0}.{1}".format(func.__module__, func.__qualname__)
+
+    try:
+        return name + '\n' + inspect.getsource(func)
+    except (OSError, TypeError):
+        return name
+
+def _sort_stages(stages):
+    """ Check stage names and dependencies and return the stages as a
+    dictionary of {name: stage} and a list of names in topological order. """
+
+    stage_dict = {}
+
+    for stage in stages:
+        if stage['name'] in stage_dict:
+            raise Exception(
+                "Duplicate stage name '{0}'.".format(stage['name']))
+
+        stage_dict[stage['name']] = stage
+
+    order, state = [], {}
+
+    def _visit(name, path):
+        if state.get(name) == 'done':
+            return
+
+        if state.get(name) == 'visiting':
+            raise Exception("Pipeline contains a cycle: {0}.".format(
+                " -> ".join(path + [name])))
+
+        state[name] = 'visiting'
+
+        for dep in stage_dict[name].get('depends', {}).values():
+            if dep not in stage_dict:
+                raise Exception("Stage '{0}' depends on unknown stage "
+                                "'{1}'.".format(name, dep))
+
+            _visit(dep, path + [name])
+
+        state[name] = 'done'
+        order.append(name)
+
+    for name in stage_dict:
+        _visit(name, [])
+
+    return stage_dict, order
+
+def _stage_keys(stage_dict, order):
+    """ Compute the cache key for each stage. """
+
+    keys, file_hashes = {}, {}
+
+    for name in order:
+        stage = stage_dict[name]
+
+        h = hashlib.sha256()
+
+        h.update(_func_id(stage['func']).encode('utf-8'))
+
+        h.update(json.dumps(stage.get('params', {}), sort_keys=True,
+                            default=repr).encode('utf-8'))
+
+        for arg, file_path in sorted(stage.get('files', {}).items()):
+            if file_path not in file_hashes:
+                file_hashes[file_path] = hash_file(file_path)
+
+            h.update("{0}={1}".format(arg, file_hashes[file_path])
+                     .encode('utf-8'))
+
+        for arg, dep in sorted(stage.get('depends', {}).items()):
+            h.update("{0}={1}".format(arg, keys[dep]).encode('utf-8'))
+
+        keys[name] = h.hexdigest()
+
+    return keys
+
+def _cache_path(cache_dir, key):
+    """ Return the path of the cache entry for key. """
+
+    return os.path.join(cache_dir, key + _PIPELINE_CACHE_SUFFIX)
+
+def _evict_cache(cache_dir, max_cache_size):
+    """ Remove the least-recently-used entries from the cache until its total
+    size is at most max_cache_size bytes. """
+
+    entries = []
+
+    for file_name in os.listdir(cache_dir):
+        if file_name.endswith(_PIPELINE_CACHE_SUFFIX):
+            file_path = os.path.join(cache_dir, file_name)
+
+            st = os.stat(file_path)
+            entries.append((st.st_mtime, st.st_size, file_path))
+
+    total_size = sum(size for _, size, _ in entries)
+
+    for _, size, file_path in sorted(entries):
+        if total_size <= max_cache_size:
+            break
+
+        os.remove(file_path)
+        total_size -= size
+
+
+# ---------
+# Functions
+# ---------
+
+def run_pipeline(stages, cache_dir, targets=None, dry_run=False,
+                 max_cache_size=None):
+    """ Run a pipeline (see module docstring) with outputs memoized in
+    cache_dir.
+
+    targets optionally lists the stages whose outputs are required (default:
+    all stages); only these stages and their dependencies are considered.
+    max_cache_size optionally sets the maximum size of the cache in bytes.
+
+    Returns a tuple of (outputs, status), where outputs is a dictionary of
+    {name: output} for the targets and status is a dictionary of
+    {name: status} for each stage considered, with status one of 'cached',
+    'computed' or, if dry_run is True, 'up to date' or 'rebuild'. In a dry
+    run, nothing is computed and outputs is empty.
+    """
+
+    stage_dict, order = _sort_stages(stages)
+
+    if targets is None:
+        targets = list(order)
+
+    # Restrict to the targets and their dependencies.
+
+    required = set()
+    to_visit = list(targets)
+
+    while len(to_visit) > 0:
+        name = to_visit.pop()
+
+        if name not in stage_dict:
+            raise Exception("Unknown target stage '{0}'.".format(name))
+
+        if name not in required:
+            required.add(name)
+            to_visit.extend(stage_dict[name].get('depends', {}).values())
+
+    order = [name for name in order if name in required]
+
+    keys = _stage_keys(stage_dict, order)
+
+    cached = {name: os.path.isfile(_cache_path(cache_dir, keys[name]))
+                  for name in order}
+
+    if dry_run:
+        return ({}, {name: 'up to date' if cached[name] else 'rebuild'
+                         for name in order})
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Outputs are loaded from the cache only when needed, i.e. for targets
+    # and for the dependencies of stages that need to be recomputed.
+
+    outputs, status = {}, {}
+
+    def _get_output(name):
+        if name not in outputs:
+            file_path = _cache_path(cache_dir, keys[name])
+
+            with open(file_path, 'rb') as f:
+                outputs[name] = pickle.load(f)
+
+        return outputs[name]
+
+    for name in order:
+        file_path = _cache_path(cache_dir, keys[name])
+
+        if cached[name]:
+            # Update the modification time to record the use for LRU eviction.
+
+            os.utime(file_path)
+
+            status[name] = 'cached'
+            continue
+
+        stage = stage_dict[name]
+
+        kwargs = dict(stage.get('files', {}))
+
+        for arg, dep in stage.get('depends', {}).items():
+            kwargs[arg] = _get_output(dep)
+
+        kwargs.update(stage.get('params', {}))
+
+        outputs[name] = stage['func'](**kwargs)
+
+        # Write to a temporary file and rename, so that an interrupted run
+        # cannot leave a partial cache entry.
+
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(outputs[name], f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        status[name] = 'computed'
+
+    target_outputs = {name: _get_output(name) for name in targets}
+
+    if max_cache_size is not None:
+        _evict_cache(cache_dir, max_cache_size)
+
+    return (target_outputs, status)
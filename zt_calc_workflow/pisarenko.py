@@ -0,0 +1,268 @@
+# zt_calc_workflow/pisarenko.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for fitting single parabolic band (SPB) models to Seebeck
+coefficients as a function of carrier concentration (Pisarenko plots) to
+obtain density-of-states effective masses.
+
+The SPB model with acoustic-phonon scattering (scattering parameter
+r = -1/2) gives:
+
+    S = (k_B / e) [2 F_1(eta) / F_0(eta) - eta]
+    n = 4 pi (2 m* k_B T / h^2)^(3/2) F_1/2(eta)
+
+where eta is the reduced chemical potential and F_j are the Fermi-Dirac
+integrals. The corresponding Lorenz number is:
+
+    L = (k_B / e)^2 [3 F_0 F_2 - 4 F_1^2] / F_0^2
+
+The Fermi integrals are tabulated once, and S and n are inverted by
+interpolating the tables, so the model can be evaluated for whole (n, T)
+grids at once.
+
+Carrier concentrations are in cm^-3, Seebeck coefficients in uV/K (the sign
+is ignored) and effective masses in units of the electron mass.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import numpy as np
+import pandas as pd
+
+from .profiling import profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+_K_B = 1.380649e-23
+_E = 1.602176634e-19
+_H = 6.62607015e-34
+_M_E = 9.1093837015e-31
+
+# k_B / e in uV/K.
+
+_K_B_E_UV_K = 1.e6 * _K_B / _E
+
+# Range and spacing of reduced chemical potentials used for the tables.
+
+_PISARENKO_ETA_MIN = -20.
+_PISARENKO_ETA_MAX = 60.
+_PISARENKO_NUM_ETA = 4001
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+_spb_tables = None
+
+def _get_spb_tables():
+    """ Return a dictionary with the reduced chemical potential eta, the
+    Seebeck coefficient S(eta) in uV/K, log F_1/2(eta), their derivatives
+    and the Lorenz number L(eta) in W Ohm K^-2, building the tables the first
+    time the function is called. """
+
+    global _spb_tables
+
+    if _spb_tables is not None:
+        return _spb_tables
+
+    from scipy.special import spence
+
+    eta = np.linspace(
+        _PISARENKO_ETA_MIN, _PISARENKO_ETA_MAX, _PISARENKO_NUM_ETA)
+
+    # F_0 and F_1 have closed forms: F_0 = ln(1 + e^eta) and
+    # F_1 = -Li_2(-e^eta), with Li_2(z) = spence(1 - z).
+
+    f_0 = np.logaddexp(0., eta)
+    f_1 = -spence(1. + np.exp(eta))
+
+    # F_1/2 and F_2 are integrated numerically with x = u^2, which removes
+    # the singularity in the derivative of the F_1/2 integrand at x = 0.
+
+    u = np.linspace(0., np.sqrt(_PISARENKO_ETA_MAX + 50.), 4001)
+
+    f_half, f_2 = np.empty_like(eta), np.empty_like(eta)
+
+    for i in range(0, len(eta), 500):
+        occ = 0.5 * (1. + np.tanh(0.5 * (eta[i:i + 500, np.newaxis] - u ** 2)))
+
+        f_half[i:i + 500] = np.trapezoid(2. * u ** 2 * occ, u, axis=1)
+        f_2[i:i + 500] = np.trapezoid(2. * u ** 5 * occ, u, axis=1)
+
+    s = _K_B_E_UV_K * (2. * f_1 / f_0 - eta)
+    log_f_half = np.log(f_half)
+
+    lorenz = (_K_B / _E) ** 2 * (3. * f_0 * f_2 - 4. * f_1 ** 2) / f_0 ** 2
+
+    _spb_tables = {
+        'eta': eta, 's': s, 'ds_deta': np.gradient(s, eta),
+        'log_f_half': log_f_half,
+        'dlog_f_half_deta': np.gradient(log_f_half, eta), 'lorenz': lorenz}
+
+    return _spb_tables
+
+def _n_prefactor(t, m_eff):
+    """ Return 4 pi (2 m* k_B T / h^2)^(3/2) in cm^-3. """
+
+    return 1.e-6 * 4. * np.pi * (
+        2. * m_eff * _M_E * _K_B * t / _H ** 2) ** 1.5
+
+def _eta_from_s(s):
+    """ Invert S(eta) for |S| in uV/K. """
+
+    tables = _get_spb_tables()
+
+    # S(eta) decreases monotonically, so the tables are reversed for
+    # np.interp().
+
+    return np.interp(np.abs(s), tables['s'][::-1], tables['eta'][::-1])
+
+def _eta_from_n(n, t, m_eff):
+    """ Invert n(eta) for carrier concentrations n, temperatures t and
+    effective masses m_eff. """
+
+    tables = _get_spb_tables()
+
+    return np.interp(np.log(n / _n_prefactor(t, m_eff)),
+                     tables['log_f_half'], tables['eta'])
+
+
+# ---------
+# Functions
+# ---------
+
+def pisarenko_seebeck(n, t, m_eff):
+    """ Return the SPB Seebeck coefficient (uV/K, positive) for carrier
+    concentrations n, temperatures t and effective masses m_eff, which may
+    be scalars or (broadcastable) arrays. """
+
+    tables = _get_spb_tables()
+
+    return np.interp(_eta_from_n(n, t, m_eff), tables['eta'], tables['s'])
+
+def spb_lorenz_number(s):
+    """ Return the SPB Lorenz number (W Ohm K^-2) for Seebeck coefficients
+    s (uV/K), which may be a scalar or an array. """
+
+    tables = _get_spb_tables()
+
+    return np.interp(_eta_from_s(s), tables['eta'], tables['lorenz'])
+
+def seebeck_effective_mass(n, t, s):
+    """ Return the effective mass obtained by inverting the SPB model at
+    each (n, T, S) point. n, t and s may be scalars or (broadcastable)
+    arrays. """
+
+    tables = _get_spb_tables()
+
+    eta = _eta_from_s(s)
+
+    f_half = np.exp(np.interp(eta, tables['eta'], tables['log_f_half']))
+
+    # Invert n = 4 pi (2 m* k_B T / h^2)^(3/2) F_1/2.
+
+    return (_H ** 2 / (2. * _M_E * _K_B * t)) * (
+        1.e6 * n / (4. * np.pi * f_half)) ** (2. / 3.)
+
+@profile_stage
+def fit_pisarenko(n, t, data_2d, components=('xx', 'yy', 'zz', 'ave'),
+                  n_min=None, n_max=None, max_iter=50, tol=1.e-8):
+    """ Fit the SPB model to S as a function of n to obtain an effective
+    mass for each temperature and tensor component. n, t and data_2d are as
+    returned by dataset_to_2d(), and the fit can be restricted to a range of
+    n with n_min and n_max (e.g. to exclude bipolar or highly-degenerate
+    doping levels).
+
+    The fits are performed simultaneously for all temperatures and
+    components with Gauss-Newton iterations on ln(m*), starting from the
+    median of the pointwise masses from seebeck_effective_mass().
+
+    Returns a Pandas DataFrame with columns 't', 'm_eff_*', 'rmse_*'
+    (root-mean-square error in S, uV/K) and 'r2_*' (coefficient of
+    determination) for each component.
+    """
+
+    tables = _get_spb_tables()
+
+    n_mask = np.ones(len(n), dtype=bool)
+
+    if n_min is not None:
+        n_mask = np.logical_and(n_mask, n >= n_min)
+
+    if n_max is not None:
+        n_mask = np.logical_and(n_mask, n <= n_max)
+
+    if n_mask.sum() < 2:
+        raise Exception("At least two carrier concentrations are required "
+                        "to fit the SPB model.")
+
+    n = n[n_mask]
+
+    # Arrange the data as (num_n, num_t * num_components) arrays so that all
+    # the fits are done at once.
+
+    s = np.abs(np.concatenate(
+        [data_2d['s_{0}'.format(c)][n_mask] for c in components], axis=1))
+
+    n_2d = np.broadcast_to(n[:, np.newaxis], s.shape)
+    t_2d = np.broadcast_to(np.tile(t, len(components)), s.shape)
+
+    log_m = np.median(
+        np.log(seebeck_effective_mass(n_2d, t_2d, s)), axis=0)
+
+    for _ in range(max_iter):
+        eta = _eta_from_n(n_2d, t_2d, np.exp(log_m))
+
+        res = np.interp(eta, tables['eta'], tables['s']) - s
+
+        # dS/d(ln m*) = dS/d(eta) * d(eta)/d(ln m*), with
+        # d(eta)/d(ln m*) = -(3/2) / (d ln F_1/2 / d(eta)).
+
+        jac = np.interp(eta, tables['eta'], tables['ds_deta']) * (
+            -1.5 / np.interp(eta, tables['eta'], tables['dlog_f_half_deta']))
+
+        step = -(jac * res).sum(axis=0) / (jac * jac).sum(axis=0)
+
+        # Limit steps to a factor of e in m* for stability.
+
+        step = np.clip(step, -1., 1.)
+
+        log_m += step
+
+        if np.abs(step).max() < tol:
+            break
+
+    m_eff = np.exp(log_m)
+
+    res = pisarenko_seebeck(n_2d, t_2d, m_eff) - s
+
+    rmse = np.sqrt((res ** 2).mean(axis=0))
+
+    ss_tot = ((s - s.mean(axis=0)) ** 2).sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = 1. - (res ** 2).sum(axis=0) / ss_tot
+
+    fit = {'t': t}
+
+    num_t = len(t)
+
+    for i, c in enumerate(components):
+        sl = slice(i * num_t, (i + 1) * num_t)
+
+        fit['m_eff_{0}'.format(c)] = m_eff[sl]
+        fit['rmse_{0}'.format(c)] = rmse[sl]
+        fit['r2_{0}'.format(c)] = r2[sl]
+
+    return pd.DataFrame(fit)
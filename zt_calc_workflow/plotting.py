@@ -17,6 +17,8 @@ import matplotlib as mpl
 
 from matplotlib.colors import hsv_to_rgb
 
+from .interpolation import resample_2d
+
 
 # ---------
 # Functions
@@ -76,3 +78,57 @@ def cscale_fire(n):
 def cscale_ice(n):
     """ Generate an n-point "ice" colour scale. """
     return cscale(n, 240.0, 180.0)
+
+def contour_fmt(v):
+    """ Format a contour label with the minimum number of decimal places
+    needed for multiples of 0.25. """
+
+    if v % 1. == 0.:
+        return "{0:.0f}".format(v)
+
+    if v % 0.5 == 0.:
+        return "{0:.1f}".format(v)
+
+    return "{0:.2f}".format(v)
+
+def plot_zt_map(axes, n, t, zt_2d, t_min=None, t_max=None, norm=None,
+                contour_levels=(0.25, 0.5, 1., 1.5, 2., 2.5),
+                contour_colour='r', resample=None):
+    """ Draw a 2D colour plot of ZT as a function of log(n) and T on axes,
+    with contour lines at contour_levels. n, t and zt_2d are as returned by
+    dataset_to_2d(), and the T range can optionally be restricted with t_min
+    and t_max. If resample is set to a tuple of (num_n, num_t), the data are
+    interpolated onto a finer grid before plotting. Returns the QuadMesh from
+    axes.pcolormesh(). """
+
+    if resample is not None:
+        num_n, num_t = resample
+
+        n_new = np.logspace(np.log10(n.min()), np.log10(n.max()), num_n)
+        t_new = np.linspace(t.min(), t.max(), num_t)
+
+        zt_2d = resample_2d(n, t, zt_2d, n_new, t_new)
+
+        n, t = n_new, t_new
+
+    t_mask = np.ones(len(t), dtype=bool)
+
+    if t_min is not None:
+        t_mask = np.logical_and(t_mask, t >= t_min)
+
+    if t_max is not None:
+        t_mask = np.logical_and(t_mask, t <= t_max)
+
+    x = np.log10(n)
+    y = t[t_mask]
+    z = zt_2d.T[t_mask, :]
+
+    mesh = axes.pcolormesh(x, y, z, norm=norm, shading='gouraud')
+
+    if contour_levels is not None and len(contour_levels) > 0:
+        cs = axes.contour(x, y, z, levels=contour_levels,
+                          colors=contour_colour)
+
+        axes.clabel(cs, cs.levels, inline=True, fmt=contour_fmt)
+
+    return mesh
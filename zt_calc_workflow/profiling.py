@@ -0,0 +1,277 @@
+# zt_calc_workflow/profiling.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for stage-level profiling of the workflow.
+
+Public functions in the package are wrapped with the profile_stage()
+decorator, and user code can time its own stages with the profile_block()
+context manager. Profiling is off by default, in which case the wrappers
+call straight through to the wrapped function. When enabled with
+enable_profiling(), each call records the wall time, CPU time, number of
+rows processed and, optionally, the peak memory allocated via tracemalloc.
+The records are aggregated per stage into a report that can be retrieved
+with get_profile_report() or written to JSON with write_profile_report().
+
+Peak memory is measured with the global tracemalloc peak, so measurements
+for stages running concurrently in multiple threads will overlap.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import functools
+import json
+import threading
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+
+
+# -----
+# State
+# -----
+
+_profiling_enabled = False
+_profiling_trace_memory = False
+_profiling_started_tracemalloc = False
+
+_profile_lock = threading.Lock()
+_profile_local = threading.local()
+
+_profile_stages = {}
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _count_rows(args, result):
+    """ Estimate the number of rows processed by a call from the first
+    argument with a shape or len(), or, failing that, the result. """
+
+    for obj in list(args) + [result]:
+        shape = getattr(obj, 'shape', None)
+
+        if shape is not None and len(shape) > 0:
+            return int(shape[0])
+
+        if isinstance(obj, (list, tuple)) and obj is result:
+            return len(obj)
+
+    return None
+
+def count_result_rows(args, kwargs, result):
+    """ count_rows function for profile_stage() for functions returning a
+    row per item processed. """
+
+    return len(result)
+
+def _get_stack():
+    """ Get the stack of active stages for the current thread. """
+
+    stack = getattr(_profile_local, 'stack', None)
+
+    if stack is None:
+        stack = _profile_local.stack = []
+
+    return stack
+
+def _start_stage():
+    """ Start timing a stage and return a record of the start state. """
+
+    entry = {'peak': 0}
+
+    if _profiling_trace_memory and tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+
+        # Resetting the peak loses the running peak of any enclosing stage, so
+        # save it to the enclosing stage's entry first.
+
+        stack = _get_stack()
+
+        if len(stack) > 0:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+
+        tracemalloc.reset_peak()
+
+        entry['mem_start'] = current
+
+    entry['wall_start'] = time.perf_counter()
+    entry['cpu_start'] = time.process_time()
+
+    _get_stack().append(entry)
+
+    return entry
+
+def _end_stage(name, entry, rows):
+    """ Finish timing a stage and add the record to the report. """
+
+    wall_time = time.perf_counter() - entry['wall_start']
+    cpu_time = time.process_time() - entry['cpu_start']
+
+    stack = _get_stack()
+    stack.pop()
+
+    peak_memory = None
+
+    if 'mem_start' in entry and tracemalloc.is_tracing():
+        _, peak = tracemalloc.get_traced_memory()
+
+        peak = max(entry['peak'], peak)
+        peak_memory = max(peak - entry['mem_start'], 0)
+
+        # Propagate the peak to the enclosing stage.
+
+        if len(stack) > 0:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+
+    with _profile_lock:
+        rec = _profile_stages.get(name)
+
+        if rec is None:
+            rec = _profile_stages[name] = {
+                'calls': 0, 'wall_time': 0., 'wall_time_min': None,
+                'wall_time_max': 0., 'cpu_time': 0., 'rows': None,
+                'peak_memory': None}
+
+        rec['calls'] += 1
+        rec['wall_time'] += wall_time
+        rec['cpu_time'] += cpu_time
+        rec['wall_time_max'] = max(rec['wall_time_max'], wall_time)
+
+        rec['wall_time_min'] = (
+            wall_time if rec['wall_time_min'] is None
+            else min(rec['wall_time_min'], wall_time))
+
+        if rows is not None:
+            rec['rows'] = rows if rec['rows'] is None else rec['rows'] + rows
+
+        if peak_memory is not None:
+            rec['peak_memory'] = (
+                peak_memory if rec['peak_memory'] is None
+                else max(rec['peak_memory'], peak_memory))
+
+
+# --------------
+# Enable/disable
+# --------------
+
+def enable_profiling(trace_memory=True):
+    """ Enable profiling and, if trace_memory is True, measurement of peak
+    memory with tracemalloc (which has a significant overhead). """
+
+    global _profiling_enabled, _profiling_trace_memory
+    global _profiling_started_tracemalloc
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _profiling_started_tracemalloc = True
+
+    _profiling_trace_memory = trace_memory
+    _profiling_enabled = True
+
+def disable_profiling():
+    """ Disable profiling and stop tracemalloc if it was started by
+    enable_profiling(). The collected report is retained. """
+
+    global _profiling_enabled, _profiling_trace_memory
+    global _profiling_started_tracemalloc
+
+    _profiling_enabled = False
+    _profiling_trace_memory = False
+
+    if _profiling_started_tracemalloc:
+        tracemalloc.stop()
+        _profiling_started_tracemalloc = False
+
+def is_profiling_enabled():
+    """ Return True if profiling is enabled. """
+
+    return _profiling_enabled
+
+
+# -----------
+# Instruments
+# -----------
+
+def profile_stage(func=None, name=None, count_rows=None):
+    """ Decorator to profile calls to a function as a stage. name defaults to
+    the module and function name, and count_rows is an optional function
+    taking the call arguments and result and returning the number of rows
+    processed. Can be used with or without arguments. """
+
+    if func is None:
+        return functools.partial(profile_stage, name=name,
+                                 count_rows=count_rows)
+
+    if name is None:
+        name = "{0}.{1}".format(func.__module__.split('.')[-1],
+                                func.__name__)
+
+    @functools.wraps(func)
+    def _wrapper(*args, **kwargs):
+        if not _profiling_enabled:
+            return func(*args, **kwargs)
+
+        entry = _start_stage()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            _end_stage(name, entry, None)
+            raise
+
+        rows = (count_rows(args, kwargs, result) if count_rows is not None
+                else _count_rows(args, result))
+
+        _end_stage(name, entry, rows)
+
+        return result
+
+    return _wrapper
+
+@contextmanager
+def profile_block(name, rows=None):
+    """ Context manager to profile a block of code as a stage. """
+
+    if not _profiling_enabled:
+        yield
+        return
+
+    entry = _start_stage()
+
+    try:
+        yield
+    finally:
+        _end_stage(name, entry, rows)
+
+
+# ---------
+# Reporting
+# ---------
+
+def get_profile_report():
+    """ Return the aggregated profile as a dictionary with an entry for each
+    stage. Times are in s and memory in bytes. """
+
+    with _profile_lock:
+        return {name: dict(rec) for name, rec in _profile_stages.items()}
+
+def reset_profile_report():
+    """ Clear the aggregated profile. """
+
+    with _profile_lock:
+        _profile_stages.clear()
+
+def write_profile_report(file_path):
+    """ Write the aggregated profile to a JSON file. """
+
+    with open(file_path, 'w') as f:
+        json.dump(get_profile_report(), f, indent=2, sort_keys=True)
@@ -0,0 +1,340 @@
+# zt_calc_workflow/report.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for rendering sets of figures for multi-material reports.
+
+A report is a list of figure specifications, each a dictionary with:
+
+    * 'renderer': a renderer function (or the name of one of the built-in
+      renderers in _REPORT_RENDERERS);
+    * 'inputs': a list of input files;
+    * 'output': the output file; and
+    * 'params': an optional dictionary of keyword arguments for the renderer.
+
+Renderers are called as renderer(inputs, output, **params) and must be
+module-level functions so they can be sent to worker processes.
+
+render_report() renders independent figures concurrently in a process pool
+using the Agg backend. Each figure is keyed on a hash of its renderer, input
+file contents and parameters, and is skipped if the output exists and the key
+matches the one recorded in a cache file when it was last rendered.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import hashlib
+import inspect
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .io import hash_file
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _init_worker(setup_kwargs):
+    """ Initialise a worker process for rendering with the Agg backend. """
+
+    import matplotlib
+
+    matplotlib.use('Agg')
+
+    from .plotting import setup_matplotlib
+
+    setup_matplotlib(**setup_kwargs)
+
+def _get_renderer(renderer):
+    """ Resolve a renderer specified as a function or built-in name. """
+
+    if callable(renderer):
+        return renderer
+
+    if renderer not in _REPORT_RENDERERS:
+        raise Exception("Unknown renderer '{0}'.".format(renderer))
+
+    return _REPORT_RENDERERS[renderer]
+
+def _figure_key(renderer, inputs, params, file_hashes):
+    """ Return a hash identifying a figure from its renderer, input file
+    contents and parameters. """
+
+    h = hashlib.sha256()
+
+    # Include the renderer source, where available, so that changes to the
+    # renderer invalidate the cache.
+
+    try:
+        renderer_id = inspect.getsource(renderer)
+    except (OSError, TypeError):
+        renderer_id = "{0}.{1}".format(renderer.__module__,
+                                       renderer.__qualname__)
+
+    h.update(renderer_id.encode('utf-8'))
+
+    for file_path in inputs:
+        if file_path not in file_hashes:
+            file_hashes[file_path] = hash_file(file_path)
+
+        h.update(file_hashes[file_path].encode('utf-8'))
+
+    h.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+
+    return h.hexdigest()
+
+def _render_figure(renderer, inputs, output, params):
+    """ Render a figure in a worker process. """
+
+    renderer(inputs, output, **params)
+
+    return output
+
+def _read_amset_inputs(inputs):
+    """ Read a list of AMSET CSV files. """
+
+    from .amset import read_amset_csv
+
+    return [read_amset_csv(file_path) for file_path in inputs]
+
+def _plot_elec_props(inputs, output, x_key, fixed_key, fixed_val, x_label,
+                     xscale, labels, dpi):
+    """ Shared implementation of render_elec_vs_n() and render_elec_vs_t(). """
+
+    import matplotlib.pyplot as plt
+
+    data_sets = _read_amset_inputs(inputs)
+
+    if labels is None:
+        labels = [os.path.splitext(os.path.basename(f))[0] for f in inputs]
+
+    plt.figure(figsize=(16.2 / 2.54, 13.5 / 2.54))
+
+    subplot_axes = [plt.subplot(2, 2, i + 1) for i in range(4)]
+
+    for data_k, axes in zip(
+            ['sigma_ave', 's_ave', 'pf_ave', 'kappa_el_ave'], subplot_axes):
+        for data, l in zip(data_sets, labels):
+            data = data[data[fixed_key] == fixed_val]
+
+            # Plot |S| rather than S.
+
+            y = data[data_k].to_numpy()
+
+            if data_k == 's_ave':
+                y = np.abs(y)
+
+            axes.plot(data[x_key].to_numpy(), y, label=l)
+
+    for axes in subplot_axes:
+        axes.set_xscale(xscale)
+        axes.set_xlabel(x_label)
+
+        axes.grid(color=(0.9, 0.9, 0.9), dashes=(3., 1.), linewidth=0.5)
+        axes.set_axisbelow(True)
+
+    subplot_axes[0].set_ylabel(r"$\sigma$ [S cm$^{-1}$]")
+    subplot_axes[1].set_ylabel(r"$|S|$ [$\mathrm{\mu}$V K$^{-1}$]")
+    subplot_axes[2].set_ylabel(r"$S^2 \sigma$ (PF) [mW m$^{-1}$ K$^{-2}$]")
+    subplot_axes[3].set_ylabel(r"$\kappa_\mathrm{el}$ [W m$^{-1}$ K$^{-1}$]")
+
+    legend = subplot_axes[0].legend(loc='upper left')
+    legend.get_frame().set_edgecolor('k')
+
+    plt.tight_layout()
+
+    plt.savefig(output, dpi=dpi)
+    plt.close()
+
+
+# ------------------
+# Built-in renderers
+# ------------------
+
+def render_zt_map(inputs, output, kappa_axes=None, key='zt_ave', t_min=None,
+                  t_max=None, contour_levels=(0.25, 0.5, 1., 1.5, 2., 2.5),
+                  dpi=300):
+    """ Render a ZT map from an AMSET and a Phono3py kappa CSV file
+    (inputs). kappa_axes is passed to remap_kappa_axes() if set. """
+
+    import matplotlib.pyplot as plt
+
+    from matplotlib.ticker import FuncFormatter
+
+    from .amset import read_amset_csv
+    from .dataset import zt_dataset_from_data, dataset_to_2d
+    from .phono3py import read_phono3py_kappa_csv, remap_kappa_axes
+    from .plotting import plot_zt_map
+
+    amset_file, kappa_file = inputs
+
+    kappa_data = read_phono3py_kappa_csv(kappa_file)
+
+    if kappa_axes is not None:
+        kappa_data = remap_kappa_axes(kappa_data, kappa_axes)
+
+    n, t, data_2d = dataset_to_2d(
+        zt_dataset_from_data(read_amset_csv(amset_file), kappa_data))
+
+    plt.figure(figsize=(8. / 2.54, 7. / 2.54))
+
+    axes = plt.gca()
+
+    mesh = plot_zt_map(axes, n, t, data_2d[key], t_min=t_min, t_max=t_max,
+                       contour_levels=contour_levels)
+
+    plt.colorbar(mesh, ax=axes, label=r"$ZT$")
+
+    axes.xaxis.set_major_formatter(
+        FuncFormatter(lambda v, pos: "$10^{{{0:.0f}}}$".format(v)))
+
+    axes.set_xlabel(r"Doping Level $n$ [cm$^{-3}$]")
+    axes.set_ylabel(r"$T$ [K]")
+
+    plt.tight_layout()
+
+    plt.savefig(output, dpi=dpi)
+    plt.close()
+
+def render_elec_vs_n(inputs, output, t, labels=None, dpi=300):
+    """ Render a comparison of \\sigma, S, PF and \\kappa_el as a function of
+    n at temperature t from a list of AMSET CSV files (inputs). """
+
+    _plot_elec_props(inputs, output, 'n', 't', t,
+                     r"Doping Level $n$ [cm$^{-3}$]", 'log', labels, dpi)
+
+def render_elec_vs_t(inputs, output, n, labels=None, dpi=300):
+    """ Render a comparison of \\sigma, S, PF and \\kappa_el as a function of
+    T at carrier concentration n from a list of AMSET CSV files (inputs). """
+
+    _plot_elec_props(inputs, output, 't', 'n', n, r"$T$ [K]", 'linear',
+                     labels, dpi)
+
+def render_k_latt_crta(inputs, output, labels=None, dpi=300):
+    """ Render the CRTA \\kappa, \\kappa / \\tau^CRTA and \\tau^CRTA from a list
+    of Phono3py CRTA CSV files (inputs), one column per file. """
+
+    import matplotlib.pyplot as plt
+
+    from .phono3py import read_phono3py_crta_csv
+
+    if labels is None:
+        labels = [os.path.splitext(os.path.basename(f))[0] for f in inputs]
+
+    num_cols = len(inputs)
+
+    plt.figure(figsize=(6. * num_cols / 2.54, 15. / 2.54))
+
+    for i, (file_path, label) in enumerate(zip(inputs, labels)):
+        df = read_phono3py_crta_csv(file_path)
+
+        for j, k in enumerate(['kappa', 'kappa_tau_crta', 'tau_crta']):
+            axes = plt.subplot(3, num_cols, j * num_cols + i + 1)
+
+            for suffix, c in zip(['xx', 'yy', 'zz', 'ave'],
+                                 ['b', 'r', 'g', 'k']):
+                axes.plot(df['t'], df['{0}_{1}'.format(k, suffix)],
+                          label=suffix, color=c)
+
+            if j == 0:
+                axes.set_title(label)
+
+            if j == 2:
+                axes.set_xlabel(r"$T$ [K]")
+
+            axes.grid(color=(0.9, 0.9, 0.9), dashes=(3.0, 1.0), linewidth=.5)
+
+    plt.tight_layout()
+
+    plt.savefig(output, dpi=dpi)
+    plt.close()
+
+_REPORT_RENDERERS = {
+    'zt_map': render_zt_map, 'elec_vs_n': render_elec_vs_n,
+    'elec_vs_t': render_elec_vs_t, 'k_latt_crta': render_k_latt_crta}
+
+
+# ---------
+# Functions
+# ---------
+
+def render_report(figures, max_workers=None, cache_file=None, force=False,
+                  setup_kwargs=None):
+    """ Render a list of figure specifications (see module docstring) in a
+    process pool with max_workers processes, skipping figures that are up to
+    date according to cache_file (default: ".zt_report_cache.json" in the
+    current directory). If force is True, all figures are rendered.
+    setup_kwargs are passed to setup_matplotlib() in each worker.
+
+    Returns a dictionary of {output: status}, where status is one of
+    'cached', 'rendered' or 'failed: <error>'.
+    """
+
+    if cache_file is None:
+        cache_file = ".zt_report_cache.json"
+
+    if setup_kwargs is None:
+        setup_kwargs = {}
+
+    cache = {}
+
+    if os.path.isfile(cache_file):
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+
+    # Work out which figures need to be rendered.
+
+    file_hashes = {}
+
+    status, to_render = {}, []
+
+    for fig in figures:
+        renderer = _get_renderer(fig['renderer'])
+        params = fig.get('params', {})
+
+        key = _figure_key(renderer, fig['inputs'], params, file_hashes)
+
+        output = fig['output']
+
+        if (not force and cache.get(output) == key
+                and os.path.isfile(output)):
+            status[output] = 'cached'
+        else:
+            to_render.append((renderer, fig['inputs'], output, params, key))
+
+    # Render in a process pool.
+
+    if len(to_render) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_worker,
+                                 initargs=(setup_kwargs, )) as executor:
+            futures = [
+                (output, key, executor.submit(
+                    _render_figure, renderer, inputs, output, params))
+                        for renderer, inputs, output, params, key in to_render]
+
+            for output, key, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    cache.pop(output, None)
+                    status[output] = "failed: {0}".format(e)
+                else:
+                    cache[output] = key
+                    status[output] = 'rendered'
+
+        with open(cache_file, 'w') as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+
+    return status
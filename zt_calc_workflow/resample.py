@@ -0,0 +1,139 @@
+# zt_calc_workflow/resample.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for resampling several 2D (n, T) datasets, as returned by
+dataset.dataset_to_2d(), onto a common grid for cross-material comparisons.
+
+Datasets are interpolated in (log n, T) onto the common grid and stacked into
+(num_datasets, num_n, num_t) arrays, with points outside the n and T range of
+each dataset set to NaN rather than extrapolated. Maxima, rankings and
+difference maps can then be computed with NumPy reductions over the stacks
+(e.g. np.nanmax(), np.nanargmax()).
+"""
+
+
+# -------
+# Imports
+# -------
+
+import numpy as np
+
+from .interpolation import get_interpolator
+from .profiling import profile_stage
+
+
+# ---------
+# Functions
+# ---------
+
+def common_grid(datasets, num_n=None, num_t=None):
+    """ Return a common set of n and T values for a list of datasets as
+    (n, t, data_2d) tuples.
+
+    By default, the common grid is the union of the n and T values of the
+    datasets, so that every calculated point is included and maxima over the
+    resampled data are the same as over the original data. Alternatively,
+    if num_n and/or num_t are set, that number of points is spaced uniformly
+    in log(n) and/or T over the combined range of the datasets.
+    """
+
+    if len(datasets) == 0:
+        raise Exception("At least one dataset is required.")
+
+    all_n = np.concatenate([np.asarray(n, dtype=np.float64)
+                                for n, _, _ in datasets])
+    all_t = np.concatenate([np.asarray(t, dtype=np.float64)
+                                for _, t, _ in datasets])
+
+    if num_n is not None:
+        n = np.logspace(np.log10(all_n.min()), np.log10(all_n.max()), num_n)
+    else:
+        n = np.unique(all_n)
+
+    if num_t is not None:
+        t = np.linspace(all_t.min(), all_t.max(), num_t)
+    else:
+        t = np.unique(all_t)
+
+    return (n, t)
+
+@profile_stage
+def resample_datasets(datasets, keys=None, n=None, t=None, num_n=None,
+                      num_t=None, cache_key=None):
+    """ Resample datasets onto a common grid (see module docstring).
+
+    datasets is a list of (n, t, data_2d) tuples or a dictionary of
+    {name: (n, t, data_2d)}. keys specifies the properties to resample
+    (default: those present in all the datasets). The common grid can be
+    given with n and t, or is otherwise obtained from common_grid() with
+    num_n and num_t.
+
+    If cache_key is set to a key identifying the set of datasets, the
+    interpolants for each dataset are cached (see interpolation.py) under
+    cache_key and the dataset name (or index), so that repeated resampling
+    of the same datasets (e.g. onto different grids) reuses them.
+
+    Returns a tuple of (n, t, stacks), where stacks is a dictionary of
+    {key: (num_datasets, num_n, num_t) array}, with the datasets in the
+    order of the list or dictionary.
+    """
+
+    if isinstance(datasets, dict):
+        names = list(datasets.keys())
+        datasets = list(datasets.values())
+    else:
+        names = list(range(len(datasets)))
+
+    if n is None or t is None:
+        grid_n, grid_t = common_grid(datasets, num_n=num_n, num_t=num_t)
+
+        n = grid_n if n is None else n
+        t = grid_t if t is None else t
+
+    n = np.asarray(n, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+
+    if keys is None:
+        keys = [k for k in datasets[0][2].keys()
+                    if all(k in data_2d for _, _, data_2d in datasets)]
+
+    log_n_2d, t_2d = np.meshgrid(np.log10(n), t, indexing='ij')
+
+    stacks = {k: np.full((len(datasets), len(n), len(t)), np.nan)
+                  for k in keys}
+
+    for i, (d_n, d_t, data_2d) in enumerate(datasets):
+        d_log_n = np.log10(d_n)
+
+        # Only points within the range of the dataset (with a small
+        # tolerance for rounding) are interpolated.
+
+        tol_n = 1.e-9 * max(np.ptp(d_log_n), 1.)
+        tol_t = 1.e-9 * max(np.ptp(d_t), 1.)
+
+        mask = np.logical_and.reduce(
+            [log_n_2d >= d_log_n.min() - tol_n,
+             log_n_2d <= d_log_n.max() + tol_n,
+             t_2d >= d_t.min() - tol_t, t_2d <= d_t.max() + tol_t])
+
+        if not mask.any():
+            continue
+
+        # Interpolating a stack of the properties evaluates all of them in
+        # one call.
+
+        interpolator = get_interpolator(
+            d_n, d_t, np.stack([data_2d[k] for k in keys], axis=-1),
+            cache_key=(None if cache_key is None
+                           else (cache_key, names[i], tuple(keys))))
+
+        vals = interpolator((log_n_2d[mask], t_2d[mask]))
+
+        for j, k in enumerate(keys):
+            stacks[k][i][mask] = vals[:, j]
+
+    return (n, t, stacks)
@@ -0,0 +1,265 @@
+# zt_calc_workflow/scattered.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for working with datasets on non-uniform n/T grids, e.g. from
+adaptive or merged AMSET calculations read with check_uniform=False.
+
+Rather than padding the data onto a full rectangular grid, a Delaunay
+triangulation of the data points in (log n, T) is built and used for linear
+(barycentric) interpolation, with nearest-neighbour values from a KD-tree
+outside the convex hull of the data. Triangulations are cached on the data
+coordinates, so interpolants for different properties, or repeated calls with
+the same dataset, share the expensive setup.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import hashlib
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .analysis import _match_interpolated
+from .profiling import count_result_rows, profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+# Maximum number of triangulations to keep in the cache.
+
+_TRIANGULATION_CACHE_SIZE = 16
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+_triangulation_cache = OrderedDict()
+
+def _get_triangulation(log_n, t):
+    """ Return a dictionary with a Delaunay triangulation and KD-tree for the
+    points (log_n, t), building and caching them if required. """
+
+    from scipy.spatial import cKDTree, Delaunay
+
+    h = hashlib.sha1()
+    h.update(log_n.tobytes())
+    h.update(t.tobytes())
+
+    key = h.hexdigest()
+
+    if key in _triangulation_cache:
+        _triangulation_cache.move_to_end(key)
+        return _triangulation_cache[key]
+
+    # log(n) and T have very different ranges, so scale both to [0, 1] before
+    # triangulating to avoid long, thin triangles.
+
+    points = np.array([log_n, t]).T
+
+    offset = points.min(axis=0)
+    scale = points.max(axis=0) - offset
+    scale[scale == 0.] = 1.
+
+    points = (points - offset) / scale
+
+    tri = {'tri': Delaunay(points), 'tree': cKDTree(points),
+           'offset': offset, 'scale': scale}
+
+    _triangulation_cache[key] = tri
+
+    while len(_triangulation_cache) > _TRIANGULATION_CACHE_SIZE:
+        _triangulation_cache.popitem(last=False)
+
+    return tri
+
+def _evaluate_points(interp, log_n, t):
+    """ Evaluate the interpolant at flat arrays of log_n and t and return a
+    (num_points, num_keys) array of values. """
+
+    tri = interp['triangulation']
+
+    xi = (np.array([log_n, t], dtype=np.float64).T - tri['offset']) \
+        / tri['scale']
+
+    values = interp['values']
+
+    res = np.empty((len(xi), values.shape[1]), dtype=np.float64)
+
+    # Barycentric interpolation for points inside the convex hull.
+
+    simplex = tri['tri'].find_simplex(xi)
+
+    inside = simplex >= 0
+
+    if inside.any():
+        s = simplex[inside]
+
+        transform = tri['tri'].transform[s]
+
+        b = np.einsum('ijk,ik->ij', transform[:, :2],
+                      xi[inside] - transform[:, 2])
+
+        b = np.concatenate([b, 1. - b.sum(axis=1)[:, np.newaxis]], axis=1)
+
+        res[inside] = np.einsum(
+            'ij,ijk->ik', b, values[tri['tri'].simplices[s]])
+
+    # Nearest-neighbour values outside.
+
+    if not inside.all():
+        _, idx = tri['tree'].query(xi[~inside])
+        res[~inside] = values[idx]
+
+    return res
+
+
+# ---------
+# Functions
+# ---------
+
+@profile_stage
+def build_scattered_interpolant(data, keys=None):
+    """ Build an interpolant for the properties in keys (default: all columns
+    other than 'n' and 't') from a Pandas DataFrame with data at arbitrary
+    (n, T). Duplicate (n, T) points, e.g. from merged calculations, are
+    averaged.
+
+    Returns a dictionary to pass to the other functions in this module.
+    """
+
+    if keys is None:
+        keys = [k for k in data.columns if k not in ('n', 't')]
+    else:
+        keys = list(keys)
+
+    data = data[['n', 't'] + keys].groupby(['n', 't'], as_index=False).mean()
+
+    log_n = np.log10(data['n'].to_numpy(dtype=np.float64))
+    t = data['t'].to_numpy(dtype=np.float64)
+
+    if len(data) < 3:
+        raise Exception("At least three distinct (n, T) points are required "
+                        "to build an interpolant.")
+
+    return {'log_n': log_n, 't': t, 'keys': keys,
+            'values': data[keys].to_numpy(dtype=np.float64),
+            'triangulation': _get_triangulation(log_n, t)}
+
+def evaluate_scattered(interp, n, t, keys=None):
+    """ Evaluate an interpolant from build_scattered_interpolant() at
+    carrier concentrations n and temperatures t, which may be scalars or
+    arrays of any (broadcastable) shape. Returns a dictionary of
+    {key: values}. """
+
+    n, t = np.broadcast_arrays(np.asarray(n, dtype=np.float64),
+                               np.asarray(t, dtype=np.float64))
+
+    res = _evaluate_points(interp, np.log10(n).ravel(), t.ravel())
+
+    if keys is None:
+        keys = interp['keys']
+
+    return {k: res[:, interp['keys'].index(k)].reshape(n.shape)
+                for k in keys}
+
+@profile_stage
+def get_zt_max_scattered(interp, n_min=None, n_max=None, t_min=None,
+                         t_max=None, key='zt_ave', num_edge_samples=101):
+    """ Locate the maximum of key (default: 'zt_ave') in an interpolant from
+    build_scattered_interpolant(), with optional bounds on n and T, and
+    return the interpolated properties at the maximum as a Pandas Series.
+
+    The maximum of a piecewise-linear interpolant lies at one of the data
+    points or on the boundary of the n/T window, so the search considers the
+    data points inside the window and num_edge_samples points along each
+    edge of the window (within the range of the data).
+    """
+
+    log_n, t = interp['log_n'], interp['t']
+
+    log_n_min = np.log10(n_min) if n_min is not None else log_n.min()
+    log_n_max = np.log10(n_max) if n_max is not None else log_n.max()
+
+    log_n_min, log_n_max = max(log_n_min, log_n.min()), \
+        min(log_n_max, log_n.max())
+
+    t_min = max(t_min, t.min()) if t_min is not None else t.min()
+    t_max = min(t_max, t.max()) if t_max is not None else t.max()
+
+    if log_n_min > log_n_max or t_min > t_max:
+        raise Exception("The n/T window does not overlap the data.")
+
+    mask = np.logical_and.reduce(
+        [log_n >= log_n_min, log_n <= log_n_max, t >= t_min, t <= t_max])
+
+    edge_log_n = np.linspace(log_n_min, log_n_max, num_edge_samples)
+    edge_t = np.linspace(t_min, t_max, num_edge_samples)
+
+    cand_log_n = np.concatenate(
+        [log_n[mask], edge_log_n, edge_log_n,
+         np.full_like(edge_t, log_n_min), np.full_like(edge_t, log_n_max)])
+
+    cand_t = np.concatenate(
+        [t[mask], np.full_like(edge_log_n, t_min),
+         np.full_like(edge_log_n, t_max), edge_t, edge_t])
+
+    # Only consider points inside the convex hull of the data, so that the
+    # result is not an extrapolation.
+
+    tri = interp['triangulation']
+
+    xi = (np.array([cand_log_n, cand_t]).T - tri['offset']) / tri['scale']
+
+    inside = tri['tri'].find_simplex(xi) >= 0
+
+    # The window can overlap the bounding box of the data but not its
+    # convex hull.
+
+    if not inside.any():
+        raise Exception("The n/T window does not overlap the data.")
+
+    cand_log_n, cand_t = cand_log_n[inside], cand_t[inside]
+
+    vals = _evaluate_points(interp, cand_log_n, cand_t)
+
+    key_vals = vals[:, interp['keys'].index(key)]
+
+    if np.isnan(key_vals).all():
+        raise Exception("No valid values of '{0}' in the n/T window."
+                        .format(key))
+
+    idx = np.nanargmax(key_vals)
+
+    rec = pd.Series(vals[idx], index=interp['keys'])
+
+    return pd.concat([pd.Series({'n': np.power(10., cand_log_n[idx]),
+                                 't': cand_t[idx]}), rec])
+
+@profile_stage(count_rows=count_result_rows)
+def match_data_scattered(interp, key, to_match, mode='same_t', num_seeds=1):
+    """ Equivalent of analysis.match_data() for an interpolant from
+    build_scattered_interpolant(). key specifies the property to match. """
+
+    k_idx = interp['keys'].index(key)
+
+    def _evaluate(log_n, t):
+        log_n, t = np.broadcast_arrays(log_n, t)
+
+        return _evaluate_points(interp, log_n.ravel(), t.ravel())[
+            :, k_idx].reshape(log_n.shape)
+
+    return _match_interpolated(
+        _evaluate, interp['log_n'], interp['t'], interp['values'][:, k_idx],
+        to_match, mode, num_seeds)
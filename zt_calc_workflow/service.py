@@ -0,0 +1,461 @@
+# zt_calc_workflow/service.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" A local query service that keeps ZT datasets and interpolants loaded in
+memory, so that point queries (ZT at (n, T), ZT_max in a window, matching
+measurements) do not pay the cost of starting Python and reading the input
+files each time.
+
+The service is an asyncio server listening on a localhost TCP port or a Unix
+socket. Requests and responses are JSON objects, one per line:
+
+    {"id": 1, "method": "zt_max", "params": {"dataset": {...}, "t_max": 880}}
+    {"id": 1, "result": {"n": 4e+19, "t": 880.0, ...}}
+
+with {"id": ..., "error": "..."} returned if a request fails. Requests on a
+connection are processed concurrently in a thread pool and responses may be
+returned out of order, so clients should match them by id.
+
+Datasets are specified in requests by a dictionary with either 'amset' and
+'kappa' CSV files (and optionally 'kappa_axes', 'lorenz_model' and
+'memory_mode'), or a 'file' with a ZT dataset saved as a CSV file. Loaded
+datasets are kept in a cache with the least recently used evicted first.
+
+The methods are:
+
+    * 'ping': return the number of loaded datasets;
+    * 'load': load a dataset and return its size and keys;
+    * 'datasets': return the specifications of the loaded datasets;
+    * 'interpolate': interpolate a property ('key', default: 'zt_ave') at
+      points 'n' and 't' (scalars or lists). Values are not extrapolated:
+      the request fails with an error if any point is outside the (n, T)
+      range of the dataset;
+    * 'zt_max': return the ZT_max record for a dataset, with optional bounds
+      'n_min', 'n_max', 't_min' and 't_max'; and
+    * 'match': match a property ('key', default: 's_ave') to 'to_match', a
+      list of [n or null, t, value], with match_data() options 'mode' and
+      'num_seeds'.
+
+handle_request() processes a request without a server, and query_service()
+is a simple (blocking) client.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import asyncio
+import itertools
+import json
+import socket
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .amset import read_amset_csv
+from .analysis import get_zt_max, match_data
+from .dataset import dataset_to_2d, zt_dataset_from_data
+from .interpolation import get_interpolator
+from .phono3py import read_phono3py_kappa_csv, remap_kappa_axes
+
+
+# ---------
+# Constants
+# ---------
+
+_SERVICE_DEFAULT_HOST = '127.0.0.1'
+_SERVICE_DEFAULT_PORT = 8765
+
+# Default maximum number of datasets to keep loaded.
+
+_SERVICE_DATASET_CACHE_SIZE = 8
+
+# Limit on the length of request lines (bytes).
+
+_SERVICE_LINE_LIMIT = 1 << 24
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+_service_datasets = OrderedDict()
+_service_datasets_lock = threading.Lock()
+_service_loading_locks = {}
+_service_dataset_cache_size = _SERVICE_DATASET_CACHE_SIZE
+_service_ids = itertools.count()
+
+def _dataset_key(spec):
+    """ Return a key identifying a dataset from its specification. """
+
+    if not isinstance(spec, dict):
+        raise Exception("Dataset must be specified as a dictionary.")
+
+    return json.dumps(spec, sort_keys=True)
+
+def _load_dataset(spec):
+    """ Load a dataset from its specification and return a cache entry. """
+
+    memory_mode = spec.get('memory_mode')
+
+    if 'file' in spec:
+        data = pd.read_csv(spec['file'])
+    elif 'amset' in spec and 'kappa' in spec:
+        kappa_data = read_phono3py_kappa_csv(
+            spec['kappa'], memory_mode=memory_mode)
+
+        if spec.get('kappa_axes') is not None:
+            kappa_data = remap_kappa_axes(kappa_data, spec['kappa_axes'])
+
+        data = zt_dataset_from_data(
+            read_amset_csv(spec['amset'], memory_mode=memory_mode),
+            kappa_data, lorenz_model=spec.get('lorenz_model'))
+    else:
+        raise Exception("Dataset must be specified by a 'file' or by "
+                        "'amset' and 'kappa' files.")
+
+    n, t, data_2d = dataset_to_2d(data)
+
+    # Interpolants for matching are cached under an id unique to this load
+    # of the dataset, so that they are not reused if it is reloaded.
+
+    return {'spec': spec, 'data': data, 'n': n, 't': t, 'data_2d': data_2d,
+            'interpolators': {}, 'cache_id': ('service', next(_service_ids))}
+
+def _get_dataset(spec):
+    """ Return the cache entry for a dataset, loading it if required. """
+
+    key = _dataset_key(spec)
+
+    with _service_datasets_lock:
+        if key in _service_datasets:
+            _service_datasets.move_to_end(key)
+            return _service_datasets[key]
+
+        loading_lock = _service_loading_locks.setdefault(
+            key, threading.Lock())
+
+    # Concurrent requests for the same dataset wait for the first to load
+    # it, while requests for other datasets are not blocked.
+
+    with loading_lock:
+        with _service_datasets_lock:
+            if key in _service_datasets:
+                _service_datasets.move_to_end(key)
+                return _service_datasets[key]
+
+        entry = _load_dataset(spec)
+
+        with _service_datasets_lock:
+            _service_datasets[key] = entry
+
+            while len(_service_datasets) > _service_dataset_cache_size:
+                _service_datasets.popitem(last=False)
+
+            _service_loading_locks.pop(key, None)
+
+    return entry
+
+def _get_entry_interpolator(entry, key):
+    """ Return an interpolant for a property in a dataset, which is kept
+    with the dataset so that repeated queries reuse it. """
+
+    if key not in entry['data_2d']:
+        raise Exception("Unknown key '{0}'.".format(key))
+
+    interpolator = entry['interpolators'].get(key)
+
+    if interpolator is None:
+        interpolator = get_interpolator(
+            entry['n'], entry['t'], entry['data_2d'][key])
+
+        entry['interpolators'][key] = interpolator
+
+    return interpolator
+
+def _to_json(v):
+    """ Convert NumPy and Pandas types in v to JSON-serialisable types. """
+
+    if isinstance(v, dict):
+        return {k: _to_json(x) for k, x in v.items()}
+
+    if isinstance(v, (list, tuple)):
+        return [_to_json(x) for x in v]
+
+    if isinstance(v, pd.Series):
+        return {k: _to_json(x) for k, x in v.items()}
+
+    if isinstance(v, np.ndarray):
+        return v.tolist()
+
+    if isinstance(v, np.generic):
+        return v.item()
+
+    return v
+
+def _handle_ping(params):
+    """ Handle a 'ping' request. """
+
+    with _service_datasets_lock:
+        return {'datasets': len(_service_datasets)}
+
+def _handle_load(params):
+    """ Handle a 'load' request. """
+
+    entry = _get_dataset(params['dataset'])
+
+    return {'num_n': len(entry['n']), 'num_t': len(entry['t']),
+            'keys': list(entry['data_2d'].keys())}
+
+def _handle_datasets(params):
+    """ Handle a 'datasets' request. """
+
+    with _service_datasets_lock:
+        return [entry['spec'] for entry in _service_datasets.values()]
+
+def _handle_interpolate(params):
+    """ Handle an 'interpolate' request. """
+
+    entry = _get_dataset(params['dataset'])
+
+    interpolator = _get_entry_interpolator(
+        entry, params.get('key', 'zt_ave'))
+
+    n, t = np.broadcast_arrays(
+        np.asarray(params['n'], dtype=np.float64),
+        np.asarray(params['t'], dtype=np.float64))
+
+    # The interpolants extrapolate outside the grid, which can give
+    # unphysical values, so reject points outside the range of the data.
+
+    inside = np.logical_and.reduce(
+        [n >= entry['n'].min(), n <= entry['n'].max(),
+         t >= entry['t'].min(), t <= entry['t'].max()])
+
+    if not np.all(inside):
+        raise Exception(
+            "{0} point(s) outside the range of the dataset (n = {1:.3e} - "
+            "{2:.3e}, T = {3:g} - {4:g}).".format(
+                np.size(inside) - np.count_nonzero(inside), entry['n'].min(),
+                entry['n'].max(), entry['t'].min(), entry['t'].max()))
+
+    return interpolator((np.log10(n), t))
+
+def _handle_zt_max(params):
+    """ Handle a 'zt_max' request. """
+
+    entry = _get_dataset(params['dataset'])
+
+    return get_zt_max(
+        entry['data'], n_min=params.get('n_min'), n_max=params.get('n_max'),
+        t_min=params.get('t_min'), t_max=params.get('t_max'))
+
+def _handle_match(params):
+    """ Handle a 'match' request. """
+
+    entry = _get_dataset(params['dataset'])
+
+    key = params.get('key', 's_ave')
+
+    if key not in entry['data_2d']:
+        raise Exception("Unknown key '{0}'.".format(key))
+
+    to_match = [tuple(v) for v in params['to_match']]
+
+    res = match_data(entry['n'], entry['t'], entry['data_2d'][key], to_match,
+                     mode=params.get('mode', 'same_t'),
+                     num_seeds=params.get('num_seeds', 1),
+                     cache_key=(entry['cache_id'], key))
+
+    return [[float(n), float(t), float(v)] for n, t, v in res]
+
+_SERVICE_METHODS = {
+    'ping': _handle_ping, 'load': _handle_load,
+    'datasets': _handle_datasets, 'interpolate': _handle_interpolate,
+    'zt_max': _handle_zt_max, 'match': _handle_match}
+
+async def _handle_connection(reader, writer, executor):
+    """ Process requests from a connection until it is closed. """
+
+    loop = asyncio.get_running_loop()
+
+    write_lock = asyncio.Lock()
+
+    async def _process(line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            response = {'id': None, 'error': "Invalid request: {0}".format(e)}
+        else:
+            response = await loop.run_in_executor(
+                executor, handle_request, request)
+
+        async with write_lock:
+            writer.write((json.dumps(response) + '\n').encode('utf-8'))
+            await writer.drain()
+
+    tasks = set()
+
+    try:
+        while True:
+            line = await reader.readline()
+
+            if not line:
+                break
+
+            if line.strip() == b'':
+                continue
+
+            task = asyncio.ensure_future(_process(line))
+
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if len(tasks) > 0:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        writer.close()
+
+
+# ---------
+# Functions
+# ---------
+
+def handle_request(request):
+    """ Process a request (see module docstring) and return the response.
+    Errors are returned in the response rather than raised. """
+
+    request_id = request.get('id') if isinstance(request, dict) else None
+
+    try:
+        method = request['method']
+
+        if method not in _SERVICE_METHODS:
+            raise Exception("Unknown method '{0}'.".format(method))
+
+        result = _SERVICE_METHODS[method](request.get('params', {}))
+
+        return {'id': request_id, 'result': _to_json(result)}
+    except Exception as e:
+        return {'id': request_id, 'error': "{0}: {1}".format(
+            type(e).__name__, e)}
+
+def set_dataset_cache_size(size):
+    """ Set the maximum number of datasets to keep loaded, evicting the least
+    recently used datasets if required. """
+
+    global _service_dataset_cache_size
+
+    if size < 1:
+        raise Exception("size must be at least 1.")
+
+    with _service_datasets_lock:
+        _service_dataset_cache_size = size
+
+        while len(_service_datasets) > size:
+            _service_datasets.popitem(last=False)
+
+def clear_dataset_cache():
+    """ Unload all datasets. """
+
+    with _service_datasets_lock:
+        _service_datasets.clear()
+
+async def start_service(host=None, port=None, path=None, max_workers=None):
+    """ Start the service, listening on host:port (default:
+    _SERVICE_DEFAULT_HOST:_SERVICE_DEFAULT_PORT) or, if path is set, on a
+    Unix socket, and return the asyncio Server. Requests are processed in a
+    thread pool with max_workers threads. Use port=0 to listen on a free
+    port. """
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def _on_connect(reader, writer):
+        return _handle_connection(reader, writer, executor)
+
+    if path is not None:
+        server = await asyncio.start_unix_server(
+            _on_connect, path=path, limit=_SERVICE_LINE_LIMIT)
+    else:
+        server = await asyncio.start_server(
+            _on_connect,
+            host=host if host is not None else _SERVICE_DEFAULT_HOST,
+            port=port if port is not None else _SERVICE_DEFAULT_PORT,
+            limit=_SERVICE_LINE_LIMIT)
+
+    return server
+
+def run_service(host=None, port=None, path=None, max_workers=None):
+    """ Run the service until interrupted (see start_service()). """
+
+    async def _run():
+        server = await start_service(host=host, port=port, path=path,
+                                     max_workers=max_workers)
+
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(_run())
+    except KeyboardInterrupt:
+        pass
+
+def query_service(requests, host=None, port=None, path=None, timeout=None):
+    """ Send a request, or a list of requests, to a running service and
+    return the response(s). Requests are dictionaries with 'method' and
+    'params' and are sent on one connection; ids are assigned if not given,
+    and responses are returned in the order of the requests. Errors are
+    raised as exceptions. """
+
+    single = isinstance(requests, dict)
+
+    if single:
+        requests = [requests]
+
+    requests = [dict(r, id=r.get('id', i)) for i, r in enumerate(requests)]
+
+    if path is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(path)
+    else:
+        sock = socket.create_connection(
+            (host if host is not None else _SERVICE_DEFAULT_HOST,
+             port if port is not None else _SERVICE_DEFAULT_PORT),
+            timeout=timeout)
+
+    responses = {}
+
+    with sock, sock.makefile('rb') as f:
+        sock.sendall(b''.join((json.dumps(r) + '\n').encode('utf-8')
+                                  for r in requests))
+
+        sock.shutdown(socket.SHUT_WR)
+
+        for line in f:
+            response = json.loads(line)
+            responses[response['id']] = response
+
+    results = []
+
+    for r in requests:
+        response = responses.get(r['id'])
+
+        if response is None:
+            raise Exception("No response to request {0}.".format(r['id']))
+
+        if 'error' in response:
+            raise Exception(response['error'])
+
+        results.append(response['result'])
+
+    return results[0] if single else results
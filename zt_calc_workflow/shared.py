@@ -0,0 +1,168 @@
+# zt_calc_workflow/shared.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for sharing 2D datasets between processes without copying.
+
+publish_dataset_2d() writes the (property, n, T) arrays from dataset_to_2d()
+to a memory-mapped file, by default in /dev/shm where available, and returns
+a small, picklable handle. Worker processes pass the handle to
+attach_dataset_2d() to obtain read-only views backed by the same physical
+memory, so a multi-process job holds a single copy of the data regardless of
+the number of workers. The publishing process is responsible for calling
+release_dataset_2d(), or for using the shared_dataset_2d() context manager;
+any files not released explicitly are removed when the publishing process
+exits.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import atexit
+import os
+import tempfile
+
+from contextlib import contextmanager
+
+import numpy as np
+
+from .dataset import dataset_to_2d
+
+
+# ---------
+# Constants
+# ---------
+
+_SHARED_DEFAULT_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+# ----------------
+# Lifecycle record
+# ----------------
+
+# Files published by this process that have not yet been released, removed on
+# exit. Worker processes created by forking inherit a copy of this set, so
+# cleanup is only performed by the process that published the data.
+
+_published_files = set()
+_published_pid = os.getpid()
+
+def _cleanup_published_files():
+    """ Remove any files published by this process that were not released. """
+
+    if os.getpid() != _published_pid:
+        return
+
+    for file_path in list(_published_files):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+    _published_files.clear()
+
+atexit.register(_cleanup_published_files)
+
+
+# ---------
+# Functions
+# ---------
+
+def publish_dataset_2d(n_vals, t_vals, data_2d, keys=None, dir_path=None):
+    """ Publish a set of n and T values and a dictionary of 2D NumPy arrays,
+    e.g. from dataset_to_2d(), to a memory-mapped file and return a handle
+    that can be passed to worker processes and to attach_dataset_2d(). keys
+    optionally selects a subset of the data to publish. """
+
+    global _published_pid
+
+    n_vals = np.asarray(n_vals, dtype=np.float64)
+    t_vals = np.asarray(t_vals, dtype=np.float64)
+
+    if keys is None:
+        keys = list(data_2d.keys())
+
+    shape = (len(keys), len(n_vals), len(t_vals))
+
+    if dir_path is None:
+        dir_path = _SHARED_DEFAULT_DIR
+
+    fd, file_path = tempfile.mkstemp(prefix='zt_calc_', suffix='.npy',
+                                     dir=dir_path)
+    os.close(fd)
+
+    if os.getpid() != _published_pid:
+        _published_files.clear()
+        _published_pid = os.getpid()
+
+    _published_files.add(file_path)
+
+    try:
+        arr = np.lib.format.open_memmap(file_path, mode='w+',
+                                        dtype=np.float64, shape=shape)
+
+        for i, k in enumerate(keys):
+            if np.shape(data_2d[k]) != shape[1:]:
+                raise Exception("Shape of data '{0}' does not match the "
+                                "number of n and T values.".format(k))
+
+            arr[i] = data_2d[k]
+
+        arr.flush()
+
+        del arr
+    except Exception:
+        release_dataset_2d({'path': file_path})
+        raise
+
+    return {'path': file_path, 'n': n_vals, 't': t_vals, 'keys': list(keys)}
+
+def publish_dataset(data, keys=None, dir_path=None):
+    """ Convert a (uniform) dataset as a Pandas DataFrame with dataset_to_2d()
+    and publish it with publish_dataset_2d(). """
+
+    n_vals, t_vals, data_2d = dataset_to_2d(data)
+
+    return publish_dataset_2d(n_vals, t_vals, data_2d, keys=keys,
+                              dir_path=dir_path)
+
+def attach_dataset_2d(handle):
+    """ Attach to a dataset published with publish_dataset_2d() and return a
+    tuple of (n_vals, t_vals, data_2d) as for dataset_to_2d(), where the
+    arrays in data_2d are read-only views of the shared data. """
+
+    arr = np.load(handle['path'], mmap_mode='r')
+
+    data_2d = {k: arr[i] for i, k in enumerate(handle['keys'])}
+
+    return (handle['n'], handle['t'], data_2d)
+
+def release_dataset_2d(handle):
+    """ Remove the file backing a dataset published with publish_dataset_2d().
+    Views already attached remain valid until they are garbage collected, but
+    no new views can be attached. """
+
+    _published_files.discard(handle['path'])
+
+    try:
+        os.remove(handle['path'])
+    except FileNotFoundError:
+        pass
+
+@contextmanager
+def shared_dataset_2d(n_vals, t_vals, data_2d, keys=None, dir_path=None):
+    """ Context manager that publishes a 2D dataset with publish_dataset_2d(),
+    yields the handle, and releases the data on exit. """
+
+    handle = publish_dataset_2d(n_vals, t_vals, data_2d, keys=keys,
+                                dir_path=dir_path)
+
+    try:
+        yield handle
+    finally:
+        release_dataset_2d(handle)
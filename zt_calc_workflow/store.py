@@ -0,0 +1,245 @@
+# zt_calc_workflow/store.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for collecting ZT datasets and ZT_max records from many
+calculations in an indexed local SQLite database.
+
+Datasets are registered by system, phase and carrier type, and the (n, T)
+data and ZT_max records are stored in wide tables with one column per
+property. Queries return dictionaries of NumPy arrays for cross-material
+comparisons.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import sqlite3
+
+import numpy as np
+
+from .amset import _READ_AMSET_KNOWN_HEADERS
+from .profiling import profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+_STORE_PROPERTY_KEYS = (
+    [k for k in _READ_AMSET_KNOWN_HEADERS if k not in ('n', 't')]
+    + ['{0}_{1}'.format(k, suffix)
+           for k in ('kappa_latt', 'kappa_tot', 'zt')
+               for suffix in ('xx', 'yy', 'zz', 'ave')])
+
+_STORE_METADATA_KEYS = ['system', 'phase', 'carrier_type']
+
+_STORE_WINDOW_KEYS = ['n_min', 'n_max', 't_min', 't_max']
+
+_STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    id INTEGER PRIMARY KEY,
+    system TEXT NOT NULL,
+    phase TEXT NOT NULL DEFAULT '',
+    carrier_type TEXT NOT NULL DEFAULT '',
+    UNIQUE (system, phase, carrier_type));
+
+CREATE TABLE IF NOT EXISTS zt_data (
+    dataset_id INTEGER NOT NULL REFERENCES datasets (id),
+    n REAL NOT NULL, t REAL NOT NULL, {props});
+
+CREATE INDEX IF NOT EXISTS zt_data_n_t ON zt_data (dataset_id, n, t);
+CREATE INDEX IF NOT EXISTS zt_data_t ON zt_data (t);
+
+CREATE TABLE IF NOT EXISTS zt_max (
+    dataset_id INTEGER NOT NULL REFERENCES datasets (id),
+    n_min REAL, n_max REAL, t_min REAL, t_max REAL,
+    n REAL NOT NULL, t REAL NOT NULL, {props});
+
+CREATE INDEX IF NOT EXISTS zt_max_dataset ON zt_max (dataset_id);
+CREATE INDEX IF NOT EXISTS zt_max_zt_ave ON zt_max (zt_ave);
+""".format(props=", ".join("{0} REAL".format(k)
+                               for k in _STORE_PROPERTY_KEYS))
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _check_property_keys(keys):
+    """ Check keys are valid property columns. """
+
+    for k in keys:
+        if k not in _STORE_PROPERTY_KEYS and k not in ('n', 't'):
+            raise Exception("Unknown property '{0}'.".format(k))
+
+def _get_dataset_id(conn, system, phase, carrier_type):
+    """ Get the id of a dataset, registering it if required. """
+
+    phase = '' if phase is None else phase
+    carrier_type = '' if carrier_type is None else carrier_type
+
+    conn.execute(
+        "INSERT OR IGNORE INTO datasets (system, phase, carrier_type) "
+        "VALUES (?, ?, ?)", (system, phase, carrier_type))
+
+    (dataset_id, ), = conn.execute(
+        "SELECT id FROM datasets WHERE system = ? AND phase = ? AND "
+        "carrier_type = ?", (system, phase, carrier_type)).fetchall()
+
+    return dataset_id
+
+def _build_where(system, phase, carrier_type, bounds):
+    """ Build a WHERE clause and parameters to filter on the dataset metadata
+    and inclusive (min, max) bounds on columns given in the bounds
+    dictionary. """
+
+    clauses, params = [], []
+
+    for k, v in zip(_STORE_METADATA_KEYS, (system, phase, carrier_type)):
+        if v is not None:
+            if isinstance(v, str):
+                clauses.append("d.{0} = ?".format(k))
+                params.append(v)
+            else:
+                clauses.append("d.{0} IN ({1})".format(
+                    k, ", ".join('?' for _ in v)))
+                params.extend(v)
+
+    for k, (v_min, v_max) in bounds.items():
+        if v_min is not None:
+            clauses.append("x.{0} >= ?".format(k))
+            params.append(float(v_min))
+
+        if v_max is not None:
+            clauses.append("x.{0} <= ?".format(k))
+            params.append(float(v_max))
+
+    where = "WHERE " + " AND ".join(clauses) if len(clauses) > 0 else ""
+
+    return where, params
+
+def _query_arrays(conn, table, keys, system, phase, carrier_type, bounds):
+    """ Run a query on table and return the metadata and keys as a dictionary
+    of NumPy arrays. """
+
+    _check_property_keys(keys)
+
+    where, params = _build_where(system, phase, carrier_type, bounds)
+
+    rows = conn.execute(
+        "SELECT {0}, {1} FROM {2} AS x JOIN datasets AS d "
+        "ON x.dataset_id = d.id {3} ORDER BY x.dataset_id, x.n, x.t".format(
+            ", ".join("d." + k for k in _STORE_METADATA_KEYS),
+            ", ".join("x." + k for k in keys), table, where),
+        params).fetchall()
+
+    num_meta = len(_STORE_METADATA_KEYS)
+
+    rows = np.array(rows, dtype=object).reshape(
+        len(rows), num_meta + len(keys))
+
+    res = {k: rows[:, i] for i, k in enumerate(_STORE_METADATA_KEYS)}
+
+    for i, k in enumerate(keys):
+        res[k] = rows[:, num_meta + i].astype(np.float64)
+
+    return res
+
+
+# ---------
+# Functions
+# ---------
+
+def open_results_store(file_path):
+    """ Open (and create if required) a results database and return an
+    sqlite3.Connection. """
+
+    conn = sqlite3.connect(file_path)
+    conn.executescript(_STORE_SCHEMA)
+
+    return conn
+
+@profile_stage
+def store_zt_dataset(conn, data, system, phase=None, carrier_type=None,
+                     replace=True):
+    """ Store a ZT dataset as a Pandas DataFrame under (system, phase,
+    carrier_type) using a bulk insert. If replace is True, existing data for
+    the dataset is removed first. Returns the dataset id. """
+
+    keys = [k for k in data.columns if k not in ('n', 't')]
+
+    _check_property_keys(keys)
+
+    cols = ['n', 't'] + keys
+
+    with conn:
+        dataset_id = _get_dataset_id(conn, system, phase, carrier_type)
+
+        if replace:
+            conn.execute("DELETE FROM zt_data WHERE dataset_id = ?",
+                         (dataset_id, ))
+
+        rows = data[cols].to_numpy(dtype=np.float64).tolist()
+
+        conn.executemany(
+            "INSERT INTO zt_data (dataset_id, {0}) VALUES ({1})".format(
+                ", ".join(cols), ", ".join('?' for _ in range(len(cols) + 1))),
+            ([dataset_id] + r for r in rows))
+
+    return dataset_id
+
+def store_zt_max(conn, rec, system, phase=None, carrier_type=None,
+                 n_min=None, n_max=None, t_min=None, t_max=None):
+    """ Store a ZT_max record, e.g. the Pandas Series returned by
+    get_zt_max(), under (system, phase, carrier_type) together with the
+    n/T window used to obtain it. """
+
+    keys = [k for k in rec.keys() if k not in ('n', 't')]
+
+    _check_property_keys(keys)
+
+    cols = _STORE_WINDOW_KEYS + ['n', 't'] + keys
+
+    vals = ([n_min, n_max, t_min, t_max]
+            + [float(rec[k]) for k in ['n', 't'] + keys])
+
+    with conn:
+        dataset_id = _get_dataset_id(conn, system, phase, carrier_type)
+
+        conn.execute(
+            "INSERT INTO zt_max (dataset_id, {0}) VALUES ({1})".format(
+                ", ".join(cols), ", ".join('?' for _ in range(len(cols) + 1))),
+            [dataset_id] + vals)
+
+@profile_stage
+def query_zt_data(conn, keys=('zt_ave', ), system=None, phase=None,
+                  carrier_type=None, n_min=None, n_max=None, t_min=None,
+                  t_max=None):
+    """ Query stored ZT datasets. system, phase and carrier_type may be a
+    value or a list of values to match, and the n and T bounds are
+    inclusive. Returns a dictionary of NumPy arrays with the 'system',
+    'phase', 'carrier_type', 'n', 't' and keys columns. """
+
+    return _query_arrays(
+        conn, 'zt_data', ['n', 't'] + list(keys), system, phase,
+        carrier_type, {'n': (n_min, n_max), 't': (t_min, t_max)})
+
+@profile_stage
+def query_zt_max(conn, keys=('zt_ave', ), system=None, phase=None,
+                 carrier_type=None, zt_min=None, n_min=None, n_max=None,
+                 t_min=None, t_max=None):
+    """ Query stored ZT_max records, e.g. all p-type ZT_max > 1 below 800 K
+    with carrier_type='p', zt_min=1. and t_max=800. The zt_min and n and T
+    bounds apply to the 'zt_ave', 'n' and 't' values of the records. Returns
+    a dictionary of NumPy arrays as for query_zt_data(). """
+
+    return _query_arrays(
+        conn, 'zt_max', ['n', 't'] + list(keys), system, phase,
+        carrier_type, {'n': (n_min, n_max), 't': (t_min, t_max),
+                       'zt_ave': (zt_min, None)})
@@ -0,0 +1,246 @@
+# zt_calc_workflow/streaming.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for processing AMSET CSV files too large to load into memory.
+
+The AMSET data are read in chunks aligned on carrier concentration or
+temperature with amset.iter_amset_csv_chunks(), and each chunk is combined
+with the \\kappa_latt data to form a chunk of the ZT dataset with
+dataset.zt_dataset_from_data(). Results are accumulated as running
+reductions over the chunks:
+
+    * ZT_max (as for analysis.get_zt_max()) for each of a set of (n, T)
+      windows;
+    * the optimum carrier concentration n_opt(T) and maximum ZT at each
+      temperature; and
+    * summary statistics (count, mean, standard deviation, minimum and
+      maximum) for each column.
+
+Peak memory use is therefore set by the chunk size rather than the size of
+the file.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import numpy as np
+import pandas as pd
+
+from .amset import iter_amset_csv_chunks
+from .dataset import zt_dataset_from_data
+from .profiling import profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+# Default number of rows to read at once.
+
+_STREAMING_CHUNK_SIZE = 100000
+
+_STREAMING_WINDOW_KEYS = ['n_min', 'n_max', 't_min', 't_max']
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _window_mask(data, window):
+    """ Return a mask of the rows of data within an (n, T) window. """
+
+    mask = np.ones(len(data), dtype=bool)
+
+    n = data['n'].to_numpy()
+    t = data['t'].to_numpy()
+
+    if window.get('n_min') is not None:
+        mask &= n >= window['n_min']
+
+    if window.get('n_max') is not None:
+        mask &= n <= window['n_max']
+
+    if window.get('t_min') is not None:
+        mask &= t >= window['t_min']
+
+    if window.get('t_max') is not None:
+        mask &= t <= window['t_max']
+
+    return mask
+
+def _update_stats(stats, data):
+    """ Update running summary statistics for the columns of data, combining
+    the count, mean and sum of squared deviations of each chunk with those
+    of the previous chunks (Chan et al.'s parallel algorithm). """
+
+    cols = [k for k in data.columns if k not in ('n', 't')]
+
+    vals = data[cols].to_numpy(dtype=np.float64)
+
+    count = np.count_nonzero(~np.isnan(vals), axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(vals, axis=0) / count
+        m2 = np.nansum((vals - mean) ** 2, axis=0)
+
+    v_min = np.nanmin(vals, axis=0, initial=np.inf, where=~np.isnan(vals))
+    v_max = np.nanmax(vals, axis=0, initial=-np.inf, where=~np.isnan(vals))
+
+    if 'columns' not in stats:
+        stats.update({'columns': cols, 'count': count, 'mean': mean,
+                      'm2': m2, 'min': v_min, 'max': v_max})
+        return
+
+    if cols != stats['columns']:
+        raise Exception("Chunks must have the same columns.")
+
+    total = stats['count'] + count
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = mean - stats['mean']
+
+        new_mean = np.where(
+            count > 0, stats['mean'] + delta * count / total, stats['mean'])
+
+        new_m2 = np.where(
+            count > 0, stats['m2'] + m2
+                + delta ** 2 * stats['count'] * count / total, stats['m2'])
+
+    stats['mean'] = np.where(stats['count'] > 0, new_mean, mean)
+    stats['m2'] = np.where(stats['count'] > 0, new_m2, m2)
+    stats['count'] = total
+    stats['min'] = np.minimum(stats['min'], v_min)
+    stats['max'] = np.maximum(stats['max'], v_max)
+
+
+# ---------
+# Functions
+# ---------
+
+def iter_zt_chunks(amset_file, kappa_latt_data, chunk_size=None,
+                   lorenz_model=None, **kwargs):
+    """ Read an AMSET CSV file in chunks (see amset.iter_amset_csv_chunks())
+    and yield chunks of the ZT dataset from zt_dataset_from_data() with the
+    \\kappa_latt data. chunk_size is the approximate number of rows in each
+    chunk (default: _STREAMING_CHUNK_SIZE). kwargs are passed to
+    iter_amset_csv_chunks(). """
+
+    if chunk_size is None:
+        chunk_size = _STREAMING_CHUNK_SIZE
+
+    for chunk in iter_amset_csv_chunks(amset_file, chunk_size, **kwargs):
+        yield zt_dataset_from_data(chunk, kappa_latt_data,
+                                   lorenz_model=lorenz_model)
+
+@profile_stage
+def stream_zt_summary(amset_file, kappa_latt_data, windows=None,
+                      key='zt_ave', chunk_size=None, lorenz_model=None,
+                      **kwargs):
+    """ Compute running reductions (see module docstring) over a ZT dataset
+    built from an AMSET CSV file and \\kappa_latt data in chunks, without
+    loading the whole dataset into memory.
+
+    windows is a list of dictionaries with optional bounds 'n_min', 'n_max',
+    't_min' and 't_max' (default: one window covering the whole dataset).
+    key is the property to maximise. chunk_size, lorenz_model and kwargs are
+    passed to iter_zt_chunks().
+
+    Returns a dictionary with:
+
+        * 'zt_max': a list with the row of the dataset with the maximum key
+          in each window (as returned by get_zt_max()), or None if the window
+          is empty;
+        * 'n_opt': a Pandas DataFrame with columns 't', 'n_opt' and the
+          maximum of key at each temperature;
+        * 'stats': a Pandas DataFrame of summary statistics indexed by column;
+          and
+        * 'num_rows': the number of rows in the dataset.
+    """
+
+    if windows is None:
+        windows = [{}]
+
+    for window in windows:
+        for k in window:
+            if k not in _STREAMING_WINDOW_KEYS:
+                raise Exception("Unknown window bound '{0}'.".format(k))
+
+    best = [None for _ in windows]
+
+    n_opt = {}
+
+    stats = {}
+
+    num_rows = 0
+
+    for chunk in iter_zt_chunks(amset_file, kappa_latt_data,
+                                chunk_size=chunk_size,
+                                lorenz_model=lorenz_model, **kwargs):
+        num_rows += len(chunk)
+
+        vals = chunk[key].to_numpy(dtype=np.float64)
+
+        # ZT_max in each window. Only strictly larger values replace the
+        # current maximum, so ties resolve to the first row, as for
+        # get_zt_max().
+
+        for i, window in enumerate(windows):
+            mask = _window_mask(chunk, window)
+
+            if not mask.any():
+                continue
+
+            masked = np.where(mask, vals, -np.inf)
+
+            j = int(np.argmax(masked))
+
+            if best[i] is None or masked[j] > best[i][key]:
+                best[i] = chunk.iloc[j].copy()
+
+        # n_opt(T). Depending on the order of the file, each chunk covers
+        # all or a subset of the temperatures, so the running maxima are
+        # merged on T.
+
+        t = chunk['t'].to_numpy()
+
+        t_vals, t_idx = np.unique(t, return_inverse=True)
+
+        order = np.lexsort((-vals, t_idx))
+
+        first = order[np.r_[0, np.nonzero(np.diff(t_idx[order]))[0] + 1]]
+
+        for t_val, n_val, val in zip(
+                t_vals.tolist(), chunk['n'].to_numpy()[first].tolist(),
+                vals[first].tolist()):
+            if t_val not in n_opt or val > n_opt[t_val][1]:
+                n_opt[t_val] = (n_val, val)
+
+        # Summary statistics.
+
+        _update_stats(stats, chunk)
+
+    if num_rows == 0:
+        raise Exception("No data in \"{0}\".".format(amset_file))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(stats['m2'] / stats['count'])
+
+    stats_data = pd.DataFrame(
+        {'count': stats['count'], 'mean': stats['mean'], 'std': std,
+         'min': stats['min'], 'max': stats['max']},
+        index=stats['columns'])
+
+    t_opt = sorted(n_opt.keys())
+
+    n_opt_data = pd.DataFrame(
+        {'t': t_opt, 'n_opt': [n_opt[t][0] for t in t_opt],
+         key: [n_opt[t][1] for t in t_opt]})
+
+    return {'zt_max': best, 'n_opt': n_opt_data, 'stats': stats_data,
+            'num_rows': num_rows}
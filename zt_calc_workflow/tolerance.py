@@ -0,0 +1,193 @@
+# zt_calc_workflow/tolerance.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for analysing the doping tolerance of ZT, i.e. the range of
+carrier concentrations over which ZT stays close to its maximum.
+
+For each temperature, component and tolerance fraction f, the doping window
+is the contiguous interval of n around the optimum carrier concentration
+n_opt(T) over which ZT >= f ZT_max(T). The edges of the windows are found by
+linear interpolation of the threshold crossings on the log n axis, and
+windows that extend to the edge of the n grid are flagged as open.
+
+The windows are computed from the 2D (n, T) arrays returned by
+dataset.dataset_to_2d() for all temperatures, components and fractions at
+once, and window widths are given in decades of n.
+"""
+
+
+# -------
+# Imports
+# -------
+
+import numpy as np
+import pandas as pd
+
+from .profiling import count_result_rows, profile_stage
+
+
+# ---------
+# Constants
+# ---------
+
+_TOLERANCE_DEFAULT_KEYS = ['zt_xx', 'zt_yy', 'zt_zz', 'zt_ave']
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _threshold_crossings(x, data_2d, thresholds, i_edge, i_inside):
+    """ Return the x values at which data_2d crosses thresholds between the
+    (num_fractions, num_t) grid indices i_edge (the last point outside the
+    window) and i_inside (the adjacent point inside it). """
+
+    j = np.arange(data_2d.shape[1])[np.newaxis, :]
+
+    v_a, v_b = data_2d[i_edge, j], data_2d[i_inside, j]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f = np.clip((thresholds - v_a) / (v_b - v_a), 0., 1.)
+
+    return x[i_edge] + f * (x[i_inside] - x[i_edge])
+
+
+# ---------
+# Functions
+# ---------
+
+@profile_stage(count_rows=count_result_rows)
+def doping_windows(n, t, data_2d, fractions, keys=None):
+    """ Calculate doping windows (see module docstring) for each of a set of
+    tolerance fractions (e.g. [0.8, 0.9, 0.95]) and each of the keys in
+    data_2d (default: the ZT components present).
+
+    Returns a Pandas DataFrame with one row per key, fraction and
+    temperature and columns 'key', 'fraction', 't', 'zt_max', 'n_opt',
+    'n_lo', 'n_hi', 'width' (log10(n_hi / n_lo)), 'open_lo' and 'open_hi'.
+    """
+
+    if keys is None:
+        keys = [k for k in _TOLERANCE_DEFAULT_KEYS if k in data_2d]
+
+    x = np.log10(np.asarray(n, dtype=np.float64))
+    t = np.asarray(t, dtype=np.float64)
+
+    fractions = np.asarray(fractions, dtype=np.float64)
+
+    num_n, num_t, num_f = len(x), len(t), len(fractions)
+
+    idx = np.arange(num_n)[np.newaxis, :, np.newaxis]
+
+    def _col(a):
+        return np.broadcast_to(a, (num_f, num_t)).ravel()
+
+    blocks = []
+
+    for k in keys:
+        vals = np.asarray(data_2d[k], dtype=np.float64)
+
+        i_max = np.argmax(np.where(np.isnan(vals), -np.inf, vals), axis=0)
+        zt_max = vals[i_max, np.arange(num_t)]
+
+        # (num_fractions, num_t) thresholds and (num_fractions, num_n, num_t)
+        # mask of points below them.
+
+        thresholds = fractions[:, np.newaxis] * zt_max[np.newaxis, :]
+
+        below = ~(vals[np.newaxis, :, :] >= thresholds[:, np.newaxis, :])
+
+        # The window edges are the nearest points below the threshold on
+        # either side of the maximum, or the edges of the grid.
+
+        i_lo = np.where(
+            np.logical_and(below, idx < i_max), idx, -1).max(axis=1)
+
+        i_hi = np.where(
+            np.logical_and(below, idx > i_max), idx, num_n).min(axis=1)
+
+        open_lo, open_hi = i_lo < 0, i_hi >= num_n
+
+        x_lo = np.where(
+            open_lo, x[0], _threshold_crossings(
+                x, vals, thresholds, np.maximum(i_lo, 0),
+                np.minimum(i_lo + 1, num_n - 1)))
+
+        x_hi = np.where(
+            open_hi, x[-1], _threshold_crossings(
+                x, vals, thresholds, np.minimum(i_hi, num_n - 1),
+                np.maximum(i_hi - 1, 0)))
+
+        blocks.append(pd.DataFrame({
+            'key': k, 'fraction': _col(fractions[:, np.newaxis]),
+            't': _col(t[np.newaxis, :]), 'zt_max': _col(zt_max),
+            'n_opt': _col(np.power(10., x[i_max])),
+            'n_lo': np.power(10., x_lo).ravel(),
+            'n_hi': np.power(10., x_hi).ravel(),
+            'width': (x_hi - x_lo).ravel(),
+            'open_lo': open_lo.ravel(), 'open_hi': open_hi.ravel()}))
+
+    return pd.concat(blocks, ignore_index=True)
+
+@profile_stage(count_rows=count_result_rows)
+def rank_doping_tolerance(datasets, fraction=0.9, key='zt_ave', t_min=None,
+                          t_max=None, sort_by='width_at_zt_max'):
+    """ Rank a batch of materials by the doping tolerance of ZT.
+
+    datasets is a dictionary of {name: (n, t, data_2d)} as returned by
+    dataset_to_2d(). For each material, the doping windows for key at the
+    specified fraction are calculated for temperatures between t_min and
+    t_max, and summarised as:
+
+        * 'zt_max', 't_zt_max', 'n_opt': the maximum ZT and where it occurs;
+        * 'width_at_zt_max': the window width (decades) at t_zt_max;
+        * 'mean_width', 'max_width': the mean and maximum width over T; and
+        * 'open_at_zt_max': whether the window at t_zt_max extends to the
+          edge of the n grid (i.e. the width is a lower bound).
+
+    Returns a Pandas DataFrame with one row per material, sorted in
+    descending order of sort_by, with a 'rank' column.
+    """
+
+    rows = []
+
+    for name, (n, t, data_2d) in datasets.items():
+        t = np.asarray(t, dtype=np.float64)
+
+        t_mask = np.ones(len(t), dtype=bool)
+
+        if t_min is not None:
+            t_mask &= t >= t_min
+
+        if t_max is not None:
+            t_mask &= t <= t_max
+
+        if not t_mask.any():
+            raise Exception("No temperatures in range for '{0}'.".format(name))
+
+        windows = doping_windows(
+            n, t[t_mask], {key: np.asarray(data_2d[key])[:, t_mask]},
+            [fraction], keys=[key])
+
+        i = windows['zt_max'].idxmax()
+
+        rows.append({
+            'name': name, 'zt_max': windows.loc[i, 'zt_max'],
+            't_zt_max': windows.loc[i, 't'],
+            'n_opt': windows.loc[i, 'n_opt'],
+            'width_at_zt_max': windows.loc[i, 'width'],
+            'mean_width': windows['width'].mean(),
+            'max_width': windows['width'].max(),
+            'open_at_zt_max': bool(
+                windows.loc[i, 'open_lo'] or windows.loc[i, 'open_hi'])})
+
+    res = pd.DataFrame(rows).sort_values(
+        by=sort_by, ascending=False, ignore_index=True)
+
+    res.insert(0, 'rank', np.arange(1, len(res) + 1))
+
+    return res
@@ -0,0 +1,145 @@
+# zt_calc_workflow/trajectory.py
+
+
+# ---------
+# Docstring
+# ---------
+
+""" Routines for evaluating properties along carrier concentration
+trajectories n(T), to model samples where the carrier concentration varies
+with temperature.
+
+Trajectories can be specified as:
+
+    * an array of n with one value for each evaluation temperature;
+    * a callable returning n for an array of temperatures; or
+    * a tuple of (t, n) arrays with a tabulated n(T), which is interpolated
+      linearly in log(n) (and held constant outside the tabulated range).
+
+All trajectories are evaluated together with one batched interpolation on the
+2D (n, T) data from dataset.dataset_to_2d().
+"""
+
+
+# -------
+# Imports
+# -------
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .interpolation import get_interpolator
+from .profiling import profile_stage
+
+
+# ------------------
+# Internal functions
+# ------------------
+
+def _trajectory_n(trajectory, t):
+    """ Return the carrier concentrations along a trajectory at the
+    temperatures t. """
+
+    if callable(trajectory):
+        n = trajectory(t)
+    elif isinstance(trajectory, tuple):
+        t_tab, n_tab = (np.asarray(a, dtype=np.float64) for a in trajectory)
+
+        idx = np.argsort(t_tab)
+
+        n = np.power(10., np.interp(t, t_tab[idx], np.log10(n_tab[idx])))
+    else:
+        n = trajectory
+
+    n = np.broadcast_to(np.asarray(n, dtype=np.float64), t.shape)
+
+    if (n <= 0.).any():
+        raise Exception("Carrier concentrations along trajectories must be "
+                        "positive.")
+
+    return n
+
+
+# ---------
+# Functions
+# ---------
+
+@profile_stage
+def evaluate_trajectories(n, t, data_2d, trajectories, t_eval=None,
+                          keys=None, cache_key=None):
+    """ Evaluate properties along a list of n(T) trajectories (see module
+    docstring). n, t and data_2d are as returned by dataset_to_2d(). t_eval
+    are the temperatures, in ascending order, to evaluate the trajectories at
+    (default: t), and keys optionally specifies the properties to evaluate
+    (default: all). If cache_key is set to a key identifying the data, the
+    interpolant is cached (see interpolation.py), so that repeated
+    evaluations on the same data reuse it.
+
+    Returns a tuple of (t_eval, n_traj, traj_data), where n_traj is a
+    (num_trajectories, num_t) array of carrier concentrations and traj_data
+    is a dictionary of {key: values} with values of the same shape.
+    """
+
+    if t_eval is None:
+        t_eval = t
+
+    t_eval = np.asarray(t_eval, dtype=np.float64)
+
+    if keys is None:
+        keys = list(data_2d.keys())
+
+    n_traj = np.array([_trajectory_n(traj, t_eval) for traj in trajectories])
+
+    if (n_traj.min() < n.min() or n_traj.max() > n.max()
+            or t_eval.min() < t.min() or t_eval.max() > t.max()):
+        warnings.warn("One or more trajectories extends outside the range "
+                      "of the calculated data - values will be "
+                      "extrapolated.", RuntimeWarning)
+
+    # Interpolating a stack of the properties evaluates all of them in one
+    # call.
+
+    interpolator = get_interpolator(
+        n, t, np.stack([data_2d[k] for k in keys], axis=-1),
+        cache_key=(None if cache_key is None
+                       else (cache_key, tuple(keys))))
+
+    t_traj = np.broadcast_to(t_eval, n_traj.shape)
+
+    vals = interpolator((np.log10(n_traj), t_traj))
+
+    return (t_eval, n_traj, {k: vals[..., i] for i, k in enumerate(keys)})
+
+def trajectory_zt_summary(n, t, data_2d, trajectories, t_eval=None,
+                          key='zt_ave', labels=None, cache_key=None):
+    """ Evaluate key (default: 'zt_ave') along a list of n(T) trajectories
+    and return a Pandas DataFrame with the average ZT over the temperature
+    range of t_eval ('zt_avg', from the trapezium rule), and the peak ZT
+    ('zt_peak') with the corresponding n and T ('n_peak', 't_peak'), for each
+    trajectory. Other arguments are as for evaluate_trajectories(). """
+
+    t_eval, n_traj, traj_data = evaluate_trajectories(
+        n, t, data_2d, trajectories, t_eval=t_eval, keys=[key],
+        cache_key=cache_key)
+
+    zt = traj_data[key]
+
+    if len(t_eval) > 1:
+        zt_int = (0.5 * (zt[:, 1:] + zt[:, :-1]) * np.diff(t_eval)).sum(axis=1)
+        zt_avg = zt_int / (t_eval[-1] - t_eval[0])
+    else:
+        zt_avg = zt[:, 0]
+
+    idx = np.argmax(zt, axis=1)
+    rows = np.arange(len(zt))
+
+    summary = pd.DataFrame(
+        {'zt_avg': zt_avg, 'zt_peak': zt[rows, idx],
+         'n_peak': n_traj[rows, idx], 't_peak': t_eval[idx]})
+
+    if labels is not None:
+        summary.insert(0, 'label', labels)
+
+    return summary